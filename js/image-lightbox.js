@@ -6,6 +6,8 @@
  * - Header shows NOTE TITLE (line 1) and current image's H2 (line 2)
  * - Appends sidebar map <iframe> as final gallery item; map alt = text from #side-map-place .place
  * - Portrait/square media clamped to viewport (no overlap with filmstrip)
+ * - Filmstrip uses build-time thumbnails from content/_thumbs/thumbs.json when present
+ *   (publish.build.py `thumbnails.enabled`); originals load only in the main view
  */
 (() => {
   if (window.__obsZoomBound_FinalFix) return;
@@ -210,6 +212,50 @@ body.zoom-open{ overflow: hidden; }
     return { src: iframe.src, label };
   }
 
+  /* ==================== Build-time thumbnails ==================== */
+  // Must match publish.build.py md_root_dir + thumbnails.dir
+  const MD_ROOT_DIR = 'content';
+  const THUMB_MAP_PATH = `${MD_ROOT_DIR}/_thumbs/thumbs.json`;
+  let thumbMap = null;   // {"content/<media path>": "content/_thumbs/<hash>.jpg"}
+  let thumbBase = '';    // site asset base (URL prefix before /content/)
+  let thumbMapPromise = null;
+
+  function siteBaseFor(src) {
+    try {
+      const href = new URL(src, location.href).href;
+      const i = href.indexOf(`/${MD_ROOT_DIR}/`);
+      return i >= 0 ? href.slice(0, i + 1) : '';
+    } catch { return ''; }
+  }
+
+  function loadThumbMap(anySrc) {
+    if (thumbMapPromise) return thumbMapPromise;
+    thumbBase = siteBaseFor(anySrc);
+    if (!thumbBase) {
+      thumbMap = {};
+      return (thumbMapPromise = Promise.resolve(thumbMap));
+    }
+    thumbMapPromise = fetch(thumbBase + THUMB_MAP_PATH, { credentials: 'same-origin' })
+      .then(r => (r.ok ? r.json() : null))
+      .then(j => (thumbMap = (j && j.thumbs) || {}))
+      .catch(() => (thumbMap = {}));
+    return thumbMapPromise;
+  }
+
+  function thumbSrcFor(src) {
+    if (!thumbMap || !thumbBase || !src.startsWith(thumbBase)) return src;
+    let key = src.slice(thumbBase.length).split(/[?#]/)[0];
+    try { key = decodeURI(key); } catch {}
+    const t = thumbMap[key];
+    return t ? thumbBase + encodeURI(t) : src;
+  }
+
+  // Never point the strip at the original before the map is known
+  function setThumbSrc(node, src) {
+    if (thumbMap) { node.src = thumbSrcFor(src); return; }
+    loadThumbMap(src).then(() => { node.src = thumbSrcFor(src); });
+  }
+
   let mediaItems = []; // [{type:'img'|'video'|'map', src, alt, caption, section}]
   let currentIndex = -1;
 
@@ -394,11 +440,12 @@ body.zoom-open{ overflow: hidden; }
       } else {
         thumbNode = document.createElement(item.type === 'video' ? 'video' : 'img');
         thumbNode.className = 'zoom-thumb__media';
-        thumbNode.src = item.src;
         if (item.type === 'video') {
+          thumbNode.src = item.src;
           thumbNode.muted = true; thumbNode.playsInline = true; thumbNode.loop = true; thumbNode.autoplay = true;
         } else {
           thumbNode.alt = item.alt || ''; thumbNode.loading = 'lazy'; thumbNode.decoding = 'async';
+          setThumbSrc(thumbNode, item.src);
         }
       }
       thumbNode.setAttribute('draggable', 'false');
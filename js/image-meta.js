@@ -0,0 +1,90 @@
+/**
+ * Obsidian Publish — build-time image metadata (publish.build.py `image_meta.enabled`)
+ * - Fetches content/_media/meta.json once: {"content/<media path>": {w, h, orientation?, taken?, gps?}}
+ * - Gives embedded images their intrinsic width/height before they load (no layout shift)
+ * - Adds data-taken="2023-05-01T10:11:12+02:00" and data-gps="lat,lng" for other scripts
+ * - API: window.publishImageMeta(src) -> Promise<meta | null>
+ */
+(() => {
+  if (window.publishImageMeta) return;
+
+  // Must match publish.build.py md_root_dir + image_meta.file
+  const MD_ROOT_DIR = 'content';
+  const META_PATH = `${MD_ROOT_DIR}/_media/meta.json`;
+  const STYLE_ID = 'publish-image-meta-style';
+
+  let metaPromise = null;
+  let base = '';
+
+  function siteBaseFor(src) {
+    try {
+      const href = new URL(src, location.href).href;
+      const i = href.indexOf(`/${MD_ROOT_DIR}/`);
+      return i >= 0 ? href.slice(0, i + 1) : '';
+    } catch { return ''; }
+  }
+
+  function loadMeta(anySrc) {
+    if (metaPromise) return metaPromise;
+    base = siteBaseFor(anySrc);
+    if (!base) return Promise.resolve({});   // retry with the next image that lives under /content/
+    metaPromise = fetch(base + META_PATH, { credentials: 'same-origin' })
+      .then(r => (r.ok ? r.json() : null))
+      .then(j => (j && j.images) || {})
+      .catch(() => ({}));
+    return metaPromise;
+  }
+
+  function keyFor(src) {
+    const href = new URL(src, location.href).href;
+    if (!base || !href.startsWith(base)) return null;
+    let key = href.slice(base.length).split(/[?#]/)[0];
+    try { key = decodeURI(key); } catch {}
+    return key;
+  }
+
+  async function publishImageMeta(src) {
+    const images = await loadMeta(src);
+    const key = keyFor(src);
+    return (key && images[key]) || null;
+  }
+  window.publishImageMeta = publishImageMeta;
+
+  const ensureStyle = () => {
+    if (document.getElementById(STYLE_ID)) return;
+    const el = document.createElement('style');
+    el.id = STYLE_ID;
+    // keep responsive sizing; width/height attributes only supply the aspect ratio
+    el.textContent = 'img[data-img-meta] { height: auto; max-width: 100%; }';
+    document.head.appendChild(el);
+  };
+
+  function apply(img) {
+    const src = img.getAttribute('src');
+    if (!src || img.dataset.imgMeta) return;
+    img.dataset.imgMeta = 'pending';
+    publishImageMeta(src).then(meta => {
+      if (!meta) { delete img.dataset.imgMeta; return; }
+      if (!img.hasAttribute('width') && !img.hasAttribute('height')) {
+        img.setAttribute('width', meta.w);
+        img.setAttribute('height', meta.h);
+      } else {
+        img.style.aspectRatio = `${meta.w} / ${meta.h}`;
+      }
+      if (meta.taken) img.dataset.taken = meta.taken;
+      if (meta.gps) img.dataset.gps = meta.gps.join(',');
+      img.dataset.imgMeta = '1';
+    });
+  }
+
+  const scan = () => document.querySelectorAll('img[src]').forEach(apply);
+
+  const boot = () => {
+    ensureStyle();
+    scan();
+    new MutationObserver(scan).observe(document.body, { childList: true, subtree: true });
+  };
+
+  if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', boot, { once: true });
+  else boot();
+})();
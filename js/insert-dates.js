@@ -5,10 +5,13 @@
  * - Uses Obsidian standard CSS variables for fonts, colors, and sizes.
  * - `date` supports scalar, CSV, YAML [list], or YAML multiline list.
  * - `date_modified` is shown in a muted tone.
+ * - Pages built with publish.build.py `static_blocks.dates` already contain the banner
+ *   (data-publish-static); those are only styled, never re-rendered.
  */
 (() => {
   const STYLE_ID = 'note-date-banner-style';
   const BLOCK_ID = 'note-date-banner';
+  const STATIC_SEL = `#${BLOCK_ID}[data-publish-static]`;
 
   // ---------- DOM helpers ----------
   const getContentContainer = () =>
@@ -213,6 +216,7 @@
 
   // ---------- boot ----------
   const haveFM = () =>
+    !!document.querySelector(STATIC_SEL) ||
     document.querySelectorAll('.frontmatter, .frontmatter-container, .metadata-container, code.language-yaml').length > 0;
 
   const waitFM = (cb) => {
@@ -226,6 +230,7 @@
 
   const install = () => {
     ensureStyle();
+    if (document.querySelector(STATIC_SEL)) return; // pre-rendered at build time
     const existing = document.getElementById(BLOCK_ID);
     if (existing) existing.remove();
 
@@ -10,6 +10,9 @@
  *   3) map_view_link : "[](geo:<a>,<b>)"
  *   4) map_link  : Apple/Google/OSM URL with coordinates
  *   address : comma-separated string; we render "first, last-non-zip"
+ *
+ * Pages built with publish.build.py `static_blocks.maps` carry the map in the note itself
+ * (data-publish-static); on those pages this script only adds styles.
  */
 (() => {
   const STYLE_ID  = 'side-map-style';
@@ -17,6 +20,7 @@
   const WRAP_ID   = 'side-map-wrap';
   const IFRAME_ID = 'side-map-iframe';
   const META_ID   = 'side-map-meta';
+  const STATIC_SEL = `#${BLOCK_ID}[data-publish-static]`;
 
   const MAP_ZOOM   = Number.isFinite(window.MAP_ZOOM) ? window.MAP_ZOOM : 12;
   const MAP_HEIGHT = Number.isFinite(window.SIDE_MAP_HEIGHT) ? window.SIDE_MAP_HEIGHT : 400;
@@ -113,7 +117,6 @@
   const toLatLon = (a, b) => {
     let lat = a, lon = b;
     const inLat = (x) => x != null && Math.abs(x) <= 90;
-    theLon:
     const inLon = (x) => x != null && Math.abs(x) <= 180;
     if (!inLat(lat) || !inLon(lon)) if (inLat(b) && inLon(a)) { lat=b; lon=a; }
     return (inLat(lat) && inLon(lon)) ? { lat, lon } : null;
@@ -256,7 +259,7 @@
   };
 
   const unmountSideMap = () => {
-    const block = document.getElementById(BLOCK_ID);
+    const block = document.querySelector(`#${BLOCK_ID}:not([data-publish-static])`);
     if (block && block.parentNode) block.parentNode.removeChild(block);
   };
 
@@ -269,6 +272,12 @@
     if (installing) return; installing = true;
     ensureStyle();
 
+    if (document.querySelector(STATIC_SEL)) {
+      // pre-rendered at build time: drop a side map left over from the previous page
+      LAST = { lat: null, lon: null, text: null };
+      unmountSideMap(); installing = false; return;
+    }
+
     // coords priority: lat/lng → location → map_view_link → map_link
     const coords = readCoordsFromFM();
     const show = !!coords && shouldShowMap();
@@ -293,7 +302,7 @@
 
   const debounced = (fn, ms=120) => { let t; return () => { clearTimeout(t); t = setTimeout(fn, ms); }; };
 
-  const haveFM = () => qFM(document).length > 0;
+  const haveFM = () => !!document.querySelector(STATIC_SEL) || qFM(document).length > 0;
   const waitFM = (cb) => {
     if (haveFM()) { cb(); return; }
     const mo = new MutationObserver(() => { if (haveFM()) { mo.disconnect(); cb(); }});
@@ -1,6 +1,8 @@
 /**
  * Prev | Next from the visible File Tree (Publish / Digital Garden)
  * v2 — fixes SPA navigation: reacts to in-page link clicks & history changes
+ * v3 — prefetches the previous/next story and its hero image at low priority from the build-time
+ *      map (publish.build.py `prefetch.enabled` -> content/_nav/prefetch.json)
  */
 
 (() => {
@@ -10,6 +12,8 @@
   const STYLE_ID = 'note-nav-style';
   const SHOW_HR_TOP = !!window.NAV_HR_TOP;
   const SHOW_HR_BOTTOM = !!window.NAV_HR_BOTTOM;
+  const MD_ROOT_DIR = 'content';
+  const PREFETCH_PATH = `${MD_ROOT_DIR}/_nav/prefetch.json`;
 
   const ORIGIN = (window.siteInfo && window.siteInfo.customurl)
     ? ('https://' + window.siteInfo.customurl.replace(/^https?:\/\//,'').replace(/\/$/,''))
@@ -170,8 +174,55 @@
     }
   };
 
+  // ---------- prefetch (build-time reading order + hero images) ----------
+  let prefetchMap = null;
+  const prefetched = new Set();
+  const loadPrefetchMap = () => {
+    if (!prefetchMap) {
+      prefetchMap = fetch(new URL('/' + PREFETCH_PATH, ORIGIN).href, { credentials: 'same-origin' })
+        .then(r => (r.ok ? r.json() : null))
+        .then(j => (j && j.notes) || null)
+        .catch(() => null);
+    }
+    return prefetchMap;
+  };
+  // Media base = URL prefix before /content/ of any image already on the page (may be a CDN)
+  const mediaBase = () => {
+    for (const img of document.querySelectorAll('img[src]')) {
+      const i = img.src.indexOf(`/${MD_ROOT_DIR}/`);
+      if (i >= 0) return img.src.slice(0, i + 1);
+    }
+    return new URL('/', ORIGIN).href;
+  };
+  const addPrefetch = (href, as) => {
+    if (!href || prefetched.has(href)) return;
+    prefetched.add(href);
+    const link = document.createElement('link');
+    link.rel = 'prefetch';
+    link.href = href;
+    if (as) link.as = as;
+    link.setAttribute('fetchpriority', 'low');
+    document.head.appendChild(link);
+  };
+  const whenIdle = (fn) => (window.requestIdleCallback ? requestIdleCallback(fn, { timeout: 3000 }) : setTimeout(fn, 1500));
+  const prefetchNeighbours = async () => {
+    if (window.NAV_NO_PREFETCH || (navigator.connection && navigator.connection.saveData)) return;
+    const notes = await loadPrefetchMap();
+    const entry = notes && notes[curSlug()];
+    if (!entry) return;
+    whenIdle(() => {
+      for (const slug of [entry.next, entry.prev]) {
+        if (!slug) continue;
+        addPrefetch(new URL('/' + encodePublish(slug), ORIGIN).href, 'document');
+        const hero = notes[slug] && notes[slug].hero;
+        if (hero) addPrefetch(mediaBase() + encodeURI(hero), 'image');
+      }
+    });
+  };
+
   // ---------- SPA route hooks ----------
   const routeTick = () => {
+    prefetchNeighbours();
     // stagger a few updates to catch late DOM swaps
     update();
     setTimeout(update, 75);
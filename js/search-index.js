@@ -0,0 +1,136 @@
+/**
+ * Obsidian Publish — client for the build-time full-text index (publish.build.py `search.enabled`)
+ * - Fetches content/_search/index.json once (lazily, on first query) and answers queries locally
+ * - Index: docs = [[slug, title, length]], postings = {term: [id, tf, idDelta, tf, ...]}
+ * - Ranking: BM25 over all query terms; the last term also matches as a prefix (type-ahead)
+ * - API:  window.publishSearch('rome day', { limit: 10 }) -> Promise<[{ title, url, score }]>
+ * - UI:   any <input data-publish-search> gets a results list underneath
+ */
+(() => {
+  if (window.publishSearch) return;
+
+  const MD_ROOT_DIR = 'content';
+  const INDEX_PATH = `${MD_ROOT_DIR}/_search/index.json`;
+  const K1 = 1.2, B = 0.75;
+
+  let indexPromise = null;
+
+  // Site base = URL prefix before /content/ (taken from any asset already on the page)
+  function siteBase() {
+    if (window.PUBLISH_SEARCH_BASE) return window.PUBLISH_SEARCH_BASE;
+    for (const el of document.querySelectorAll('img[src], a[href], link[href]')) {
+      const url = el.getAttribute('src') || el.getAttribute('href');
+      try {
+        const href = new URL(url, location.href).href;
+        const i = href.indexOf(`/${MD_ROOT_DIR}/`);
+        if (i >= 0) return href.slice(0, i + 1);
+      } catch {}
+    }
+    return location.origin + '/';
+  }
+
+  function decode(raw) {
+    const postings = new Map();
+    for (const [term, arr] of Object.entries(raw.postings)) postings.set(term, arr);
+    const terms = [...postings.keys()].sort();
+    const avgLen = raw.docs.reduce((n, d) => n + d[2], 0) / Math.max(raw.docs.length, 1);
+    return { docs: raw.docs, postings, terms, avgLen };
+  }
+
+  function loadIndex() {
+    if (indexPromise) return indexPromise;
+    const base = siteBase();
+    indexPromise = fetch(base + INDEX_PATH, { credentials: 'same-origin' })
+      .then(r => (r.ok ? r.json() : null))
+      .then(j => (j ? { ...decode(j), base } : null))
+      .catch(() => null);
+    return indexPromise;
+  }
+
+  const tokenize = (q) => (q.normalize('NFC').toLowerCase().match(/[\p{L}\p{M}\p{N}_]+/gu) || []);
+
+  // Terms starting with prefix (binary search on the sorted term list)
+  function prefixTerms(idx, prefix, max = 50) {
+    let lo = 0, hi = idx.terms.length;
+    while (lo < hi) {
+      const mid = (lo + hi) >> 1;
+      if (idx.terms[mid] < prefix) lo = mid + 1; else hi = mid;
+    }
+    const out = [];
+    for (let i = lo; i < idx.terms.length && out.length < max && idx.terms[i].startsWith(prefix); i++) {
+      out.push(idx.terms[i]);
+    }
+    return out;
+  }
+
+  function addScores(idx, term, scores) {
+    const arr = idx.postings.get(term);
+    if (!arr) return;
+    const n = idx.docs.length, df = arr.length / 2;
+    const idf = Math.log(1 + (n - df + 0.5) / (df + 0.5));
+    for (let i = 0, id = 0; i < arr.length; i += 2) {
+      id += arr[i];
+      const tf = arr[i + 1], len = idx.docs[id][2];
+      const s = idf * (tf * (K1 + 1)) / (tf + K1 * (1 - B + B * len / idx.avgLen));
+      scores.set(id, (scores.get(id) || 0) + s);
+    }
+  }
+
+  function urlFor(idx, slug) {
+    return idx.base + encodeURI(slug.replace(/ /g, '+'));
+  }
+
+  async function publishSearch(query, { limit = 10 } = {}) {
+    const idx = await loadIndex();
+    const words = tokenize(query || '');
+    if (!idx || !words.length) return [];
+
+    // every word must match (AND); the last word may be a prefix
+    let hits = null;
+    const scores = new Map();
+    words.forEach((w, i) => {
+      const terms = i === words.length - 1 ? prefixTerms(idx, w) : (idx.postings.has(w) ? [w] : []);
+      const wordScores = new Map();
+      terms.forEach(t => addScores(idx, t, wordScores));
+      hits = hits ? new Set([...hits].filter(id => wordScores.has(id))) : new Set(wordScores.keys());
+      wordScores.forEach((s, id) => scores.set(id, (scores.get(id) || 0) + s));
+    });
+
+    return [...hits]
+      .map(id => ({ title: idx.docs[id][1], url: urlFor(idx, idx.docs[id][0]), score: scores.get(id) }))
+      .sort((a, b) => b.score - a.score || a.title.localeCompare(b.title))
+      .slice(0, limit);
+  }
+
+  window.publishSearch = publishSearch;
+
+  /* ==================== Optional search box ==================== */
+  function bindInput(input) {
+    if (input.__publishSearchBound) return;
+    input.__publishSearchBound = true;
+    const list = document.createElement('ul');
+    list.className = 'publish-search-results';
+    input.insertAdjacentElement('afterend', list);
+
+    let seq = 0;
+    input.addEventListener('input', async () => {
+      const mine = ++seq;
+      const results = await publishSearch(input.value, { limit: 12 });
+      if (mine !== seq) return; // a newer keystroke won
+      list.replaceChildren(...results.map(r => {
+        const li = document.createElement('li');
+        const a = document.createElement('a');
+        a.href = r.url;
+        a.textContent = r.title;
+        li.appendChild(a);
+        return li;
+      }));
+    });
+    input.addEventListener('focus', () => loadIndex(), { once: true });
+  }
+
+  const bindAll = () => document.querySelectorAll('input[data-publish-search]').forEach(bindInput);
+  if (document.readyState === 'loading') document.addEventListener('DOMContentLoaded', bindAll);
+  else bindAll();
+  new MutationObserver(bindAll).observe(document.documentElement, { childList: true, subtree: true });
+})();
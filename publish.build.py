@@ -1,25 +1,41 @@
 #!/usr/bin/env python3
 # build_publish.py — config-first Obsidian -> Publish builder
-# - Config keys: vault, publish, always_root, include_hidden, dry_run, debug, list_selected
-#                 media_exts, apply_filters_to_filenames, apply_filters_to_dirs,
-#                 md_folderpath_rewrite (Markdown folders only),
-#                 global_contents_filter (Markdown body content),
-#                 css_hoist_imports_top (imports hoisted to top; @charset always stripped)
+# - Config: publish.build.yaml|yml|json in the working directory (or --config); every key is documented in CFG_DEFAULTS.
+# - Runs as plan -> apply: the plan (JSON via --plan-out) holds every mapping, write, copy and delete;
+#   --dry-run prints the plan summary only; --apply-plan re-applies a saved plan without re-scanning.
+# - Python API: `from publish_build import Builder` (publish_build.py loads this file).
 # - Resolves links case-insensitively. Media **embeds only** are rewritten to FULL paths under md_root_dir.
 # - Expands media paths even when the reference is a bare filename by recording ref->file mapping at resolve time.
 # - Applies global_contents_filter to content; optionally to filenames/dirs via apply_filters_to_*.
 # - Note links rewritten to new note paths under md_root_dir/<rewritten-folders>/<renamed-file>.md
 
-import argparse, os, re, shutil, unicodedata, time, json
-from collections import defaultdict
+import argparse, html, math, os, re, shutil, unicodedata, time, json, hashlib, threading, signal, subprocess
+import io, mmap, queue, struct, tarfile, tempfile, urllib.parse, zipfile
+from bisect import bisect_right
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from functools import partial
+from datetime import date, datetime
+from fnmatch import fnmatchcase
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path, PurePosixPath
 from tqdm import tqdm
 
+try:
+    import re._parser as _sre_parse      # Python 3.11+
+except ImportError:
+    import sre_parse as _sre_parse
+
 try:
     import yaml  # optional
 except Exception:
     yaml = None
 
+try:
+    from PIL import Image, ImageOps  # optional (thumbnails)
+except Exception:
+    Image = ImageOps = None
+
 # ================= Safety guard: never modify outside publish root =================
 def assert_in_publish_root(publish_root: Path, target: Path):
     target = Path(target).resolve()
@@ -29,12 +45,627 @@ def assert_in_publish_root(publish_root: Path, target: Path):
     except Exception:
         raise RuntimeError(f"Refusing to modify outside publish_root: {target} (publish_root={pub})")
 
+_HASH_CHUNK = 1 << 20
+
+# ================= Archive output: stream the build into one tar/zip =================
+_ARCHIVE_KINDS = {
+    ".zip": ("zip", None),
+    ".tar": ("tar", "w"),
+    ".tar.gz": ("tar", "w:gz"), ".tgz": ("tar", "w:gz"),
+    ".tar.bz2": ("tar", "w:bz2"),
+    ".tar.xz": ("tar", "w:xz"),
+}
+# already-compressed formats are stored rather than deflated in zip archives
+_ZIP_STORED_EXTS = {
+    ".png",".jpg",".jpeg",".jpe",".webp",".gif",".heic",".pdf",
+    ".mp4",".mov",".m4v",".mp3",".m4a",".zip",".gz",
+}
+_ZIP_EPOCH = 315532800  # 1980-01-01, the earliest timestamp zip can store
+
+def archive_kind(path: Path) -> tuple[str, str | None]:
+    name = Path(path).name.lower()
+    for suffix in sorted(_ARCHIVE_KINDS, key=len, reverse=True):
+        if name.endswith(suffix):
+            return _ARCHIVE_KINDS[suffix]
+    raise ValueError(f"archive must end in one of {', '.join(_ARCHIVE_KINDS)}: {path}")
+
+class ArchiveOutput:
+    """
+    Output backend that puts files into a tar/zip instead of under publish_root. Member names are
+    the paths relative to publish_root (same safety check, same layout); publish_root itself is never
+    touched. Files are streamed in; the archive is built as <path>.tmp and moved into place by close().
+    """
+    def __init__(self, path: Path, publish_root: Path, keep: set[str] | None = None, keep_prefixes: tuple = ()):
+        self.path = Path(path)
+        self.publish_root = Path(publish_root).resolve()
+        self.kind, mode = archive_kind(self.path)
+        self.keep = keep
+        self.keep_prefixes = tuple(keep_prefixes)
+        self.names: set[str] = set()
+        self.skipped: list[str] = []
+        self.mtime = time.time()
+        self._lock = threading.Lock()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        if self.kind == "zip":
+            self._ar = zipfile.ZipFile(self._tmp, "w", compression=zipfile.ZIP_DEFLATED)
+        else:
+            self._ar = tarfile.open(self._tmp, mode, format=tarfile.PAX_FORMAT)
+
+    def _member(self, dst: Path) -> str | None:
+        assert_in_publish_root(self.publish_root, dst)
+        rel = Path(dst).resolve().relative_to(self.publish_root).as_posix()
+        if self.keep is not None and rel not in self.keep and not rel.startswith(self.keep_prefixes):
+            self.skipped.append(rel)  # prune would remove it from a directory build
+            return None
+        if rel in self.names:
+            raise RuntimeError(f"Duplicate archive member: {rel}")
+        self.names.add(rel)
+        return rel
+
+    def _zip_info(self, name: str, mtime: float) -> zipfile.ZipInfo:
+        info = zipfile.ZipInfo(name, time.localtime(max(mtime, _ZIP_EPOCH))[:6])
+        stored = PurePosixPath(name).suffix.lower() in _ZIP_STORED_EXTS
+        info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        return info
+
+    def _tar_info(self, name: str, size: int, mtime: float) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(name)
+        info.size, info.mtime, info.mode = size, int(mtime), 0o644
+        return info
+
+    def add_bytes(self, dst: Path, data: bytes) -> str:
+        with self._lock:
+            name = self._member(dst)
+            if name is None:
+                return "skipped"
+            if self.kind == "zip":
+                self._ar.writestr(self._zip_info(name, self.mtime), data)
+            else:
+                self._ar.addfile(self._tar_info(name, len(data), self.mtime), io.BytesIO(data))
+        return "added"
+
+    def add_file(self, dst: Path, src: Path) -> str:
+        """Stream src into the archive as dst (never read fully into memory)."""
+        with self._lock:
+            name = self._member(dst)
+            if name is None:
+                return "skipped"
+            st = Path(src).stat()
+            with open(src, "rb") as f:
+                if self.kind == "zip":
+                    with self._ar.open(self._zip_info(name, st.st_mtime), "w", force_zip64=True) as out:
+                        shutil.copyfileobj(f, out, _HASH_CHUNK)
+                else:
+                    self._ar.addfile(self._tar_info(name, st.st_size, st.st_mtime), f)
+        return "added"
+
+    def close(self, ok: bool=True):
+        self._ar.close()
+        if ok:
+            os.replace(self._tmp, self.path)
+        else:
+            self._tmp.unlink(missing_ok=True)
+
+# ================= Change set: added / modified / deleted / unchanged =================
+
+def _sha256_file(p: Path) -> str:
+    h = hashlib.sha256()
+    with open(p, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _encode_text(text: str) -> bytes:
+    """Bytes exactly as Path.write_text(encoding='utf-8') would put them on disk."""
+    if os.linesep != "\n":
+        text = text.replace("\n", os.linesep)
+    return text.encode("utf-8")
+
+class ChangeSet:
+    """
+    Records what a build did to each output file under publish_root.
+    The previous run's change set doubles as a hash cache: a file whose size and
+    mtime_ns still match the recorded values is not re-hashed.
+    """
+    STATUSES = ("added", "modified", "deleted", "unchanged")
+    _RANK = {"unchanged": 0, "modified": 1, "added": 2}
+
+    def __init__(self, publish_root: Path, previous: dict | None = None):
+        self.publish_root = Path(publish_root)
+        self.files: dict[str, dict] = {}
+        self.status: dict[str, str] = {}
+        self.deleted: dict[str, dict] = {}
+        self._prev_files = (previous or {}).get("files") or {}
+        self._carried: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, publish_root: Path, path: Path | None):
+        prev = None
+        if path is not None and Path(path).is_file():
+            try:
+                prev = json.loads(Path(path).read_text(encoding="utf-8"))
+            except Exception as e:
+                tqdm.write(f"[changes] Ignoring unreadable change set {path}: {e}")
+        return cls(publish_root, prev)
+
+    def _rel(self, p: Path) -> str:
+        return Path(p).relative_to(self.publish_root).as_posix()
+
+    def cached_hash(self, p: Path, st: os.stat_result | None = None) -> str:
+        """sha256 of an existing output, reusing the previous run's hash when size+mtime match."""
+        st = st or p.stat()
+        prev = self._prev_files.get(self._rel(p))
+        if prev and prev.get("size") == st.st_size and prev.get("mtime_ns") == st.st_mtime_ns:
+            return prev["sha256"]
+        return _sha256_file(p)
+
+    def carry(self, statuses: dict[str, str]):
+        """
+        Statuses an interrupted run of the same build already recorded (see BuildJournal). Rewriting
+        those files now looks unchanged, but against the last completed build they were added/modified.
+        """
+        self._carried = dict(statuses)
+
+    def record(self, dst: Path, status: str, digest: str):
+        rel = self._rel(dst)
+        st = dst.stat()
+        carried = self._carried.get(rel)
+        if carried in self._RANK and self._RANK[carried] > self._RANK[status]:
+            status = carried
+        with self._lock:
+            self.files[rel] = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+            self.status[rel] = status
+            self.deleted.pop(rel, None)
+
+    def record_deleted(self, p: Path):
+        rel = self._rel(p)
+        try:
+            info = {"sha256": self.cached_hash(p), "size": p.stat().st_size}
+        except Exception:
+            info = {}
+        with self._lock:
+            added = self.status.get(rel) == "added"
+            self.files.pop(rel, None)
+            self.status.pop(rel, None)
+            if not added:  # written and removed within the same run: nothing changed for consumers
+                self.deleted[rel] = info
+
+    def absorb(self, files: dict[str, dict], status: dict[str, str]):
+        """Fold in records made by another process (a shard) against the same publish root."""
+        with self._lock:
+            for rel, info in files.items():
+                self.files[rel] = info
+                self.status[rel] = status[rel]
+                self.deleted.pop(rel, None)
+
+    def summary(self) -> dict[str, int]:
+        counts = {s: 0 for s in self.STATUSES}
+        for s in self.status.values():
+            counts[s] += 1
+        counts["deleted"] = len(self.deleted)
+        return counts
+
+    def to_dict(self) -> dict:
+        changes = {s: [] for s in self.STATUSES}
+        for rel in sorted(self.status):
+            changes[self.status[rel]].append(rel)
+        changes["deleted"] = sorted(self.deleted)
+        return {
+            "version": 1,
+            "generated": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "publish_root": str(self.publish_root),
+            "summary": self.summary(),
+            "changes": changes,
+            "files": {rel: self.files[rel] for rel in sorted(self.files)},
+            "deleted": {rel: self.deleted[rel] for rel in sorted(self.deleted)},
+        }
+
+    def write(self, path: Path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.to_dict(), indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+
+def _fsync_file(path: Path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_bytes_if_changed(publish_root: Path, dst: Path, data: bytes, changes: ChangeSet | None = None,
+                           archive: ArchiveOutput | None = None, out: "OutputWriter | None" = None) -> str:
+    """
+    Write data to dst unless dst already holds identical bytes (mtime preserved). Returns the status
+    ("queued" when out takes the write; the change set gets the real status once it lands).
+    """
+    if archive is not None:
+        return archive.add_bytes(dst, data)
+    if out is not None:
+        return out.submit(dst, _write_bytes, dst, data, changes, False, out.fsync_files)
+    assert_in_publish_root(publish_root, dst)
+    return _write_bytes(dst, data, changes)
+
+def _write_bytes(dst: Path, data: bytes, changes: ChangeSet | None, mkdir: bool=True, fsync: bool=False) -> str:
+    digest = hashlib.sha256(data).hexdigest()
+    status = "added"
+    if dst.is_file():
+        st = dst.stat()
+        if st.st_size == len(data) and (changes.cached_hash(dst, st) if changes else _sha256_file(dst)) == digest:
+            status = "unchanged"
+        else:
+            status = "modified"
+    if status != "unchanged":
+        if mkdir:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+        # temp file + rename: an interrupted build never leaves a truncated output behind
+        tmp = _tmp_path(dst)
+        try:
+            with open(tmp, "wb") as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(tmp, dst)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    if changes is not None:
+        changes.record(dst, status, digest)
+    return status
+
+def _tmp_path(dst: Path) -> Path:
+    return dst.with_name(dst.name + ".tmp")
+
+def replace_if_changed(publish_root: Path, tmp: Path, dst: Path, changes: ChangeSet | None = None,
+                       archive: ArchiveOutput | None = None, out: "OutputWriter | None" = None) -> str:
+    """Move a fully written temp file onto dst unless dst already holds the same bytes. Returns the status."""
+    if archive is not None:
+        try:
+            return archive.add_file(dst, tmp)
+        finally:
+            tmp.unlink()
+    if out is not None:
+        return out.submit(dst, _replace, tmp, dst, changes, out.fsync_files)
+    assert_in_publish_root(publish_root, dst)
+    return _replace(tmp, dst, changes)
+
+def _replace(tmp: Path, dst: Path, changes: ChangeSet | None, fsync: bool=False) -> str:
+    digest = _sha256_file(tmp)
+    status = "added"
+    if dst.is_file():
+        st = dst.stat()
+        if st.st_size == tmp.stat().st_size and (changes.cached_hash(dst, st) if changes else _sha256_file(dst)) == digest:
+            status = "unchanged"
+        else:
+            status = "modified"
+    if status == "unchanged":
+        tmp.unlink()
+    else:
+        if fsync:
+            _fsync_file(tmp)
+        os.replace(tmp, dst)
+    if changes is not None:
+        changes.record(dst, status, digest)
+    return status
+
+def write_text_if_changed(publish_root: Path, dst: Path, text: str, changes: ChangeSet | None = None,
+                          archive: ArchiveOutput | None = None, out: "OutputWriter | None" = None) -> str:
+    return write_bytes_if_changed(publish_root, dst, _encode_text(text), changes, archive, out)
+
+def copy_file_if_changed(publish_root: Path, src: Path, dst: Path, changes: ChangeSet | None = None,
+                         archive: ArchiveOutput | None = None, out: "OutputWriter | None" = None) -> str:
+    """copy2 src -> dst unless dst already has the same bytes (mtime preserved). Returns the status."""
+    if archive is not None:
+        return archive.add_file(dst, src)
+    if out is not None:
+        return out.submit(dst, _copy_file, src, dst, changes, False, out.fsync_files)
+    assert_in_publish_root(publish_root, dst)
+    return _copy_file(src, dst, changes)
+
+def _copy_file(src: Path, dst: Path, changes: ChangeSet | None, mkdir: bool=True, fsync: bool=False) -> str:
+    sst = src.stat()
+    status = "added"
+    digest = None
+    if dst.is_file():
+        dst_st = dst.stat()
+        if dst_st.st_size == sst.st_size:
+            dst_hash = changes.cached_hash(dst, dst_st) if changes else _sha256_file(dst)
+            if dst_st.st_mtime_ns == sst.st_mtime_ns:
+                # copy2 preserved the mtime last time; trust the cached hash of dst for src as well
+                digest = dst_hash
+            else:
+                digest = _sha256_file(src)
+            status = "unchanged" if digest == dst_hash else "modified"
+        else:
+            status = "modified"
+    if status != "unchanged":
+        if mkdir:
+            dst.parent.mkdir(parents=True, exist_ok=True)
+        tmp = _tmp_path(dst)
+        try:
+            shutil.copy2(src, tmp)
+            if fsync:
+                _fsync_file(tmp)
+            os.replace(tmp, dst)
+        except BaseException:
+            tmp.unlink(missing_ok=True)
+            raise
+    if changes is not None:
+        if digest is None:
+            digest = _sha256_file(dst)
+        changes.record(dst, status, digest)
+    return status
+
+# ================= Write-behind output (directory builds) =================
+FSYNC_POLICIES = ("none", "files", "all")
+
+class OutputWriter:
+    """
+    Write-behind output for directory builds. Every destination directory is created once up front,
+    destinations are checked against publish_root lexically (the root is resolved once, here), and the
+    writes run on background threads fed by a bounded queue, so rendering overlaps disk I/O.
+    The first failed write is re-raised by the next submit() and by flush()/close().
+    on_written(dst, status) is called on the writer thread once a write has landed.
+    """
+    def __init__(self, publish_root: Path, dirs=(), writers: int=2, queue_size: int=64, fsync: str="none",
+                 on_written=None):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync policy must be one of {FSYNC_POLICIES}, not {fsync!r}")
+        self.publish_root = Path(publish_root).resolve()
+        self._root = str(self.publish_root)
+        self.fsync = fsync
+        self.fsync_files = fsync != "none"
+        self.on_written = on_written
+        self.dirs: set[str] = set()
+        self._error: BaseException | None = None
+        self._lock = threading.Lock()
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.make_dirs(dirs)
+        self._threads = [threading.Thread(target=self._work, name=f"publish-writer-{i}", daemon=True)
+                         for i in range(max(1, writers))]
+        for t in self._threads:
+            t.start()
+
+    def check(self, target: Path) -> str:
+        """Lexical assert_in_publish_root: normalizes '..' without touching the filesystem."""
+        p = os.path.normpath(os.path.join(self._root, target))
+        if p != self._root and not p.startswith(self._root + os.sep):
+            raise RuntimeError(f"Refusing to modify outside publish_root: {p} (publish_root={self._root})")
+        return p
+
+    def make_dirs(self, dirs):
+        """Create each directory (and its parents) once; later calls skip directories already made."""
+        for d in sorted({self.check(d) for d in dirs}, key=len, reverse=True):
+            if d in self.dirs:
+                continue
+            os.makedirs(d, exist_ok=True)
+            while d not in self.dirs and len(d) >= len(self._root):
+                self.dirs.add(d)
+                d = os.path.dirname(d)
+
+    def submit(self, dst: Path, fn, *args) -> str:
+        d = os.path.dirname(self.check(dst))
+        if d not in self.dirs:
+            self.make_dirs([d])
+        self._raise_pending()
+        self._queue.put((dst, fn, args))   # blocks while the queue is full
+        return "queued"
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                if self._error is None:  # after a failure the rest is drained, not written
+                    dst, fn, args = item
+                    status = fn(*args)
+                    if self.on_written is not None:
+                        self.on_written(dst, status)
+            except BaseException as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+            finally:
+                self._queue.task_done()
+
+    def _raise_pending(self):
+        if self._error is not None:
+            raise self._error
+
+    def flush(self):
+        """Wait for every queued write (and, with fsync 'all', make the directory entries durable)."""
+        self._queue.join()
+        self._raise_pending()
+        if self.fsync == "all":
+            for d in sorted(self.dirs):
+                fd = os.open(d, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+
+    def close(self, ok: bool=True):
+        """Stop the writer threads; with ok, flush first and re-raise any write error."""
+        try:
+            if ok:
+                self.flush()
+        finally:
+            for _ in self._threads:
+                self._queue.put(None)
+            for t in self._threads:
+                t.join()
+
+# ================= Build journal: phase checkpoints + resumable file ops =================
+JOURNAL_NAME = ".publish-journal"
+JOURNAL_VERSION = 1
+JOURNAL_PHASES = ("assets", "files", "finish")
+# config keys that do not change what a build writes
+_RUN_ONLY_KEYS = {"dry_run", "debug", "list_selected", "jobs", "output", "filter_profile",
+                  "filter_note_budget_ms", "filter_budget_action", "page_weight", "vault_index", "change_source"}
+
+def plan_content_digest(plan: dict) -> str:
+    """Digest of everything that decides the bytes a plan writes (not when or how fast)."""
+    body = {k: v for k, v in plan.items() if k not in ("created", "deletes", "stats", "vault_changes", "config")}
+    body["config"] = {k: v for k, v in plan["config"].items() if k not in _RUN_ONLY_KEYS}
+    return hashlib.sha256(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class BuildJournal:
+    """
+    Append-only JSON-lines journal of one directory build at <publish_root>/.publish-journal:
+    a header with the plan digest, phase checkpoints (assets with the change-set statuses of the
+    assets, files once every planned render/copy is recorded, finish) and one line per render/copy
+    that has landed (source size+mtime, output size+mtime, status, sha256).
+    Deleted when the build completes, so its presence means the last build was interrupted;
+    prune refuses to run until every planned render/copy is journaled. With resume (and an
+    unchanged plan) completed file ops are skipped and their statuses carried.
+    """
+    def __init__(self, publish_root: Path, digest: str, resume: bool=False):
+        self.publish_root = Path(publish_root)
+        self.path = self.publish_root / JOURNAL_NAME
+        self.digest = digest
+        self.phases: list[str] = []
+        self.done: dict[str, dict] = {}
+        self.asset_status: dict[str, str] = {}
+        self._lock = threading.Lock()
+        header, phases, done, asset_status = self._read()
+        adopt = False
+        if header is not None:
+            last = phases[-1] if phases else "start"
+            if not resume:
+                tqdm.write(f"[journal] the previous build was interrupted (after {last}, {len(done)} files done); "
+                           "--resume continues it; starting over")
+            elif header.get("plan") != digest:
+                tqdm.write("[journal] the plan changed since the interrupted build; starting over")
+            else:
+                adopt = True
+                self.phases, self.done, self.asset_status = phases, done, asset_status
+                tqdm.write(f"[journal] resuming after {last}: {len(done)} files already done")
+        elif resume:
+            tqdm.write("[journal] nothing to resume; running a full build")
+        self.publish_root.mkdir(parents=True, exist_ok=True)
+        self._fh = open(self.path, "a" if adopt else "w", encoding="utf-8")
+        if not adopt:
+            self._append({"version": JOURNAL_VERSION, "plan": digest,
+                          "started": time.strftime("%Y-%m-%dT%H:%M:%S%z")}, sync=True)
+
+    def _read(self):
+        header, phases, done, asset_status = None, [], {}, {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for i, line in enumerate(f):
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        break  # a torn last line: everything before it stands
+                    if i == 0:
+                        if rec.get("version") != JOURNAL_VERSION:
+                            return None, [], {}, {}
+                        header = rec
+                    elif "phase" in rec:
+                        phases.append(rec["phase"])
+                        asset_status.update(rec.get("status") or {})
+                    elif "dst" in rec:
+                        done[rec["dst"]] = rec
+        except OSError:
+            pass
+        return header, phases, done, asset_status
+
+    def _append(self, rec: dict, sync: bool=False):
+        with self._lock:
+            self._fh.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            self._fh.flush()
+            if sync:
+                os.fsync(self._fh.fileno())
+
+    def checkpoint(self, phase: str, status: dict[str, str] | None = None):
+        self.phases.append(phase)
+        rec = {"phase": phase, "at": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+        if status:
+            rec["status"] = status
+            self.asset_status.update(status)
+        self._append(rec, sync=True)
+
+    def reached(self, phase: str) -> bool:
+        return phase in self.phases
+
+    def carried(self) -> dict[str, str]:
+        """Change-set status of every output the journal holds (assets and landed file ops)."""
+        return {**self.asset_status, **{dst: rec["status"] for dst, rec in self.done.items()}}
+
+    def missing(self, file_ops: list[dict]) -> list[str]:
+        """Planned render/copy destinations the journal has no landed record for."""
+        return [op["dst"] for op in file_ops if op["dst"] not in self.done]
+
+    def completed(self, op: dict, src_st: os.stat_result) -> dict | None:
+        """The journal record of op if it landed and neither its source nor its output changed since."""
+        rec = self.done.get(op["dst"])
+        if rec is None or rec["src"] != op["src"] or rec["op"] != op["op"]:
+            return None
+        if rec["src_size"] != src_st.st_size or rec["src_mtime_ns"] != src_st.st_mtime_ns:
+            return None
+        try:
+            st = (self.publish_root / op["dst"]).stat()
+        except OSError:
+            return None
+        return rec if st.st_size == rec["size"] and st.st_mtime_ns == rec["mtime_ns"] else None
+
+    def record(self, op: dict, src_st: os.stat_result, status: str, changes: ChangeSet | None = None):
+        st = (self.publish_root / op["dst"]).stat()
+        info = changes.files.get(op["dst"]) if changes is not None else None
+        rec = {"dst": op["dst"], "src": op["src"], "op": op["op"],
+               "src_size": src_st.st_size, "src_mtime_ns": src_st.st_mtime_ns,
+               "size": st.st_size, "mtime_ns": st.st_mtime_ns,
+               "status": status, "sha256": info["sha256"] if info else None}
+        self.done[op["dst"]] = rec
+        self._append(rec)
+
+    def close(self, complete: bool=False):
+        """Close the journal; a completed build removes it."""
+        self._fh.close()
+        if complete:
+            self.path.unlink(missing_ok=True)
+
 # ================= Config loading =================
 CFG_DEFAULTS = {
     "vault": "..",
     "publish": "../../Publish Vault",
     "always_root": [],
 
+    # Frontmatter predicate for selecting notes: every key must match (null = any value;
+    # a list in the note matches when it contains the value)
+    "select": {"publish": True},
+
+    # Frontmatter of published notes: keep keys matching allow (empty = all) minus deny (fnmatch globs),
+    # normalize values per key (date | list | number | string) and optionally drop empty values.
+    # Kept entries are copied verbatim; a block left empty is removed. Redactions still apply.
+    "frontmatter": {"allow": [], "deny": [], "normalize": {}, "drop_empty": False},
+
+    # Render the date banner (date, date_modified) and the OSM map (lat/lng, location, map_view_link,
+    # map_link, address) into the top of each note at build time instead of in the browser, from the
+    # keys the frontmatter settings keep; js/insert-dates.js and js/insert-maps.js leave pre-rendered pages alone
+    "static_blocks": {"dates": False, "maps": False, "map_zoom": 12},
+
+    # Several sites from one vault scan. Each entry is {name, publish, ...} overriding per-site keys
+    # (md_root_dir, select, global_contents_filter, md_folderpath_rewrite, always_root, thumbnails, ...).
+    # Empty = a single build from the keys in this file.
+    "targets": [],
+
+    # Snapshot of the vault listing for a fast cold start, re-validated by directory mtime on the next run.
+    # Off by default ("" = walk the vault every run); "auto" turns it on with the snapshot at
+    # $XDG_CACHE_HOME/publish-build/vault-<hash>.idx, or give a path
+    "vault_index": "",
+
+    # How a build learns what changed in the vault: "stat" (file/directory mtimes) or "git"
+    # (diff against the commit of the last successful build + git status + gitignored files; local
+    # repository only, falls back to stat when the vault is not a work tree or its state is unclear).
+    # With "git" the last build's parsed frontmatter is kept with that commit, so every run, not only
+    # a warm Builder, re-parses just the notes git reports as changed
+    "change_source": "stat",
+
     # Execution controls
     "include_hidden": False,
     "dry_run": False,
@@ -59,8 +690,81 @@ CFG_DEFAULTS = {
     # list of {pattern, replacement, flags: [IGNORECASE, MULTILINE, DOTALL, VERBOSE]}
     "global_contents_filter": [],
 
+    # Notes larger than this are rendered in line-aligned chunks instead of in memory (0 disables).
+    # Output is identical; filters whose matches are unbounded keep such notes on the in-memory path.
+    "stream_threshold_bytes": 8 * 1024 * 1024,
+    "stream_chunk_chars": 1024 * 1024,
+
+    # Parallel workers: processes resolving note references (large vaults), I/O threads applying
+    # the build plan (0 = automatic, 1 = serial)
+    "jobs": 0,
+
+    # Write-behind output for directory builds: bounded queue of pending writes drained by
+    # background writers (0 = as many as jobs); fsync: none | files | all (files + directories)
+    "output": {"queue_size": 64, "writers": 0, "fsync": "none"},
+
+    # Content-filter diagnostics: per-rule timing + match counts, and a per-note time budget
+    "filter_profile": False,
+    "filter_note_budget_ms": 0,        # 0 disables
+    "filter_budget_action": "warn",    # warn | fail (fail also interrupts a runaway rule when jobs: 1)
+
     # CSS behavior
     "css_hoist_imports_top": True,   # @charset is ALWAYS stripped
+
+    # Machine-readable change set per run (relative paths resolve against publish root; "" disables)
+    "changeset_file": "",
+
+    # Write the build into this archive (.zip, .tar, .tar.gz/.tgz, .tar.bz2, .tar.xz) instead of the
+    # publish directory; the layout under it is unchanged. "" = write the publish directory.
+    "archive": "",
+
+    # Full-text search index over rendered (post-redaction) notes: <md_root_dir>/<file>, read by js/search-index.js
+    "search": {
+        "enabled": False,
+        "file": "_search/index.json",
+        "min_token_len": 2,
+        "max_token_len": 32,     # longer "words" are usually URLs, hashes or base64
+        "title_boost": 5,        # each title token counts this many times
+        "stopwords": [],
+    },
+
+    # Page-weight report per published note (own bytes + referenced media, largest assets, bytes by
+    # media kind, assets shared across pages): console table of the top N pages plus an optional JSON
+    # file (relative paths resolve against the publish root, or next to config.archive for archive
+    # builds; --only builds do not write it). Budgets (0 = off) warn, or fail the build before any
+    # note or media file is written.
+    "page_weight": {
+        "enabled": False,
+        "file": "",
+        "top": 20,
+        "budgets": {"page_bytes": 0, "asset_bytes": 0, "assets_per_page": 0},
+        "budget_action": "warn",     # warn | fail
+    },
+
+    # Image metadata sidecar for embedded images: {"<md_root_dir>/<media>": {w, h, orientation, taken, gps}}
+    # from header-only reads, cached by content hash; read by js/image-meta.js to reserve layout space
+    "image_meta": {
+        "enabled": False,
+        "file": "_media/meta.json",
+    },
+
+    # Reading-order prefetch map: {slug: {prev, next, hero}} with slugs in published file-tree order
+    # (folders first, natural names) and each note's first referenced image under md_root_dir;
+    # js/next-previous-story.js prefetches the neighbouring pages and their hero images at low priority
+    "prefetch": {
+        "enabled": False,
+        "file": "_nav/prefetch.json",
+    },
+
+    # Gallery thumbnails for embedded images: <md_root_dir>/<dir>/<hash>-<max_px>-q<quality>.<ext> + thumbs.json
+    "thumbnails": {
+        "enabled": False,
+        "dir": "_thumbs",
+        "max_px": 320,
+        "format": "jpeg",    # jpeg | webp | png
+        "quality": 72,
+        "jobs": 0,           # process pool size (0 = CPU count)
+    },
 }
 
 def _deep_merge(base: dict, override: dict) -> dict:
@@ -81,7 +785,7 @@ def load_config(config_path: Path | None) -> dict:
 
     if config_path is None:
         tqdm.write("[cfg] No config file found; using built-in defaults")
-        return dict(CFG_DEFAULTS)
+        return finalize_config(_deep_merge(CFG_DEFAULTS, {}))
 
     config_path = Path(config_path)
     if not config_path.exists():
@@ -105,15 +809,89 @@ def load_config(config_path: Path | None) -> dict:
     except Exception as e:
         raise RuntimeError(f"Failed to parse config {config_path}: {e}")
 
-    cfg = _deep_merge(CFG_DEFAULTS, data)
+    return finalize_config(_deep_merge(CFG_DEFAULTS, data))
+
+def finalize_config(cfg: dict) -> dict:
+    """Validate a merged config and fill derived defaults (shared by load_config and Builder)."""
     if cfg.get("scope") and cfg["scope"] not in ("subtree","vault"):
         raise ValueError("config.scope must be 'subtree' or 'vault' if provided")
     # default scope if not provided
     cfg.setdefault("scope", "subtree")
     # export root dir (name inside publish vault)
     cfg.setdefault("md_root_dir", "content")
+    if (cfg.get("output") or {}).get("fsync", "none") not in FSYNC_POLICIES:
+        raise ValueError(f"config.output.fsync must be one of {', '.join(FSYNC_POLICIES)}")
+    if cfg.get("change_source") not in ("stat", "git"):
+        raise ValueError("config.change_source must be 'stat' or 'git'")
+    if cfg.get("filter_budget_action") not in ("warn", "fail"):
+        raise ValueError("config.filter_budget_action must be 'warn' or 'fail'")
+    if (cfg.get("page_weight") or {}).get("budget_action", "warn") not in ("warn", "fail"):
+        raise ValueError("config.page_weight.budget_action must be 'warn' or 'fail'")
+    if not isinstance(cfg.get("select"), dict):
+        raise ValueError("config.select must be a mapping of frontmatter key -> value")
+    normalize = (cfg.get("frontmatter") or {}).get("normalize") or {}
+    if not isinstance(normalize, dict) or any(k not in FM_NORMALIZE_KINDS for k in normalize.values()):
+        raise ValueError(f"config.frontmatter.normalize must map keys to one of {', '.join(FM_NORMALIZE_KINDS)}")
+    names = set()
+    for i, t in enumerate(cfg.get("targets") or []):
+        if not isinstance(t, dict) or not t.get("publish"):
+            raise ValueError(f"config.targets[{i}] needs a publish root")
+        shared = sorted(set(t) & TARGET_SHARED_KEYS)
+        if shared:
+            raise ValueError(f"config.targets[{i}] cannot override {', '.join(shared)} (shared by every target)")
+        name = _target_name(t)
+        if name in names:
+            raise ValueError(f"config.targets[{i}]: duplicate target name {name!r}")
+        names.add(name)
+    # the top-level filters, then every target's own (a bad per-target pattern fails here, not mid-build)
+    checked = [cfg] + [_target_config(cfg, t) for t in cfg.get("targets") or []]
+    for c in checked:
+        for field in ("global_contents_filter", "md_folderpath_rewrite"):
+            if c is not cfg and c.get(field) is cfg.get(field):
+                continue                    # inherited: already checked
+            label = _field_label(c, field)
+            for i, (rx, _) in enumerate(compile_regex_list(c.get(field, []), label)):
+                for problem in lint_regex(rx):
+                    tqdm.write(f"[regex] {label}[{i}] {rx.pattern!r}: {problem}; may backtrack catastrophically")
     return cfg
 
+# keys that drive the shared vault scan / run and therefore cannot differ per target
+TARGET_SHARED_KEYS = {
+    "vault", "include_hidden", "vault_index", "change_source", "scope", "media_exts", "targets", "dry_run", "debug", "list_selected",
+    "jobs", "filter_profile", "filter_note_budget_ms", "filter_budget_action",
+}
+
+def _target_name(t: dict) -> str:
+    return str(t.get("name") or Path(t["publish"]).name)
+
+def _target_config(cfg: dict, t: dict) -> dict:
+    tcfg = _deep_merge({k: v for k, v in cfg.items() if k != "targets"}, {k: v for k, v in t.items() if k != "name"})
+    tcfg["target"] = _target_name(t)
+    return tcfg
+
+def target_configs(cfg: dict, only: list[str] | None = None) -> list[dict]:
+    """One effective config per target (just [cfg] when no targets are configured)."""
+    targets = cfg.get("targets") or []
+    if not targets:
+        if only:
+            raise ValueError("--target given but config.targets is empty")
+        return [cfg]
+    out = [_target_config(cfg, t) for t in targets if not only or _target_name(t) in only]
+    if only:
+        missing = sorted(set(only) - {t["target"] for t in out})
+        if missing:
+            raise ValueError(f"unknown target(s): {', '.join(missing)}")
+    # one target's prune must never reach into another's output
+    roots = [(t["target"], Path(t["publish"]).resolve()) for t in out]
+    for a, ra in roots:
+        for b, rb in roots:
+            if a != b and (ra == rb or rb.is_relative_to(ra)):
+                raise ValueError(f"target {b!r} publishes inside target {a!r} ({rb})")
+    return out
+
+def _field_label(cfg: dict, field_name: str) -> str:
+    return f"{cfg['target']}:{field_name}" if cfg.get("target") else field_name
+
 # regex flags mapping
 _FLAG_MAP = {
     "IGNORECASE": re.IGNORECASE, "I": re.IGNORECASE,
@@ -144,6 +922,70 @@ def compile_regex_list(items: list[dict], field_name: str) -> list[tuple[re.Patt
         compiled.append((rx, repl))
     return compiled
 
+# ---- static check for catastrophic-backtracking shapes ----
+_REPEATS = ("MAX_REPEAT", "MIN_REPEAT")
+
+def _first_chars(sub) -> set | None:
+    """Literal code points a subpattern can start with, or None if unknown/any."""
+    for op, av in sub:
+        name = str(op)
+        if name == "LITERAL":
+            return {av}
+        if name == "AT":
+            continue
+        if name == "SUBPATTERN":
+            return _first_chars(av[-1])
+        if name == "IN" and all(str(o) == "LITERAL" for o, _ in av):
+            return {a for _, a in av}
+        return None
+    return None
+
+def lint_regex(rx: re.Pattern) -> list[str]:
+    """Warn-level findings: nested unbounded quantifiers, overlapping alternation or adjacent twins under repetition."""
+    try:
+        parsed = _sre_parse.parse(rx.pattern, rx.flags)
+    except Exception:
+        return []
+    problems: list[str] = []
+
+    def _walk(sub, in_repeat: bool):
+        prev = None
+        for op, av in sub:
+            name = str(op)
+            if name in _REPEATS:
+                lo, hi, body = av
+                unbounded = hi == _sre_parse.MAXREPEAT
+                if in_repeat and unbounded:
+                    problems.append("nested quantifier (e.g. (a+)+)")
+                if unbounded and prev is not None and str(prev[0]) in _REPEATS and prev[1][1] == _sre_parse.MAXREPEAT:
+                    if str(prev[1][2]) == str(body) or str(body).startswith("[(ANY"):
+                        problems.append("adjacent unbounded quantifiers over the same characters (e.g. \\s*\\s*)")
+                _walk(body, in_repeat or hi > 1)
+            elif name == "BRANCH":
+                if in_repeat:
+                    seen: set = set()
+                    for b in av[1]:
+                        fc = _first_chars(b)
+                        if fc is None or fc & seen:
+                            problems.append("alternation with overlapping branches under a quantifier (e.g. (a|ab)*)")
+                            break
+                        seen |= fc
+                for b in av[1]:
+                    _walk(b, in_repeat)
+            elif name == "SUBPATTERN":
+                _walk(av[-1], in_repeat)
+            elif name in ("ASSERT", "ASSERT_NOT"):
+                _walk(av[1], in_repeat)
+            elif name == "GROUPREF_EXISTS":
+                for b in av[1:]:
+                    if b is not None:
+                        _walk(b, in_repeat)
+            # POSSESSIVE_REPEAT / ATOMIC_GROUP never backtrack into their body
+            prev = (op, av)
+
+    _walk(parsed, False)
+    return sorted(set(problems))
+
 # ================== Reused helpers & regexes ==================
 FM_BLOCK_RE = re.compile(r'^---\s*\n(.*?)\n---\s*', re.DOTALL)
 WIKILINK_ALL = re.compile(r'(!?)\[\[([^\]]+)\]\]')
@@ -161,13 +1003,18 @@ def split_frontmatter_and_body(content: str):
     return m.group(1), content[m.end():]
 
 def parse_frontmatter_yaml(md_path: Path) -> tuple[dict, str]:
-    content = read_text(md_path)
+    return parse_frontmatter_text(read_text(md_path))
+
+def parse_frontmatter_text(content: str) -> tuple[dict, str]:
     fm_text, body = split_frontmatter_and_body(content)
     if fm_text is None: return {}, body
+    return parse_frontmatter_block(fm_text), body
+
+def parse_frontmatter_block(fm_text: str) -> dict:
     if yaml:
         try:
             data = yaml.safe_load(fm_text) or {}
-            if isinstance(data, dict): return data, body
+            if isinstance(data, dict): return data
         except Exception:
             pass
     data={}
@@ -179,46 +1026,644 @@ def parse_frontmatter_yaml(md_path: Path) -> tuple[dict, str]:
         if   low in ("true","yes","on","1"):  v=True
         elif low in ("false","no","off","0"): v=False
         data[k]=v
-    return data, body
+    return data
 
 def is_hidden(rel: Path) -> bool:
     return any(part.startswith(".") for part in rel.parts)
 
-def should_publish(md_path: Path, debug: bool=False) -> bool:
-    fm, _ = parse_frontmatter_yaml(md_path)
-    ok = isinstance(fm, dict) and bool(fm.get("publish") is True)
+def matches_select(fm: dict, select: dict) -> bool:
+    for key, want in select.items():
+        if want is None:
+            continue
+        have = fm.get(key)
+        if isinstance(have, list):
+            if want not in have:
+                return False
+        elif isinstance(want, bool):
+            if have is not want:
+                return False
+        elif have != want:
+            return False
+    return True
+
+def should_publish(md_path: Path, debug: bool=False, select: dict | None = None, fm: dict | None = None) -> bool:
+    if fm is None:
+        fm, _ = parse_frontmatter_yaml(md_path)
+    select = {"publish": True} if select is None else select
+    ok = isinstance(fm, dict) and matches_select(fm, select)
     if debug:
-        print(f"[sel] {'PASS' if ok else 'skip'} {md_path.name}: publish={fm.get('publish')!r}")
+        shown = ", ".join(f"{k}={fm.get(k)!r}" for k in select)
+        print(f"[sel] {'PASS' if ok else 'skip'} {md_path.name}: {shown}")
     return ok
 
+def describe_select(select: dict) -> str:
+    return ", ".join(f"{k}:{json.dumps(v)}" for k, v in select.items()) or "all notes"
+
+# ================= Frontmatter projection =================
+FM_NORMALIZE_KINDS = ("date", "list", "number", "string")
+# a head that may still turn into a frontmatter block once more of the note is read
+_FM_OPEN = re.compile(r'-{0,3}\Z|---\s*(?:\n|\Z)')
+# the opening "---" line of a complete block
+_FM_OPENING = re.compile(r'---\s*\n')
+# a top-level mapping key at column 0 (plain or quoted); indented lines, "- " items and comments continue it
+_FM_KEY_LINE = re.compile(r"""^("[^"]*"|'[^']*'|[^\s#\-"'][^:]*?)\s*:(?:\s|$)""")
+
+def _fm_empty(v) -> bool:
+    return v is None or (isinstance(v, (str, list, dict)) and not (v.strip() if isinstance(v, str) else v))
+
+def _fm_normalize(v, kind: str):
+    """Coerce one frontmatter value to kind; values that do not convert are returned unchanged."""
+    if kind == "list":
+        if isinstance(v, list) or v is None:
+            return v
+        if isinstance(v, str):
+            return [x.strip() for x in v.split(",") if x.strip()]
+        return [v]
+    if kind == "date":
+        if isinstance(v, datetime):
+            return v.date()
+        if isinstance(v, str):
+            try: return date.fromisoformat(v.strip()[:10])
+            except ValueError: return v
+        return v
+    if kind == "number":
+        if isinstance(v, str):
+            for conv in (int, float):
+                try: return conv(v.strip())
+                except ValueError: pass
+        return v
+    if kind == "string":
+        if isinstance(v, (date, datetime)):
+            return v.isoformat()
+        return v if v is None or isinstance(v, (list, dict)) else str(v)
+    return v
+
+class FrontmatterProjection:
+    """
+    Rewrites the frontmatter block of published notes down to the keys the site reads: allow/deny
+    key globs (deny wins; empty allow = every key), optional per-key value normalization and dropping
+    of empty values. Values come from the frontmatter parsed at selection time: plan_note() turns them
+    into per-note edits once, at plan time, so rendering only splits the block into top-level entries.
+    Other kept entries are copied verbatim (comments, quoting, key order); a block left with no keys
+    is removed. Runs before content filters.
+    """
+    def __init__(self, fcfg: dict, edits: dict | None = None):
+        self.allow = [str(g) for g in (fcfg.get("allow") or [])]
+        self.deny = [str(g) for g in (fcfg.get("deny") or [])]
+        self.normalize = dict(fcfg.get("normalize") or {})
+        self.drop_empty = bool(fcfg.get("drop_empty"))
+        self.edits = edits or {}       # note rel -> {"drop": [key], "set": {key: yaml entry}}
+
+    @classmethod
+    def from_config(cls, cfg: dict, edits: dict | None = None):
+        """None when the config leaves frontmatter untouched."""
+        fcfg = cfg.get("frontmatter") or {}
+        if not any(fcfg.get(k) for k in ("allow", "deny", "normalize", "drop_empty")):
+            return None
+        return cls(fcfg, edits)
+
+    def keeps(self, key: str) -> bool:
+        if self.allow and not any(fnmatchcase(key, g) for g in self.allow):
+            return False
+        return not any(fnmatchcase(key, g) for g in self.deny)
+
+    def project(self, fm: dict) -> dict:
+        """The published view of parsed frontmatter: kept keys only, normalized, empty values dropped."""
+        out = {}
+        for key, v in fm.items():
+            key = str(key)
+            if not self.keeps(key):
+                continue
+            kind = self.normalize.get(key)
+            if kind is not None:
+                v = _fm_normalize(v, kind)
+            if not (self.drop_empty and _fm_empty(v)):
+                out[key] = v
+        return out
+
+    def plan_note(self, fm: dict) -> dict | None:
+        """Edits for one note from its parsed frontmatter (None when every kept entry stays verbatim)."""
+        drop, set_ = [], {}
+        for key, v in fm.items():
+            key = str(key)
+            if not self.keeps(key):
+                continue
+            kind = self.normalize.get(key)
+            if kind is not None:
+                v = _fm_normalize(v, kind)
+            if self.drop_empty and _fm_empty(v):
+                drop.append(key)
+            elif kind is not None and yaml is not None:
+                # block mapping at the top, flat lists/mappings on one line (what the client scripts scan)
+                set_[key] = yaml.safe_dump({key: v}, sort_keys=False, allow_unicode=True, width=1 << 16,
+                                           default_flow_style=None if isinstance(v, (list, dict)) else False
+                                           ).rstrip("\n")
+        return {"drop": drop, "set": set_} if drop or set_ else None
+
+    def project_block(self, fm_text: str, note: str | None = None) -> str:
+        """The projected text between the --- delimiters ("" when no key survives)."""
+        edits = self.edits.get(note) or {}
+        drop, set_ = set(edits.get("drop") or ()), edits.get("set") or {}
+        entries: list[list] = [[None, []]]          # [key, lines]; key None = leading comments/blanks
+        for line in fm_text.split("\n"):
+            m = _FM_KEY_LINE.match(line)
+            if m:
+                entries.append([m.group(1).strip("'\""), [line]])
+            else:
+                entries[-1][1].append(line)
+        out: list[str] = []
+        kept = 0
+        for key, lines in entries:
+            if key is not None:
+                if not self.keeps(key) or key in drop:
+                    continue
+                kept += 1
+                if key in set_:
+                    lines = [set_[key]]
+            out.extend(lines)
+        return "\n".join(out) if kept else ""
+
+# ================= Static date / map blocks (js/insert-dates.js, js/insert-maps.js) =================
+_MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September",
+           "October", "November", "December"]
+_WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+_FLOAT_RE = re.compile(r'\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)')
+_PAIR_RE = re.compile(r'(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)')
+
+def _ord(n: int) -> str:
+    if 11 <= n % 100 <= 13:
+        return "th"
+    return {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+
+def _date_tokens(v) -> list[str]:
+    """`date` as scalar, CSV string or list -> tokens (YYYY-MM-DD | YYYY-MM | YYYY)."""
+    items = v if isinstance(v, list) else [v]
+    out = []
+    for item in items:
+        if isinstance(item, datetime):
+            item = item.date()
+        if isinstance(item, date):
+            out.append(item.isoformat())
+        elif item is not None:
+            out.extend(t.strip() for t in re.split(r'[,;]+', str(item)) if t.strip())
+    return out
+
+def _parse_date_token(tok: str):
+    t = tok.strip().strip("[]")
+    m = re.fullmatch(r'(\d{4})-(\d{2})-(\d{2})', t)
+    if m:
+        try: return ("full", date(int(m[1]), int(m[2]), int(m[3])))
+        except ValueError: return None
+    m = re.fullmatch(r'(\d{4})-(\d{2})', t)
+    if m and 1 <= int(m[2]) <= 12:
+        return ("ym", (int(m[1]), int(m[2])))
+    m = re.fullmatch(r'\d{4}', t)
+    return ("y", int(t)) if m else None
+
+def _day(d: date) -> str:
+    return f'{_MONTHS[d.month - 1]}&nbsp;{d.day}<sup class="ord">{_ord(d.day)}</sup>'
+
+def format_note_dates(tokens: list[str]) -> str:
+    """The banner text of js/insert-dates.js: a full date, a same-year/month range, month or year."""
+    parsed = [p for p in map(_parse_date_token, tokens) if p]
+    if not parsed:
+        return ""
+    fulls = sorted(v for k, v in parsed if k == "full")
+    yms = sorted(v for k, v in parsed if k == "ym")
+    ys = sorted(v for k, v in parsed if k == "y")
+    more = lambda n: f'&nbsp;<span class="more">(＋{n} more)</span>' if n else ""
+    if len(fulls) == 2:
+        a, b = fulls
+        if a.year != b.year:
+            return f"{_day(a)},&nbsp;{a.year} – {_day(b)},&nbsp;{b.year}"
+        if a.month == b.month:
+            return f'{_day(a)}–{b.day}<sup class="ord">{_ord(b.day)}</sup>,&nbsp;{a.year}'
+        return f"{_day(a)} – {_day(b)},&nbsp;{a.year}"
+    if fulls:
+        d = fulls[0]
+        return f"{_WEEKDAYS[d.weekday()]}, {_day(d)},&nbsp;{d.year}" + more(len(parsed) - 1)
+    if yms:
+        return f"{_MONTHS[yms[0][1] - 1]}&nbsp;{yms[0][0]}" + more(len(parsed) - 1)
+    return str(ys[0]) + more(len(ys) - 1)
+
+def render_date_block(fm: dict) -> str:
+    """<div id="note-date-banner"> from `date` / `date_modified`, or "" when neither parses."""
+    primary = format_note_dates(_date_tokens(fm.get("date")))
+    mod = fm.get("date_modified")
+    if isinstance(mod, (date, datetime)):
+        mod = mod.isoformat()
+    m = re.fullmatch(r'(\d{4}-\d{2}-\d{2})(?:[ T].*)?', str(mod).strip()) if mod is not None else None
+    if not primary and not m:
+        return ""
+    parts = [f'<span class="primary-date">{primary}</span>'] if primary else []
+    if m:
+        parts.append(f'<span class="mod-date">updated&nbsp;{m[1]}</span>')
+    return f'<div id="note-date-banner" data-publish-static>{"".join(parts)}</div>'
+
+def _to_float(v) -> float | None:
+    if isinstance(v, bool) or v is None:
+        return None
+    if isinstance(v, (int, float)):
+        return float(v)
+    m = _FLOAT_RE.match(str(v))
+    return float(m[1]) if m else None
+
+def _to_lat_lon(a, b):
+    in_lat = lambda x: x is not None and abs(x) <= 90
+    in_lon = lambda x: x is not None and abs(x) <= 180
+    lat, lon = a, b
+    if not (in_lat(lat) and in_lon(lon)) and in_lat(b) and in_lon(a):
+        lat, lon = b, a
+    return (lat, lon) if in_lat(lat) and in_lon(lon) else None
+
+def _pair(s):
+    m = _PAIR_RE.search(str(s)) if s else None
+    return (float(m[1]), float(m[2])) if m else None
+
+def _map_link_coords(raw):
+    """Coordinates from an Apple / Google / OpenStreetMap URL."""
+    href = str(raw or "").replace("&amp;", "&").strip()
+    if not re.match(r'https?://', href, re.I):
+        return None
+    try:
+        u = urllib.parse.urlsplit(href)
+    except ValueError:
+        return None
+    host = (u.hostname or "").lower()
+    q = dict(urllib.parse.parse_qsl(u.query))
+    if host.endswith("maps.apple.com"):
+        c = _pair(q.get("ll") or q.get("sll")) or _pair(q.get("q"))
+        return _to_lat_lon(*c) if c else None
+    if "google." in host and "/maps" in u.path.lower():
+        at = re.search(r'@(-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)', u.path)
+        t = _to_lat_lon(float(at[1]), float(at[2])) if at else None
+        if t is None:
+            c = _pair(q.get("q")) or _pair(q.get("query"))
+            t = _to_lat_lon(*c) if c else None
+        return t
+    if "openstreetmap.org" in host:
+        lat, lon = _to_float(q.get("mlat")), _to_float(q.get("mlon"))
+        if lat is None or lon is None:
+            m = re.search(r'map=\d+/(-?\d+(?:\.\d+)?)/(-?\d+(?:\.\d+)?)', u.fragment)
+            return _to_lat_lon(float(m[1]), float(m[2])) if m else None
+        return lat, lon
+    return None
+
+def note_coords(fm: dict):
+    """(lat, lon) by the priority of js/insert-maps.js: lat/lng, location, map_view_link, map_link."""
+    lat, lon = _to_float(fm.get("lat")), _to_float(fm.get("lng"))
+    if lat is not None and lon is not None:
+        return lat, lon
+    loc = fm.get("location")
+    if isinstance(loc, list) and len(loc) == 2:
+        t = _to_lat_lon(_to_float(loc[0]), _to_float(loc[1]))
+        if t:
+            return t
+    elif isinstance(loc, str):
+        c = _pair(loc)
+        t = _to_lat_lon(*c) if c else None
+        if t:
+            return t
+    m = re.search(r'\]\(\s*geo:\s*(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)', str(fm.get("map_view_link") or ""), re.I)
+    t = _to_lat_lon(float(m[1]), float(m[2])) if m else None
+    return t or _map_link_coords(fm.get("map_link"))
+
+def _address_place(addr) -> str | None:
+    """"first, last-non-zip" of a comma-separated address."""
+    parts = [p.strip() for p in str(addr or "").split(",") if p.strip()]
+    if not parts:
+        return None
+    is_zip = lambda s: re.search(r'\b\d{5}(?:-\d{4})?\b', s)
+    last = next((p for p in reversed(parts) if not is_zip(p)), parts[-1])
+    return f"{parts[0]}, {last}"
+
+def _js_num(x: float) -> str:
+    return str(int(x)) if float(x).is_integer() else repr(float(x))
+
+def osm_embed_url(lat: float, lon: float, zoom: int, px_w: int=300, px_h: int=400) -> str:
+    """OpenStreetMap embed URL whose bbox fits a px_w x px_h frame at zoom (marker + hash as in the JS)."""
+    mpp = 156543.03392 * math.cos(lat * math.pi / 180) / 2 ** zoom
+    half_w, half_h, pad = px_w * mpp / 2, px_h * mpp / 2, 1.15
+    lat_deg, lon_deg = 1 / 111320, 1 / (111320 * math.cos(lat * math.pi / 180))
+    left, right = lon - half_w * lon_deg * pad, lon + half_w * lon_deg * pad
+    top, bottom = lat + half_h * lat_deg * pad, lat - half_h * lat_deg * pad
+    query = urllib.parse.urlencode({
+        "layer": "mapnik",
+        "bbox": ",".join(_js_num(v) for v in (left, bottom, right, top)),
+        "marker": f"{_js_num(lat)},{_js_num(lon)}",
+    })
+    return f"https://www.openstreetmap.org/export/embed.html?{query}#map={zoom}/{_js_num(lat)}/{_js_num(lon)}"
+
+def render_map_block(fm: dict, zoom: int=12) -> str:
+    """<div id="side-map-block"> with a lazy OSM iframe and the address place line, or ""."""
+    coords = note_coords(fm)
+    if coords is None:
+        return ""
+    src = html.escape(osm_embed_url(coords[0], coords[1], zoom))
+    place = _address_place(fm.get("address"))
+    meta = f'<div class="place">{html.escape(place, quote=False)}</div>' if place else ""
+    return ('<div id="side-map-block" data-publish-static><div id="side-map-wrap">'
+            f'<iframe id="side-map-iframe" src="{src}" referrerpolicy="no-referrer-when-downgrade" loading="lazy">'
+            f'</iframe></div><div id="side-map-meta">{meta}</div></div>')
+
+def render_static_blocks(fm: dict, bcfg: dict) -> str:
+    """The enabled blocks for one note (joined by blank lines), from its parsed frontmatter."""
+    blocks = []
+    if bcfg.get("dates"):
+        blocks.append(render_date_block(fm))
+    if bcfg.get("maps"):
+        blocks.append(render_map_block(fm, int(bcfg.get("map_zoom", 12))))
+    return "\n\n".join(b for b in blocks if b)
+
+# ================= Note head: projected frontmatter + static blocks =================
+def note_head_span(content: str, ctx: dict, note: str):
+    """
+    (end, replacement) for the head of a note: content[:end] (the frontmatter block, or nothing)
+    becomes the projected block followed by the note's static blocks. None = nothing to change.
+    """
+    m = FM_BLOCK_RE.match(content)
+    blocks = ctx["blocks"].get(note)
+    if m is None:
+        return (0, blocks + "\n\n") if blocks else None
+    head = content[:m.end()]
+    if ctx["frontmatter"] is not None:
+        text = ctx["frontmatter"].project_block(m.group(1), note)
+        head = content[:m.start(1)] + text + content[m.end(1):m.end()] if text else ""
+    if blocks:
+        head += ("" if not head or head.endswith("\n") else "\n") + blocks + "\n\n"
+    return m.end(), head
+
+def read_note_head(src: Path, span, errors: str="strict", chunk_chars: int=1 << 16) -> tuple[int, str]:
+    """span(prefix) over the shortest prefix of src that decides the frontmatter block ((0, "") = no change)."""
+    prefix = ""
+    with open(src, "r", encoding="utf-8", errors=errors) as f:
+        while True:
+            more = f.read(chunk_chars)
+            prefix += more
+            if more:
+                m = FM_BLOCK_RE.match(prefix)
+                if m is None:
+                    if _FM_OPEN.match(prefix):
+                        continue                # the block is still open
+                # undecided while a longer opening run (FM_BLOCK_RE tries those first) may still close
+                # further on, or while the block's trailing whitespace runs to the end of the prefix
+                elif m.start(1) != _FM_OPENING.match(prefix).end() or m.end() >= len(prefix):
+                    continue
+            return span(prefix) or (0, "")
+
+# ================= Filter profiling + per-note budget =================
+class FilterBudgetExceeded(RuntimeError):
+    pass
+
+class FilterProfile:
+    """
+    Per-rule call/match counts and timings aggregated over a build, keyed by where the rule ran
+    (note body, file/dir name, folder rewrite), plus an optional per-note time budget.
+    """
+    def __init__(self, enabled: bool=False, budget_ms: float=0, action: str="warn"):
+        self.enabled = bool(enabled)
+        self.budget = float(budget_ms or 0) / 1000.0
+        self.action = action
+        self.labels: dict[int, str] = {}
+        self.stats: dict[tuple[str, str], list] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg: dict):
+        return cls(cfg.get("filter_profile"), cfg.get("filter_note_budget_ms"), cfg.get("filter_budget_action", "warn"))
+
+    @property
+    def active(self) -> bool:
+        return self.enabled or self.budget > 0
+
+    def register(self, field_name: str, regexes: list[tuple[re.Pattern, str]]):
+        for i, (rx, _) in enumerate(regexes or []):
+            self.labels[id(rx)] = f"{field_name}[{i}] {rx.pattern!r}"
+
+    def label(self, rx: re.Pattern) -> str:
+        return self.labels.get(id(rx), repr(rx.pattern))
+
+    def add(self, rx: re.Pattern, where: str, seconds: float, matches: int):
+        with self._lock:
+            st = self.stats.setdefault((self.label(rx), where), [0, 0.0, 0.0, 0])
+            st[0] += 1; st[1] += seconds; st[2] = max(st[2], seconds); st[3] += matches
+
+    def check_budget(self, rx: re.Pattern, note: str, elapsed: float, rule_seconds: float) -> bool:
+        """True (after warning or raising) when a note has used up its budget."""
+        if not self.budget or note is None or elapsed <= self.budget:
+            return False
+        msg = (f"[filters] {note}: {elapsed * 1000:.1f} ms exceeds the {self.budget * 1000:g} ms budget; "
+               f"rule {self.label(rx)} took {rule_seconds * 1000:.1f} ms")
+        if self.action == "fail":
+            raise FilterBudgetExceeded(msg)
+        tqdm.write(msg)
+        return True
+
+    @contextmanager
+    def _deadline(self, rx: re.Pattern, note: str | None, remaining: float):
+        """Interrupt a rule that never finishes (action 'fail', main thread, POSIX only)."""
+        armed = (self.action == "fail" and self.budget and note is not None and hasattr(signal, "setitimer")
+                 and threading.current_thread() is threading.main_thread())
+        if not armed:
+            yield
+            return
+        def _on_alarm(signum, frame):
+            raise FilterBudgetExceeded(f"[filters] {note}: rule {self.label(rx)} still running after the "
+                                       f"{self.budget * 1000:g} ms budget")
+        old = signal.signal(signal.SIGALRM, _on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, max(remaining, 0.001))
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, old)
+
+    def run(self, text: str, regexes: list[tuple[re.Pattern, str]], where: str, note: str | None = None) -> str:
+        start = time.perf_counter()
+        warned = False
+        for rx, repl in regexes:
+            t0 = time.perf_counter()
+            with self._deadline(rx, note, self.budget - (t0 - start)):
+                text, n = rx.subn(repl, text)
+            t1 = time.perf_counter()
+            self.add(rx, where, t1 - t0, n)
+            if not warned:
+                warned = self.check_budget(rx, note, t1 - start, t1 - t0)
+        return text
+
+    def report(self, top: int=25):
+        if not self.stats:
+            return
+        rows = sorted(self.stats.items(), key=lambda kv: kv[1][1], reverse=True)
+        print("\n=== Filter profile (slowest first) ===")
+        print(f"{'total ms':>10} {'max ms':>9} {'calls':>8} {'matches':>9}  where   rule")
+        for (label, where), (calls, total, mx, matches) in rows[:top]:
+            print(f"{total * 1000:10.1f} {mx * 1000:9.2f} {calls:8d} {matches:9d}  {where:<7} {label}")
+
 # ================= Content regex =================
-def apply_text_filters(text: str, regexes: list[tuple[re.Pattern,str]]) -> str:
+def apply_text_filters(text: str, regexes: list[tuple[re.Pattern,str]],
+                       profile: FilterProfile | None = None, note: str | None = None) -> str:
     if not regexes:
         return text
+    if profile is not None and profile.active:
+        return profile.run(text, regexes, "body", note)
     for pattern, repl in regexes:
         text = pattern.sub(repl, text)
     return text
 
 # ================= Filename/dir filters (reuse global_contents_filter if toggled) =================
-def apply_name_filters(name: str, regexes: list[tuple[re.Pattern,str]], enabled: bool=True) -> str:
+def apply_name_filters(name: str, regexes: list[tuple[re.Pattern,str]], enabled: bool=True,
+                       profile: FilterProfile | None = None) -> str:
     if not enabled or not regexes:
         return name
+    if profile is not None and profile.enabled:
+        return profile.run(name, regexes, "name")
     out = name
     for rx, repl in regexes:
         out = rx.sub(repl, out)
     return out
 
+# ================= Markdown code/comment spans (no link extraction or rewriting inside) =================
+_FENCE_OPEN = re.compile(r" {0,3}(`{3,}|~{3,})(.*)")
+_SPAN_OPEN  = re.compile(r"`+|%%|<!--")
+
+def markdown_skip_spans(text: str, state=None) -> tuple[list[tuple[int, int]], object]:
+    """
+    [start, end) spans of fenced code, inline code, %% comments %% and <!-- comments --> in text.
+    Line-oriented: inline code closes on its own line, and `state` (what is open at the start of
+    text; returned for the end of text) lets a caller continue at any line start.
+    """
+    spans: list[tuple[int, int]] = []
+    def _add(a: int, b: int):
+        if spans and spans[-1][1] >= a:
+            spans[-1] = (spans[-1][0], max(spans[-1][1], b))
+        elif b > a:
+            spans.append((a, b))
+
+    pos, n = 0, len(text)
+    while pos < n:
+        eol = text.find("\n", pos)
+        eol = n if eol < 0 else eol + 1
+        line = text[pos:eol].rstrip("\n")
+        if state and state[0] == "fence":
+            _, ch, width = state
+            stripped = line.strip()
+            if len(line) - len(line.lstrip(" ")) <= 3 and stripped and stripped == ch * len(stripped) and len(stripped) >= width:
+                state = None
+            _add(pos, eol)
+            pos = eol
+            continue
+        i = pos
+        if state is None:
+            m = _FENCE_OPEN.fullmatch(line)
+            if m and not (m.group(1)[0] == "`" and "`" in m.group(2)):
+                state = ("fence", m.group(1)[0], len(m.group(1)))
+                _add(pos, eol)
+                pos = eol
+                continue
+        while i < eol:
+            if state is not None:  # inside %% or <!-- from an earlier point
+                close = "%%" if state[0] == "%%" else "-->"
+                j = text.find(close, i, eol)
+                if j < 0:
+                    _add(i, eol)
+                    break
+                _add(i, j + len(close))
+                i = j + len(close)
+                state = None
+                continue
+            m = _SPAN_OPEN.search(text, i, eol)
+            if not m:
+                break
+            tok = m.group(0)
+            if tok[0] == "`":
+                c = re.compile(r"(?<!`)" + "`" * len(tok) + r"(?!`)").search(text, m.end(), eol)
+                if c:
+                    _add(m.start(), c.end())
+                    i = c.end()
+                else:
+                    i = m.end()
+                continue
+            state = (tok,)
+            _add(m.start(), m.end())
+            i = m.end()
+        pos = eol
+    return spans, state
+
+class SkipSpans:
+    """Membership test for positions inside code/comment spans."""
+    def __init__(self, spans: list[tuple[int, int]]):
+        self.spans = spans
+        self.starts = [a for a, _ in spans]
+
+    def __contains__(self, pos: int) -> bool:
+        i = bisect_right(self.starts, pos) - 1
+        return i >= 0 and pos < self.spans[i][1]
+
+def skipping(repl, spans: SkipSpans):
+    """Wrap a re.sub callback so matches starting in code/comments are left as written."""
+    def _repl(m: re.Match) -> str:
+        return m.group(0) if m.start() in spans else repl(m)
+    return _repl
+
+# characters markdown_skip_spans() looks at: in or next to a rewritten link they can change the spans
+_SPAN_TEXT_CHARS = frozenset("`~%<>\n")
+_SPAN_EDGE_CHARS = frozenset("`~%<>!-")
+
+def sub_skipping(rx: re.Pattern, repl, text: str, spans: SkipSpans) -> tuple[str, SkipSpans | None]:
+    """
+    rx.sub(skipping(repl, spans), text) for the link rewriters, plus spans moved onto the result so
+    the next rewriter need not scan the text again. None instead of spans when a rewrite may have
+    changed them (marker characters in or next to it, a line that starts like a fence, or a line
+    start the rewrite left empty): the caller scans the result.
+    """
+    out, edits, last = [], [], 0
+    for m in rx.finditer(text):
+        if m.start() in spans:
+            continue
+        new = repl(m)
+        if new != m.group(0):
+            edits.append((m.start(), m.end(), new))
+        out.append(text[last:m.start()])
+        out.append(new)
+        last = m.end()
+    if not edits:
+        return text, spans
+    out.append(text[last:])
+    starts, shifted, shift = [], [], 0
+    for a, b, new in edits:
+        head = text[text.rfind("\n", 0, a) + 1:a].lstrip(" ")
+        if ((head or new).lstrip(" ")[:1] in ("", "`", "~") or not _SPAN_TEXT_CHARS.isdisjoint(text[a:b])
+                or not _SPAN_TEXT_CHARS.isdisjoint(new) or not _SPAN_EDGE_CHARS.isdisjoint(text[a - 1:a] + text[b:b + 1])):
+            return "".join(out), None
+        starts.append(a)
+        shift += len(new) - (b - a)
+        shifted.append(shift)
+    # no span edge can fall inside a rewritten link now (it would need a marker character in it)
+    def move(x: int) -> int:
+        i = bisect_right(starts, x - 1) - 1     # last edit starting before x
+        return x if i < 0 else x + shifted[i]
+    return "".join(out), SkipSpans([(move(a), move(b)) for a, b in spans.spans])
+
 # ================= Reference extraction =================
+_WIKI_REF = re.compile(r'!\[\[\s*([^\]|#]+.*?)\s*\]\]|\[\[\s*([^\]|#]+.*?)\s*\]\]')
+
 def extract_media_refs_from_text(text: str) -> list[tuple[str,bool]]:
     refs=[]
+    # links inside code and comments are not links
+    skip = SkipSpans(markdown_skip_spans(text)[0])
     # Obsidian wiki embeds/links
-    for m in re.findall(r'!\[\[\s*([^\]|#]+.*?)\s*\]\]|\[\[\s*([^\]|#]+.*?)\s*\]\]', text):
-        inner = (m[0] or m[1]).strip()
+    for m in _WIKI_REF.finditer(text):
+        if m.start() in skip:
+            continue
+        inner = (m.group(1) or m.group(2)).strip()
         target = inner.split('|',1)[0].split('#',1)[0].strip()
         refs.append((target, Path(target).suffix!=""))
     # Markdown images/links
-    for m in MD_LINK.findall(text):
-        href = (m[2] or "").strip()
+    for m in MD_LINK.finditer(text):
+        if m.start() in skip:
+            continue
+        href = (m.group(3) or "").strip()
         if not href or href.lower().startswith(("http:","https:", "data:", "mailto:", "#")):
             continue
         if " " in href and not Path(href).exists():
@@ -652,8 +2097,10 @@ def _inline_js_once(js_file: Path, inline_debug: bool=False) -> str:
             out_lines.append(raw)
     return "\n".join(out_lines)
 
-def build_assets_from_script_dir(publish_root: Path, debug: bool=False, css_hoist_imports_top: bool=True):
-    publish_root.mkdir(parents=True, exist_ok=True)
+def build_assets_from_script_dir(publish_root: Path, debug: bool=False, css_hoist_imports_top: bool=True,
+                                 changes: ChangeSet | None = None, archive: ArchiveOutput | None = None):
+    if archive is None:
+        publish_root.mkdir(parents=True, exist_ok=True)
     script_dir = Path(__file__).resolve().parent
 
     # CSS
@@ -662,12 +2109,13 @@ def build_assets_from_script_dir(publish_root: Path, debug: bool=False, css_hois
     assert_in_publish_root(publish_root, css_dst)
     if css_src.is_file():
         css_text = _inline_css_once(css_src, inline_debug=debug, hoist_imports=css_hoist_imports_top)
-        css_dst.write_text(css_text, encoding="utf-8")
+        write_text_if_changed(publish_root, css_dst, css_text, changes, archive)
         if debug:
             tqdm.write(f"[assets] publish.css: {css_src} -> {css_dst}")
     else:
-        if css_dst.exists():
+        if archive is None and css_dst.exists():
             assert_in_publish_root(publish_root, css_dst)
+            if changes is not None: changes.record_deleted(css_dst)
             css_dst.unlink()
             if debug:
                 tqdm.write(f"[assets] removed stale publish.css at {css_dst}")
@@ -678,12 +2126,13 @@ def build_assets_from_script_dir(publish_root: Path, debug: bool=False, css_hois
     assert_in_publish_root(publish_root, js_dst)
     if js_src.is_file():
         js_text = _inline_js_once(js_src, inline_debug=debug)
-        js_dst.write_text(js_text, encoding="utf-8")
+        write_text_if_changed(publish_root, js_dst, js_text, changes, archive)
         if debug:
             tqdm.write(f"[assets] publish.js: {js_src} -> {js_dst}")
     else:
-        if js_dst.exists():
+        if archive is None and js_dst.exists():
             assert_in_publish_root(publish_root, js_dst)
+            if changes is not None: changes.record_deleted(js_dst)
             js_dst.unlink()
             if debug:
                 tqdm.write(f"[assets] removed stale publish.js at {js_dst}")
@@ -692,8 +2141,7 @@ def build_assets_from_script_dir(publish_root: Path, debug: bool=False, css_hois
     for logo in script_dir.glob("logo.*"):
         if logo.is_file():
             dst = publish_root / logo.name
-            assert_in_publish_root(publish_root, dst)
-            shutil.copy2(logo, dst)
+            copy_file_if_changed(publish_root, logo, dst, changes, archive)
             if debug:
                 tqdm.write(f"[assets] logo: {logo} -> {dst}")
 
@@ -702,8 +2150,7 @@ def build_assets_from_script_dir(publish_root: Path, debug: bool=False, css_hois
         src = script_dir / fav
         if src.exists() and src.is_file():
             dst = publish_root / fav
-            assert_in_publish_root(publish_root, dst)
-            shutil.copy2(src, dst)
+            copy_file_if_changed(publish_root, src, dst, changes, archive)
             if debug:
                 tqdm.write(f"[assets] Copied {fav} -> {dst.relative_to(publish_root)}")
 
@@ -718,24 +2165,29 @@ def safe_filename(name: str) -> str:
     return s
 
 # ================= Path transforms =================
-def apply_folderpath_rewrite(folder_posix: str, rules: list[tuple[re.Pattern,str]]) -> str:
+def apply_folderpath_rewrite(folder_posix: str, rules: list[tuple[re.Pattern,str]],
+                             profile: FilterProfile | None = None) -> str:
     """Apply ordered regex rewrites to the folder path string (posix, no leading slash)."""
     out = folder_posix
-    for rx, repl in rules:
-        out = rx.sub(repl, out)
+    if profile is not None and profile.enabled:
+        out = profile.run(out, rules, "folder")
+    else:
+        for rx, repl in rules:
+            out = rx.sub(repl, out)
     out = re.sub(r"/+", "/", out).strip("/")
     return out
 
 def transform_media_rel_path(rel: Path,
                              name_filters: list[tuple[re.Pattern,str]],
                              apply_to_names: bool,
-                             apply_to_dirs: bool) -> Path:
+                             apply_to_dirs: bool,
+                             profile: FilterProfile | None = None) -> Path:
     parts = list(rel.parts)
     new_parts = []
     for i, part in enumerate(parts):
         if i < len(parts) - 1:
             if apply_to_dirs:
-                base = apply_name_filters(part, name_filters, enabled=apply_to_dirs)
+                base = apply_name_filters(part, name_filters, enabled=apply_to_dirs, profile=profile)
                 base = safe_filename(base)
                 new_parts.append(base)
             else:
@@ -744,7 +2196,7 @@ def transform_media_rel_path(rel: Path,
             stem = Path(part).stem
             ext  = Path(part).suffix
             if apply_to_names:
-                stem = apply_name_filters(stem, name_filters, enabled=True)
+                stem = apply_name_filters(stem, name_filters, enabled=True, profile=profile)
                 stem = safe_filename(stem)
             new_parts.append(stem + ext)
     return Path(*new_parts)
@@ -785,7 +2237,7 @@ def _collapse_rel_path(base_rel_md: str, target_path: str) -> str:
     return '/'.join(stack)
 
 def _media_ref_key(current_rel_noext: str, raw_ref: str) -> str:
-    """Normalize a media reference into a lookup key used during rewrite."""
+    """Normalize a media reference into a lookup key used during rewrite (see _media_ref_folder)."""
     ref = (raw_ref or "").split("#", 1)[0].strip()
     if "/" in ref or "\\" in ref or ref.startswith((".", "..")):
         ref = _collapse_rel_path(current_rel_noext + ".md", ref)
@@ -793,6 +2245,13 @@ def _media_ref_key(current_rel_noext: str, raw_ref: str) -> str:
         ref = Path(ref).name
     return ref.lower()
 
+def _media_ref_folder(current_rel_noext: str) -> str:
+    """
+    Scope of media ref keys: a bare name resolves from the linking note's folder outwards, so notes in
+    different folders may mean different files by the same name ("" = vault root).
+    """
+    return current_rel_noext.rpartition('/')[0]
+
 def _resolve_note_newpath(target0: str,
                           current_rel_noext: str,
                           map_by_rel_noext: dict[str, str],
@@ -813,14 +2272,84 @@ def _resolve_note_newpath(target0: str,
     )
     return new_noext, True
 
+def _media_newrel(target: str, current_rel_noext: str, media_map_by_rel: dict[str, str],
+                  media_ref_to_newrel: dict[str, str]) -> str | None:
+    """New rel (under md_root_dir) of an embedded media target: ref-based mapping, then path-collapsed key."""
+    new_rel = media_ref_to_newrel.get(_media_ref_key(current_rel_noext, target))
+    if not new_rel:
+        t_for_rel = target
+        if '/' in target or '\\' in target or target.startswith(('.', '..')):
+            t_for_rel = _collapse_rel_path(current_rel_noext + ".md", target)
+        new_rel = media_map_by_rel.get(t_for_rel.lower())
+    return new_rel
+
+class LinkMemo:
+    """
+    Per-build memo of link-target resolution for the rewriters (the maps do not change during step 7).
+    Results depend on the linking note only through its folder: note targets only for path-like
+    targets, so those are keyed by (folder, target) and bare ones by the target alone; media targets
+    are always keyed by (folder, target) (media_ref_map is per folder). Bounded: the memo starts over
+    once it holds maxsize entries.
+    """
+    def __init__(self, note_map: dict[str, str], unique_stem_map: dict[str, str], media_exts: set[str],
+                 media_map: dict[str, str], media_ref_map: dict[str, dict[str, str]], maxsize: int=1 << 16):
+        self.note_map, self.unique_stem_map, self.media_exts = note_map, unique_stem_map, media_exts
+        self.media_map, self.media_ref_map = media_map, media_ref_map
+        self.maxsize = maxsize
+        self._notes: dict[tuple, tuple[str | None, bool]] = {}
+        self._media: dict[tuple, str | None] = {}
+        self.hits = {"note": 0, "media": 0}
+        self.misses = {"note": 0, "media": 0}
+
+    @staticmethod
+    def _key(target: str, current_rel_noext: str) -> tuple:
+        if '/' in target or '\\' in target or target.startswith('.'):
+            return (current_rel_noext.rpartition('/')[0], target)
+        return (None, target)
+
+    def note(self, target: str, current_rel_noext: str) -> tuple[str | None, bool]:
+        key = self._key(target, current_rel_noext)
+        hit = self._notes.get(key)
+        if hit is not None:
+            self.hits["note"] += 1
+            return hit
+        self.misses["note"] += 1
+        if len(self._notes) >= self.maxsize:
+            self._notes.clear()
+        hit = self._notes[key] = _resolve_note_newpath(target, current_rel_noext, self.note_map,
+                                                       self.unique_stem_map, self.media_exts)
+        return hit
+
+    def media(self, target: str, current_rel_noext: str) -> str | None:
+        folder = _media_ref_folder(current_rel_noext)
+        key = (folder, target)
+        if key in self._media:
+            self.hits["media"] += 1
+            return self._media[key]
+        self.misses["media"] += 1
+        if len(self._media) >= self.maxsize:
+            self._media.clear()
+        new_rel = self._media[key] = _media_newrel(target, current_rel_noext, self.media_map,
+                                                   self.media_ref_map.get(folder) or {})
+        return new_rel
+
+    def report(self) -> str:
+        parts = []
+        for kind in ("note", "media"):
+            n = self.hits[kind] + self.misses[kind]
+            parts.append(f"{kind} targets {n} lookups, {100.0 * self.hits[kind] / n if n else 0:.1f}% memo hits")
+        return "[links] " + "; ".join(parts)
+
 # ================= Link rewriting (wikilinks + md links) =================
-def rewrite_wikilinks(text: str, current_rel_noext: str,
+def wikilink_replacer(current_rel_noext: str,
                       map_note_relnoext_to_new_noext: dict[str, str],
                       map_by_unique_stem: dict[str, str],
                       MEDIA_EXTS:set[str],
                       media_map_by_rel: dict[str, str],
                       media_ref_to_newrel: dict[str, str],
-                      md_root_dir: str) -> str:
+                      md_root_dir: str,
+                      memo: LinkMemo | None = None):
+    """re.sub callback for WIKILINK_ALL (shared by the in-memory and streaming renderers)."""
     def _repl(m: re.Match):
         bang = m.group(1)
         inner = m.group(2)
@@ -832,16 +2361,11 @@ def rewrite_wikilinks(text: str, current_rel_noext: str,
             # ONLY rewrite EMBEDS
             if bang != "!":
                 return m.group(0)
-            # try ref-based mapping first (covers bare filenames)
-            ref_key = _media_ref_key(current_rel_noext, target0)
-            new_rel = media_ref_to_newrel.get(ref_key)
-            if not new_rel:
-                # fallback to path-collapsed key
-                t_for_rel = target0
-                if '/' in target0 or '\\' in target0 or target0.startswith(('.', '..')):
-                    t_for_rel = _collapse_rel_path(current_rel_noext + ".md", target0)
-                key = t_for_rel.lower()
-                new_rel = media_map_by_rel.get(key)
+            # ref-based mapping first (covers bare filenames), then the path-collapsed key
+            if memo is not None:
+                new_rel = memo.media(target0, current_rel_noext)
+            else:
+                new_rel = _media_newrel(target0, current_rel_noext, media_map_by_rel, media_ref_to_newrel)
             if new_rel:
                 rebuilt_left = f"{md_root_dir}/{new_rel}"
                 inner_new = rebuilt_left + (f"#{heading}" if heading else "")
@@ -849,10 +2373,13 @@ def rewrite_wikilinks(text: str, current_rel_noext: str,
                 return f"{bang}[[{inner_new}]]"
             return m.group(0)
 
-        new_noext, is_note = _resolve_note_newpath(
-            target0, current_rel_noext,
-            map_note_relnoext_to_new_noext, map_by_unique_stem, MEDIA_EXTS
-        )
+        if memo is not None:
+            new_noext, is_note = memo.note(target0, current_rel_noext)
+        else:
+            new_noext, is_note = _resolve_note_newpath(
+                target0, current_rel_noext,
+                map_note_relnoext_to_new_noext, map_by_unique_stem, MEDIA_EXTS
+            )
         if not is_note:
             return m.group(0)
         if new_noext:
@@ -864,15 +2391,17 @@ def rewrite_wikilinks(text: str, current_rel_noext: str,
                 return ""
             display = alias if alias else (target0 + (f"#{heading}" if heading else ""))
             return display
-    return WIKILINK_ALL.sub(_repl, text)
+    return _repl
 
-def rewrite_md_links(text: str, current_rel_noext: str,
+def md_link_replacer(current_rel_noext: str,
                      map_note_relnoext_to_new_noext: dict[str, str],
                      map_by_unique_stem: dict[str, str],
                      md_root_dir: str,
                      MEDIA_EXTS:set[str],
                      media_map_by_rel: dict[str, str],
-                     media_ref_to_newrel: dict[str, str]) -> str:
+                     media_ref_to_newrel: dict[str, str],
+                     memo: LinkMemo | None = None):
+    """re.sub callback for MD_LINK (shared by the in-memory and streaming renderers)."""
     def _repl(m: re.Match):
         bang  = m.group(1)
         label = m.group(2)
@@ -891,23 +2420,22 @@ def rewrite_md_links(text: str, current_rel_noext: str,
             if bang != "!":
                 return m.group(0)
             # try ref-based mapping first
-            ref_key = _media_ref_key(current_rel_noext, href_nohash)
-            new_rel = media_ref_to_newrel.get(ref_key)
-            if not new_rel:
-                t_for_rel = href_nohash
-                if '/' in href_nohash or '\\' in href_nohash or href_nohash.startswith(('.', '..')):
-                    t_for_rel = _collapse_rel_path(current_rel_noext + ".md", href_nohash)
-                key = t_for_rel.lower()
-                new_rel = media_map_by_rel.get(key)
+            if memo is not None:
+                new_rel = memo.media(href_nohash, current_rel_noext)
+            else:
+                new_rel = _media_newrel(href_nohash, current_rel_noext, media_map_by_rel, media_ref_to_newrel)
             if new_rel:
                 return f"{bang}[{label}]({md_root_dir}/{new_rel}{heading})"
             return m.group(0)
 
         target_noext = _strip_md_ext(href_nohash)
-        new_noext, is_note = _resolve_note_newpath(
-            target_noext, current_rel_noext,
-            map_note_relnoext_to_new_noext, map_by_unique_stem, MEDIA_EXTS
-        )
+        if memo is not None:
+            new_noext, is_note = memo.note(target_noext, current_rel_noext)
+        else:
+            new_noext, is_note = _resolve_note_newpath(
+                target_noext, current_rel_noext,
+                map_note_relnoext_to_new_noext, map_by_unique_stem, MEDIA_EXTS
+            )
         if not is_note:
             return m.group(0)
         if new_noext:
@@ -916,85 +2444,1407 @@ def rewrite_md_links(text: str, current_rel_noext: str,
             if bang:
                 return ""
             return label
-    return MD_LINK.sub(_repl, text)
+    return _repl
 
-# ================= Main =================
-def main():
-    ap = argparse.ArgumentParser()
-    ap.add_argument("--config", help="Path to YAML/JSON config (default: publish.build.yaml|yml|json if present)")
-    ap.add_argument("--vault", help="Override config.vault")
-    ap.add_argument("--publish", help="Override config.publish")
-    ap.add_argument("--dry-run", action="store_true", help="Force dry run (overrides config)")
-    ap.add_argument("--debug",   action="store_true", help="Force debug (overrides config)")
-    args = ap.parse_args()
+# ================= Streaming render for very large notes =================
+# Each stage (content filter, wikilinks, md links) runs re.sub-equivalent over a sliding buffer and
+# only commits output up to a line start before which every match attempt is already decided, i.e.
+# cannot depend on text not read yet. Output is byte-identical to the in-memory path.
+_NL = ord("\n")
+_NL_CATEGORIES = {"CATEGORY_SPACE", "CATEGORY_NOT_DIGIT", "CATEGORY_NOT_WORD", "CATEGORY_LINEBREAK"}
 
-    cfg = load_config(Path(args.config) if args.config else None)
+def _set_has_newline(items) -> bool:
+    neg = hit = False
+    for op, av in items:
+        name = str(op)
+        if name == "NEGATE":     neg = True
+        elif name == "LITERAL":  hit |= av == _NL
+        elif name == "RANGE":    hit |= av[0] <= _NL <= av[1]
+        elif name == "CATEGORY": hit |= str(av) in _NL_CATEGORIES
+        else:                    hit = True
+    return hit != neg
 
-    if args.vault:   cfg["vault"]   = args.vault
-    if args.publish: cfg["publish"] = args.publish
-    if args.dry_run: cfg["dry_run"] = True
-    if args.debug:   cfg["debug"]   = True
+def _pattern_reach(sub, flags: int) -> tuple[bool, int | None, int]:
+    """(can touch a newline, extra forward lookahead or None if unbounded, lookbehind width)."""
+    crosses, ahead, behind = False, 0, 0
+    def _merge(c, a, b):
+        nonlocal crosses, ahead, behind
+        crosses |= c
+        ahead = None if (ahead is None or a is None) else ahead + a
+        behind = max(behind, b)
+    for op, av in sub:
+        name = str(op)
+        if name == "LITERAL":       crosses |= av == _NL
+        elif name == "NOT_LITERAL": crosses |= av != _NL
+        elif name == "ANY":         crosses |= bool(flags & re.DOTALL)
+        elif name == "IN":          crosses |= _set_has_newline(av)
+        elif name in ("AT", "GROUPREF"):
+            pass
+        elif name in ("ASSERT", "ASSERT_NOT"):
+            direction, p = av
+            c, a, b = _pattern_reach(p, flags)
+            w = p.getwidth()[1]
+            if direction > 0:
+                _merge(c, None if (a is None or w >= _sre_parse.MAXREPEAT) else w + a, b)
+            else:
+                _merge(c, a, w + b)
+        elif name == "SUBPATTERN":
+            _merge(*_pattern_reach(av[-1], (flags | av[1]) & ~av[2]))
+        elif name == "BRANCH":
+            for p in av[1]:
+                _merge(*_pattern_reach(p, flags))
+        elif name in ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT"):
+            _merge(*_pattern_reach(av[2], flags))
+        elif name == "ATOMIC_GROUP":
+            _merge(*_pattern_reach(av, flags))
+        elif name == "GROUPREF_EXISTS":
+            for p in av[1:]:
+                if p is not None:
+                    _merge(*_pattern_reach(p, flags))
+        else:
+            crosses, ahead = True, None
+    return crosses, ahead, behind
+
+def _filter_horizon(rx: re.Pattern):
+    """
+    (horizon(buf) -> first undecided start, back-context length) for a content filter,
+    or None when a match could depend on arbitrarily distant text.
+    """
+    try:
+        parsed = _sre_parse.parse(rx.pattern, rx.flags)
+    except Exception:
+        return None
+    crosses, ahead, behind = _pattern_reach(parsed, parsed.state.flags)
+    hi = parsed.getwidth()[1]
+    bounded = ahead is not None and hi < _sre_parse.MAXREPEAT
+    if not bounded and (crosses or ahead is None):
+        return None
+    width = (hi + ahead + 2) if bounded else None
+
+    def horizon(buf: str) -> int:
+        h = 0
+        if width is not None:
+            h = len(buf) - width
+        if not crosses and ahead is not None:
+            # matches stay within one line: decided once a full line (plus one char) follows
+            nl = buf.rfind("\n", 0, len(buf) - 1)
+            h = max(h, nl + 1)
+        return h
+    return horizon, behind + 2
+
+def _wikilink_horizon(buf: str) -> int:
+    # [^\]]+ stops at the first ']': a start is decided once some ']' (with a following char) lies ahead
+    q = buf.rfind("]", 0, len(buf) - 1)
+    h = q - 1 if q >= 0 else 0
+    j = buf.find("[[", max(h - 1, 0))
+    return len(buf) - 3 if j < 0 else max(h, j - 1)
+
+def _md_link_horizon(buf: str) -> int:
+    # label is single-line; href runs to the first ')': decided for lines ending before the last ')'
+    r = buf.rfind(")")
+    h = buf.rfind("\n", 0, r) + 1 if r >= 0 else 0
+    j = buf.find("[", h)
+    return len(buf) - 2 if j < 0 else max(h, j - 1)
+
+class _StreamSub:
+    """Incremental, re.sub-equivalent substitution committing output at decided line starts."""
+
+    def __init__(self, rx: re.Pattern, repl, horizon, back: int, skip_code: bool=False):
+        self.rx, self.horizon, self.back = rx, horizon, back
+        self.expand = repl if callable(repl) else (lambda m, _t=repl: m.expand(_t))
+        self.ctx = ""       # already-committed input kept for lookbehind / ^ / \b
+        self.pending = ""   # uncommitted input
+        self.skip_code = skip_code
+        self.code_state = None  # markdown_skip_spans() state at the commit point (a line start)
+        self.matches = 0
+        self.seconds = 0.0
+
+    def feed(self, text: str, final: bool=False) -> str:
+        buf = self.ctx + self.pending + text
+        pos = len(self.ctx)
+        limit = len(buf) if final else min(self.horizon(buf), len(buf))
+        matches = []
+        if limit > pos or final:
+            for m in self.rx.finditer(buf, pos):
+                if m.start() >= limit and not final:
+                    break
+                matches.append(m)
+        if final:
+            cut = len(buf)
+        else:
+            cut = buf.rfind("\n", pos, max(limit, pos)) + 1
+            while matches and cut > pos:
+                m = matches[-1]
+                if m.start() >= cut:
+                    matches.pop()
+                elif m.end() > cut:
+                    cut = buf.rfind("\n", pos, m.start()) + 1
+                else:
+                    break
+            if cut <= pos:
+                self.pending = buf[pos:]
+                return ""
+        expand = self.expand
+        if self.skip_code and matches:
+            # spans past `cut` may be provisional (incomplete line) but no committed match starts there
+            spans, _ = markdown_skip_spans(buf[pos:], self.code_state)
+            expand = skipping(self.expand, SkipSpans([(a + pos, b + pos) for a, b in spans]))
+        if self.skip_code:
+            self.code_state = markdown_skip_spans(buf[pos:cut], self.code_state)[1]
+        out, last = [], pos
+        self.matches += len(matches)
+        for m in matches:
+            out.append(buf[last:m.start()])
+            out.append(expand(m))
+            last = m.end()
+        out.append(buf[last:cut])
+        self.ctx = buf[max(0, cut - self.back):cut]
+        self.pending = buf[cut:]
+        return "".join(out)
+
+def streaming_supported(regexes: list[tuple[re.Pattern, str]]) -> list[int]:
+    """Indexes of content filters whose matches are not bounded (these force the in-memory path)."""
+    return [i for i, (rx, _) in enumerate(regexes or []) if _filter_horizon(rx) is None]
+
+def render_note_streaming(src: Path, out, regexes: list[tuple[re.Pattern, str]],
+                          wikilink_repl, md_link_repl, chunk_chars: int=1 << 20,
+                          errors: str="strict", profile: FilterProfile | None = None,
+                          note: str | None = None, head: tuple[int, str] | None = None) -> None:
+    """
+    Stream src through filters + link rewriters into the text file object `out`.
+    head = (n, text) feeds text in place of the first n characters (projected frontmatter).
+    """
+    stages = []
+    for rx, repl in (regexes or []):
+        horizon, back = _filter_horizon(rx)
+        stages.append(_StreamSub(rx, repl, horizon, back))
+    stages.append(_StreamSub(WIKILINK_ALL, wikilink_repl, _wikilink_horizon, 2, skip_code=True))
+    stages.append(_StreamSub(MD_LINK, md_link_repl, _md_link_horizon, 2, skip_code=True))
+    n_filters = len(regexes or [])
+    timed = profile is not None and profile.active
+    with open(src, "r", encoding="utf-8", errors=errors) as f:
+        if head is not None and head[0]:
+            f.read(head[0])
+            chunk = head[1] + f.read(chunk_chars)
+        else:
+            chunk = f.read(chunk_chars)
+        while True:
+            final = not chunk
+            for i, st in enumerate(stages):
+                if timed and i < n_filters:
+                    t0 = time.perf_counter()
+                    chunk = st.feed(chunk, final)
+                    st.seconds += time.perf_counter() - t0
+                else:
+                    chunk = st.feed(chunk, final)
+            if chunk:
+                out.write(chunk)
+            if final:
+                break
+            chunk = f.read(chunk_chars)
+    if timed:
+        elapsed = 0.0
+        for st in stages[:n_filters]:
+            profile.add(st.rx, "body", st.seconds, st.matches)
+            elapsed += st.seconds
+            if profile.check_budget(st.rx, note, elapsed, st.seconds):
+                break
+
+# ================= Gallery thumbnails (for js/image-lightbox.js) =================
+THUMB_SRC_EXTS = {".png", ".jpg", ".jpeg", ".jpe", ".webp", ".gif", ".bmp", ".tiff", ".tif"}
+_THUMB_FORMATS = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+
+def _make_thumbnail(src: str, dst: str, max_px: int, fmt: str, quality: int) -> str:
+    """Process-pool worker: write a thumbnail of src (longest side <= max_px) to dst."""
+    with Image.open(src) as im:
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail((max_px, max_px))
+        if fmt == "jpeg" and im.mode not in ("RGB", "L"):
+            im = im.convert("RGB")
+        tmp = dst + ".tmp"
+        im.save(tmp, format=fmt.upper(), quality=quality, optimize=True)
+    os.replace(tmp, dst)
+    return dst
+
+def build_thumbnails(publish_root: Path, md_root_dir: str, media: dict[Path, str], tcfg: dict,
+                     dry: bool=False, debug: bool=False, changes: ChangeSet | None = None,
+                     archive: ArchiveOutput | None = None) -> set[Path]:
+    """
+    Generate small thumbnails for embedded images into <md_root_dir>/<dir>/ plus a thumbs.json map
+    ({"<md_root_dir>/<media>": "<md_root_dir>/<dir>/<hash>-<max_px>-q<quality>.<ext>"}). Thumbnails are
+    named by source hash and every encoding parameter, so unchanged images are never re-encoded and a
+    changed setting re-encodes all of them (with an archive they are encoded in a temp dir).
+    thumbs.json also keeps each source's size+mtime and hash, so unchanged sources are not re-read.
+    Returns the output paths to keep.
+    """
+    if Image is None:
+        tqdm.write("[thumbs] Pillow not installed; skipping thumbnail generation")
+        return set()
+    max_px  = int(tcfg.get("max_px", 320))
+    fmt     = str(tcfg.get("format", "jpeg")).lower()
+    quality = int(tcfg.get("quality", 72))
+    if fmt not in _THUMB_FORMATS:
+        raise ValueError(f"thumbnails.format must be one of {sorted(_THUMB_FORMATS)}")
+    thumb_dir_rel = f"{md_root_dir}/{str(tcfg.get('dir', '_thumbs')).strip('/')}"
+    thumb_dir = publish_root / thumb_dir_rel
+    work_dir = Path(tempfile.mkdtemp(prefix="publish-thumbs-")) if archive is not None and not dry else thumb_dir
+
+    map_dst = thumb_dir / "thumbs.json"
+    prev_sources: dict[str, list] = {}
+    if archive is None:
+        try:
+            prev_sources = json.loads(map_dst.read_text(encoding="utf-8")).get("sources") or {}
+        except (OSError, ValueError, AttributeError):
+            pass
+
+    thumbs: dict[str, str] = {}
+    sources: dict[str, list] = {}
+    pending: list[tuple[str, str]] = []
+    keep: set[Path] = set()
+    for src, new_rel in sorted(media.items()):
+        if src.suffix.lower() not in THUMB_SRC_EXTS:
+            continue
+        key = f"{md_root_dir}/{new_rel}"
+        st = src.stat()
+        prev = prev_sources.get(key)
+        if isinstance(prev, list) and len(prev) == 3 and prev[:2] == [st.st_size, st.st_mtime_ns]:
+            digest = prev[2]
+        else:
+            digest = _sha256_file(src)[:20]
+        sources[key] = [st.st_size, st.st_mtime_ns, digest]
+        name = f"{digest}-{max_px}-q{quality}{_THUMB_FORMATS[fmt]}"
+        dst = thumb_dir / name
+        thumbs[key] = f"{thumb_dir_rel}/{name}"
+        keep.add(dst)
+        if not (work_dir / name).is_file():
+            pending.append((str(src), str(work_dir / name)))
+
+    if dry:
+        tqdm.write(f"[dry] thumbnails: {len(thumbs)} mapped, {len(pending)} to generate under {thumb_dir_rel}/")
+        return keep
+
+    if pending:
+        assert_in_publish_root(publish_root, thumb_dir)
+        work_dir.mkdir(parents=True, exist_ok=True)
+        jobs = int(tcfg.get("jobs", 0)) or None
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            futs = {pool.submit(_make_thumbnail, s, d, max_px, fmt, quality): s for s, d in pending}
+            for fut in tqdm(as_completed(futs), total=len(futs), desc="Thumbnails", unit="img"):
+                try:
+                    fut.result()
+                except Exception as e:
+                    tqdm.write(f"[thumbs] Could not thumbnail {futs[fut]}: {e}")
+    generated = {d for _, d in pending}
+    for dst in sorted(keep):
+        out = work_dir / dst.name
+        if not out.is_file():
+            keep.discard(dst)
+            failed = {k for k, v in thumbs.items() if v == f"{thumb_dir_rel}/{dst.name}"}
+            thumbs = {k: v for k, v in thumbs.items() if k not in failed}
+            sources = {k: v for k, v in sources.items() if k not in failed}
+        elif archive is not None:
+            archive.add_file(dst, out)
+        elif changes is not None:
+            # content-addressed: an existing file with this name already holds these bytes
+            changes.record(dst, "added" if str(dst) in generated else "unchanged", changes.cached_hash(dst))
+    if work_dir != thumb_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    payload = {"version": 1, "max_px": max_px, "thumbs": thumbs, "sources": sources}
+    write_text_if_changed(publish_root, map_dst, json.dumps(payload, indent=1, ensure_ascii=False) + "\n",
+                          changes, archive)
+    keep.add(map_dst)
+    if debug:
+        tqdm.write(f"[thumbs] {len(thumbs)} thumbnails ({len(pending)} generated) -> {thumb_dir_rel}/")
+    return keep
+
+# ================= Image metadata sidecar (dimensions, orientation, EXIF time + GPS) =================
+IMAGE_META_VERSION = 1
+IMAGE_META_EXTS = {".png", ".jpg", ".jpeg", ".jpe", ".webp", ".gif", ".bmp", ".tiff", ".tif"}
+_TIFF_TYPES = {1: (1, "B"), 2: (1, "s"), 3: (2, "H"), 4: (4, "I"), 5: (8, "II"), 7: (1, "B"),
+               9: (4, "i"), 10: (8, "ii")}
+_EXIF_DATETIME = re.compile(r"(\d{4}):(\d\d):(\d\d)[ T](\d\d):(\d\d):(\d\d)")
+_TIFF_MAX_ENTRIES = 512
+
+def _user_cache_dir() -> Path:
+    return Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache") / "publish-build"
+
+def _tiff_ifd(f, base: int, offset: int, endian: str) -> tuple[dict[int, object], int]:
+    """Tags of the IFD at base+offset (values decoded) and the offset of the next IFD."""
+    f.seek(base + offset)
+    raw = f.read(2)
+    if len(raw) < 2:
+        return {}, 0
+    n = min(struct.unpack(endian + "H", raw)[0], _TIFF_MAX_ENTRIES)
+    entries = f.read(n * 12)
+    nxt = f.read(4)
+    tags: dict[int, object] = {}
+    for i in range(len(entries) // 12):
+        tag, typ, count, value = struct.unpack_from(endian + "HHI4s", entries, i * 12)
+        if typ not in _TIFF_TYPES or count > 4096:
+            continue
+        size, fmt = _TIFF_TYPES[typ]
+        data = value
+        if size * count > 4:
+            f.seek(base + struct.unpack(endian + "I", value)[0])
+            data = f.read(size * count)
+            if len(data) < size * count:
+                continue
+        if typ == 2:
+            tags[tag] = data[:count].split(b"\0", 1)[0].decode("ascii", "replace").strip()
+        elif typ in (5, 10):
+            nums = struct.unpack(f"{endian}{2 * count}{fmt[0]}", data[:size * count])
+            tags[tag] = tuple(nums[j] / nums[j + 1] if nums[j + 1] else 0.0 for j in range(0, len(nums), 2))
+        else:
+            tags[tag] = struct.unpack(f"{endian}{count}{fmt}", data[:size * count])
+    return tags, (struct.unpack(endian + "I", nxt)[0] if len(nxt) == 4 else 0)
+
+def _parse_tiff(f, base: int=0, sizes: bool=False) -> dict:
+    """Orientation, capture time, GPS (and with sizes, the pixel size) from a TIFF/EXIF structure at base."""
+    f.seek(base)
+    head = f.read(8)
+    if head[:4] not in (b"II*\0", b"MM\0*"):
+        return {}
+    endian = "<" if head[:2] == b"II" else ">"
+    ifd0, _ = _tiff_ifd(f, base, struct.unpack(endian + "I", head[4:])[0], endian)
+    exif = _tiff_ifd(f, base, ifd0[0x8769][0], endian)[0] if 0x8769 in ifd0 else {}
+    gps = _tiff_ifd(f, base, ifd0[0x8825][0], endian)[0] if 0x8825 in ifd0 else {}
+
+    out: dict = {}
+    if sizes and 0x100 in ifd0 and 0x101 in ifd0:
+        out["w"], out["h"] = ifd0[0x100][0], ifd0[0x101][0]
+    if 0x112 in ifd0:
+        out["orientation"] = ifd0[0x112][0]
+    m = _EXIF_DATETIME.match(str(exif.get(0x9003) or ifd0.get(0x132) or ""))
+    if m and m.group(1) != "0000":
+        out["taken"] = "{}-{}-{}T{}:{}:{}".format(*m.groups()) + str(exif.get(0x9011) or "")
+    lat, lon = gps.get(2), gps.get(4)
+    if lat and lon and len(lat) == 3 and len(lon) == 3:
+        lat = (lat[0] + lat[1] / 60 + lat[2] / 3600) * (-1 if str(gps.get(1)).upper() == "S" else 1)
+        lon = (lon[0] + lon[1] / 60 + lon[2] / 3600) * (-1 if str(gps.get(3)).upper() == "W" else 1)
+        if (lat or lon) and abs(lat) <= 90 and abs(lon) <= 180:
+            out["gps"] = [round(lat, 6), round(lon, 6)]
+    return out
+
+def _jpeg_meta(f) -> dict:
+    out: dict = {}
+    seen_exif = False
+    f.seek(2)
+    while True:
+        b = f.read(1)
+        while b == b"\xff":           # fill bytes
+            b = f.read(1)
+        if not b:
+            return out
+        marker = b[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue                  # standalone markers
+        if marker in (0xD9, 0xDA):    # end of image / start of scan: no more headers
+            return out
+        seg_len = struct.unpack(">H", f.read(2))[0]
+        start = f.tell()
+        if marker == 0xE1 and not seen_exif and f.read(6) == b"Exif\0\0":
+            seen_exif = True          # the first APP1 Exif segment; later APP1s are XMP etc.
+            out.update(_parse_tiff(f, start + 6))
+        elif 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            _, h, w = struct.unpack(">BHH", f.read(5))
+            out["w"], out["h"] = w, h
+        f.seek(start + seg_len - 2)
+
+def _png_meta(f) -> dict:
+    head = f.read(24)
+    out = {"w": struct.unpack(">I", head[16:20])[0], "h": struct.unpack(">I", head[20:24])[0]}
+    f.seek(8)
+    while True:                       # ancillary chunks before the image data (eXIf is optional)
+        hdr = f.read(8)
+        if len(hdr) < 8 or hdr[4:] in (b"IDAT", b"IEND"):
+            return out
+        n = struct.unpack(">I", hdr[:4])[0]
+        if hdr[4:] == b"eXIf":
+            return {**out, **_parse_tiff(io.BytesIO(f.read(n)))}
+        f.seek(n + 4, os.SEEK_CUR)
+
+def _webp_meta(f) -> dict:
+    out: dict = {}
+    f.seek(12)
+    while True:
+        hdr = f.read(8)
+        if len(hdr) < 8:
+            return out
+        kind, n = hdr[:4], struct.unpack("<I", hdr[4:])[0]
+        start = f.tell()
+        if kind == b"VP8X":
+            d = f.read(10)
+            out["w"] = 1 + int.from_bytes(d[4:7], "little")
+            out["h"] = 1 + int.from_bytes(d[7:10], "little")
+            if not d[0] & 0x08:       # no EXIF chunk announced
+                return out
+        elif kind == b"VP8 " and "w" not in out:
+            d = f.read(10)
+            out["w"], out["h"] = (struct.unpack("<H", d[6:8])[0] & 0x3FFF, struct.unpack("<H", d[8:10])[0] & 0x3FFF)
+            return out
+        elif kind == b"VP8L" and "w" not in out:
+            bits = int.from_bytes(f.read(5)[1:], "little")
+            out["w"], out["h"] = (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+            return out
+        elif kind == b"EXIF":
+            data = f.read(n)
+            return {**out, **_parse_tiff(io.BytesIO(data[6:] if data.startswith(b"Exif\0\0") else data))}
+        f.seek(start + n + (n & 1))   # chunks are padded to even sizes
+
+def read_image_meta(path: Path) -> dict | None:
+    """
+    {w, h[, orientation, taken, gps]} from the file headers only (no pixel decode); w/h are as
+    displayed, i.e. swapped for EXIF orientations 5-8. None for unknown or unreadable images.
+    """
+    try:
+        with open(path, "rb") as f:
+            sig = f.read(12)
+            f.seek(0)
+            if sig[:3] == b"\xff\xd8\xff":
+                meta = _jpeg_meta(f)
+            elif sig[:8] == b"\x89PNG\r\n\x1a\n":
+                meta = _png_meta(f)
+            elif sig[:6] in (b"GIF87a", b"GIF89a"):
+                w, h = struct.unpack("<HH", sig[6:10])
+                meta = {"w": w, "h": h}
+            elif sig[:4] == b"RIFF" and sig[8:12] == b"WEBP":
+                meta = _webp_meta(f)
+            elif sig[:2] == b"BM":
+                w, h = struct.unpack("<ii", f.read(26)[18:26])
+                meta = {"w": w, "h": abs(h)}
+            elif sig[:4] in (b"II*\0", b"MM\0*"):
+                meta = _parse_tiff(f, sizes=True)
+            else:
+                return None
+    except (OSError, struct.error, ValueError):
+        return None
+    if not meta.get("w") or not meta.get("h"):
+        return None
+    if meta.get("orientation", 1) in (5, 6, 7, 8):
+        meta["w"], meta["h"] = meta["h"], meta["w"]
+    out = {"w": meta["w"], "h": meta["h"]}
+    if meta.get("orientation", 1) != 1:
+        out["orientation"] = meta["orientation"]
+    out.update((k, meta[k]) for k in ("taken", "gps") if k in meta)
+    return out
+
+class ImageMetaCache:
+    """
+    Extracted metadata keyed by content hash, in the user cache dir. A (size, mtime_ns) stamp per
+    source path avoids re-hashing unchanged images, so a warm build neither hashes nor opens them.
+    The file is shared by every target and vault, so save() drops only the stamps of sources that no
+    longer exist (renamed or deleted images) and the metadata no stamp points to any more.
+    """
+    def __init__(self, path: Path | None = None):
+        self.path = path or _user_cache_dir() / "image-meta.json"
+        self.by_hash: dict[str, dict | None] = {}
+        self.stamps: dict[str, list] = {}
+        self.touched: set[str] = set()
+        self.dirty = False
+        try:
+            data = json.loads(self.path.read_text(encoding="utf-8"))
+            if data.get("version") == IMAGE_META_VERSION:
+                self.by_hash, self.stamps = data.get("by_hash") or {}, data.get("stamps") or {}
+        except (OSError, ValueError):
+            pass
+
+    def get(self, src: Path) -> dict | None:
+        st = src.stat()
+        key = str(src)
+        self.touched.add(key)
+        stamp = self.stamps.get(key)
+        if stamp and stamp[0] == st.st_size and stamp[1] == st.st_mtime_ns and stamp[2] in self.by_hash:
+            return self.by_hash[stamp[2]]
+        digest = _sha256_file(src)
+        self.stamps[key] = [st.st_size, st.st_mtime_ns, digest]
+        if digest not in self.by_hash:
+            self.by_hash[digest] = read_image_meta(src)
+        self.dirty = True
+        return self.by_hash[digest]
+
+    def save(self):
+        gone = [k for k in self.stamps if k not in self.touched and not os.path.isfile(k)]
+        if gone:
+            for k in gone:
+                del self.stamps[k]
+            self.dirty = True
+        live = {stamp[2] for stamp in self.stamps.values()}
+        if set(self.by_hash) != live:
+            self.by_hash = {h: m for h, m in self.by_hash.items() if h in live}
+            self.dirty = True
+        if not self.dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps({"version": IMAGE_META_VERSION, "by_hash": self.by_hash,
+                                       "stamps": self.stamps}, separators=(",", ":")), encoding="utf-8")
+            os.replace(tmp, self.path)
+        except OSError as e:
+            tqdm.write(f"[images] could not save {self.path}: {e}")
+
+def image_meta_rel(md_root_dir: str, icfg: dict) -> str:
+    return f"{md_root_dir}/{str(icfg.get('file') or '_media/meta.json').strip('/')}"
+
+def write_image_meta(plan: dict, changes: ChangeSet | None = None, archive: ArchiveOutput | None = None,
+                     debug: bool=False) -> Path:
+    """Sidecar {"<md_root_dir>/<media>": {w, h, ...}} for the embedded images (read by js/image-meta.js)."""
+    publish_root = Path(plan["publish_root"])
+    vault_root = Path(plan["vault_root"])
+    md_root_dir = plan["md_root_dir"]
+    cache = ImageMetaCache()
+    images: dict[str, dict] = {}
+    for rel, new_rel in sorted(plan["embedded"].items()):
+        if PurePosixPath(rel).suffix.lower() not in IMAGE_META_EXTS:
+            continue
+        try:
+            meta = cache.get(vault_root / rel)
+        except OSError:
+            continue
+        if meta:
+            images[f"{md_root_dir}/{new_rel}"] = meta
+    cache.save()
+    dst = publish_root / image_meta_rel(md_root_dir, plan["config"].get("image_meta") or {})
+    write_text_if_changed(publish_root, dst, json.dumps({"version": IMAGE_META_VERSION, "images": images},
+                                                        ensure_ascii=False, separators=(",", ":")),
+                          changes, archive)
+    if debug:
+        tqdm.write(f"[images] metadata for {len(images)} images -> {dst.relative_to(publish_root)}")
+    return dst
+
+# ================= Search index (for js/search-index.js) =================
+SEARCH_INDEX_VERSION = 1
+_SEARCH_TOKEN = re.compile(r"\w+")
+_SEARCH_HTML  = re.compile(r"<[^>]+>|&(?:#\d+|#[xX][0-9a-fA-F]+|\w+);|https?://\S+")
+# build-time date banner / map blocks (one line each): rendered from frontmatter, not note text
+_SEARCH_STATIC = re.compile(r"^<div\b[^>\n]*\bdata-publish-static\b[^\n]*", re.M)
+
+def _search_link_text(m: re.Match) -> str:
+    inner = m.group(2)
+    if "|" in inner:
+        return inner.split("|", 1)[1]
+    return PurePosixPath(inner.split("#", 1)[0]).stem
+
+class SearchIndex:
+    """
+    Inverted index over rendered notes, so nothing a content filter removed can be found:
+      docs:     [[slug, title, length], ...] sorted by slug; a doc id is its position
+      postings: {term: [id, tf, id_delta, tf, ...]} with ascending, delta-encoded doc ids
+    Terms are NFC-normalized and case-folded. Link targets, URLs, HTML tags and entities and the
+    static date/map blocks are not indexed.
+    """
+    def __init__(self, md_root_dir: str, scfg: dict):
+        self.md_root_dir = md_root_dir
+        self.min_len = int(scfg.get("min_token_len", 2))
+        self.max_len = int(scfg.get("max_token_len", 32))
+        self.title_boost = int(scfg.get("title_boost", 5))
+        self.stopwords = {nfc_cf(w) for w in (scfg.get("stopwords") or [])}
+        self.docs: dict[str, tuple[str, dict[str, int]]] = {}
+        self._lock = threading.Lock()
+
+    def tokens(self, text: str) -> list[str]:
+        text = _SEARCH_HTML.sub(" ", _SEARCH_STATIC.sub(" ", text))
+        text = WIKILINK_ALL.sub(_search_link_text, text)
+        text = MD_LINK.sub(lambda m: m.group(2), text)
+        return [t for t in _SEARCH_TOKEN.findall(nfc_cf(text))
+                if self.min_len <= len(t) <= self.max_len and t not in self.stopwords]
+
+    def _add(self, slug: str, fm: dict, counts: Counter):
+        title = fm.get("title") if isinstance(fm.get("title"), str) else PurePosixPath(slug).name
+        for t in self.tokens(title):
+            counts[t] += self.title_boost
+        with self._lock:
+            self.docs[slug] = (title, dict(counts))
+
+    def add_text(self, slug: str, content: str):
+        fm, body = parse_frontmatter_text(content)
+        self._add(slug, fm, Counter(self.tokens(body)))
+
+    def add_file(self, slug: str, path: Path):
+        """Index a rendered file line by line (for notes too large to hold in memory)."""
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            head = f.read(1 << 16) + f.readline()
+            fm, body = parse_frontmatter_text(head)
+            counts = Counter(self.tokens(body))
+            for line in f:
+                counts.update(self.tokens(line))
+        self._add(slug, fm, counts)
+
+    def partial(self) -> dict:
+        return {slug: [title, counts] for slug, (title, counts) in sorted(self.docs.items())}
+
+    def absorb(self, partial: dict):
+        with self._lock:
+            for slug, (title, counts) in partial.items():
+                self.docs[slug] = (title, counts)
+
+    def to_dict(self) -> dict:
+        slugs = sorted(self.docs)
+        postings: dict[str, list[int]] = defaultdict(list)
+        last: dict[str, int] = {}
+        docs = []
+        for doc_id, slug in enumerate(slugs):
+            title, counts = self.docs[slug]
+            docs.append([slug, title, sum(counts.values())])
+            for term in sorted(counts):
+                postings[term] += [doc_id - last.get(term, 0), counts[term]]
+                last[term] = doc_id
+        return {
+            "version": SEARCH_INDEX_VERSION,
+            "md_root_dir": self.md_root_dir,
+            "docs": docs,
+            "postings": {t: postings[t] for t in sorted(postings)},
+        }
+
+def write_search_index(plan: dict, index: SearchIndex, changes: ChangeSet | None = None,
+                       archive: ArchiveOutput | None = None, debug: bool=False):
+    publish_root = Path(plan["publish_root"])
+    dst = publish_root / search_index_rel(plan["md_root_dir"], plan["config"].get("search") or {})
+    payload = index.to_dict()
+    # compact separators: the client downloads this once per visit
+    write_text_if_changed(publish_root, dst, json.dumps(payload, ensure_ascii=False, separators=(",", ":")),
+                          changes, archive)
+    if debug:
+        tqdm.write(f"[search] {len(payload['docs'])} notes, {len(payload['postings'])} terms -> {dst.relative_to(publish_root)}")
+
+def search_index_rel(md_root_dir: str, scfg: dict) -> str:
+    return f"{md_root_dir}/{str(scfg.get('file') or '_search/index.json').strip('/')}"
+
+# ================= Prefetch map (for js/next-previous-story.js) =================
+PREFETCH_VERSION = 1
+_NATURAL = re.compile(r"(\d+)")
+
+def _natural_key(name: str) -> list:
+    return [(0, int(t), t) if t.isdigit() else (1, 0, t) for t in _NATURAL.split(name.casefold()) if t]
+
+def reading_order_key(dst: str) -> list:
+    """Sidebar order of a published path: folders before notes at every level, natural case-insensitive names."""
+    parts = PurePosixPath(dst).with_suffix("").parts
+    return [(i == len(parts) - 1, _natural_key(seg)) for i, seg in enumerate(parts)]
+
+def prefetch_map(plan: dict) -> dict:
+    """
+    {slug: {prev, next, hero}} for every rendered note: its neighbours in reading order (the order
+    of the published file tree) and the first image it references, as a path under md_root_dir.
+    """
+    dst_by_src = {op["src"]: op["dst"] for op in plan["ops"] if op["op"] in ("render", "copy")}
+    notes = sorted((n for n in plan["notes"] if n in dst_by_src), key=lambda n: reading_order_key(dst_by_src[n]))
+    slugs = [dst_by_src[n][:-3] for n in notes]
+    out: dict[str, dict] = {}
+    for i, note in enumerate(notes):
+        hero = next((dst_by_src[hit] for _, hit in plan["refs"].get(note, [])
+                     if hit in dst_by_src and media_kind(hit) == "image"), None)
+        out[slugs[i]] = {"prev": slugs[i - 1] if i > 0 else None,
+                         "next": slugs[i + 1] if i + 1 < len(slugs) else None,
+                         "hero": hero}
+    return out
+
+def prefetch_rel(md_root_dir: str, pcfg: dict) -> str:
+    return f"{md_root_dir}/{str(pcfg.get('file') or '_nav/prefetch.json').strip('/')}"
+
+def write_prefetch_map(plan: dict, changes: ChangeSet | None = None, archive: ArchiveOutput | None = None,
+                       debug: bool=False) -> Path:
+    publish_root = Path(plan["publish_root"])
+    dst = publish_root / prefetch_rel(plan["md_root_dir"], plan["config"].get("prefetch") or {})
+    notes = prefetch_map(plan)
+    write_text_if_changed(publish_root, dst, json.dumps({"version": PREFETCH_VERSION, "md_root_dir": plan["md_root_dir"],
+                                                         "notes": notes}, ensure_ascii=False, separators=(",", ":")),
+                          changes, archive)
+    if debug:
+        tqdm.write(f"[prefetch] {len(notes)} notes, {sum(1 for v in notes.values() if v['hero'])} with a hero image"
+                   f" -> {dst.relative_to(publish_root)}")
+    return dst
+
+# ================= Vault index snapshot (fast cold start) =================
+# Binary, little-endian, memory-mapped on load:
+#   header   magic, version, flags, #dirs, #files, pool size, created_ns, vault root (pool ref)
+#   dirs     path, mtime_ns, first file, file count             — sorted by path
+#   files    dir, name, casefolded name, casefolded stem, mtime_ns, size, flags — sorted by (dir, name)
+#   pool     UTF-8 strings; each distinct string is stored once and referenced as (offset, length)
+VAULT_INDEX_VERSION = 1
+_VIDX_MAGIC = b"PBVX"
+_VIDX_HEADER = struct.Struct("<4sHHIIQqII")
+_VIDX_DIR = struct.Struct("<IIqII")
+_VIDX_FILE = struct.Struct("<IIIIIIIqQB")
+_VIDX_HIDDEN = 1     # header flag: hidden entries were listed
+_VIDX_MD = 1         # file flag: *.md
+# a directory modified this close to the snapshot may have changed again within the same mtime tick
+_VIDX_RACY_NS = 2_000_000_000
+
+def vault_index_path(cfg: dict) -> Path | None:
+    """Snapshot location for config.vault_index ("auto" = per-vault file in the user cache dir)."""
+    v = cfg.get("vault_index")
+    if not v:
+        return None
+    if v != "auto":
+        return Path(v).expanduser()
+    key = hashlib.sha1(str(Path(cfg["vault"]).resolve()).encode("utf-8")).hexdigest()[:16]
+    return _user_cache_dir() / f"vault-{key}.idx"
+
+class VaultIndex:
+    """
+    Listing of every file under the vault (hidden entries only with include_hidden), keyed by directory.
+    load() maps a saved snapshot; refresh() stats each known directory and re-lists only those whose
+    mtime moved, so a cold start costs one stat per directory instead of a full walk.
+    """
+    def __init__(self, vault_root: Path, include_hidden: bool):
+        self.vault_root = vault_root
+        self.include_hidden = include_hidden
+        # dir rel ("" = vault root) -> [mtime_ns, files, subdirs]; files is a list of
+        # (name, name_cf, stem_cf, mtime_ns, size) or a (first, count) range into the mapped snapshot
+        self.dirs: dict[str, list] = {}
+        self.created_ns = 0
+        self.relisted = 0
+        self._mm = None
+
+    # ---- snapshot I/O ----
+    @classmethod
+    def load(cls, path: Path | None, vault_root: Path, include_hidden: bool, debug: bool=False) -> "VaultIndex":
+        """Map the snapshot at path; an empty index (= full walk on refresh) if missing or inconsistent."""
+        idx = cls(vault_root, include_hidden)
+        if path is None or not path.is_file():
+            return idx
+        try:
+            with open(path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            idx._read(mm)
+        except (OSError, ValueError, struct.error, UnicodeDecodeError) as e:
+            tqdm.write(f"[index] snapshot {path} unusable ({e}); walking the vault")
+            idx.dirs.clear()
+            idx._mm = None
+            return idx
+        if debug:
+            tqdm.write(f"[index] mapped {path}: {len(idx.dirs)} dirs")
+        return idx
+
+    def _read(self, mm):
+        magic, version, flags, n_dirs, n_files, pool_len, created_ns, root_off, root_len = \
+            _VIDX_HEADER.unpack_from(mm, 0)
+        if magic != _VIDX_MAGIC or version != VAULT_INDEX_VERSION:
+            raise ValueError("not a vault index or an older version")
+        files_at = _VIDX_HEADER.size + n_dirs * _VIDX_DIR.size
+        pool_at = files_at + n_files * _VIDX_FILE.size
+        if pool_at + pool_len != len(mm):
+            raise ValueError("truncated")
+        if bool(flags & _VIDX_HIDDEN) != self.include_hidden:
+            raise ValueError("include_hidden differs")
+
+        def s(off, n):
+            if off + n > pool_len:
+                raise ValueError("string out of range")
+            return str(mm[pool_at + off:pool_at + off + n], "utf-8")
+
+        if s(root_off, root_len) != str(self.vault_root):
+            raise ValueError("different vault")
+        dirs = {}
+        for i in range(n_dirs):
+            p_off, p_len, mtime, first, count = _VIDX_DIR.unpack_from(mm, _VIDX_HEADER.size + i * _VIDX_DIR.size)
+            if first + count > n_files:
+                raise ValueError("file range out of bounds")
+            dirs[s(p_off, p_len)] = [mtime, (first, count), []]
+        for rel in dirs:
+            if rel:
+                parent = rel.rpartition("/")[0]
+                if parent not in dirs:
+                    raise ValueError(f"orphan directory {rel!r}")
+                dirs[parent][2].append(rel)
+        if "" not in dirs:
+            raise ValueError("no root directory")
+        self.dirs, self.created_ns, self._mm = dirs, created_ns, mm
+        self._files_at, self._pool_at, self._pool_len = files_at, pool_at, pool_len
+
+    def _snapshot_files(self, first: int, count: int) -> list[tuple]:
+        mm, pool = self._mm, self._pool_at
+        out = []
+        for i in range(first, first + count):
+            _, n_off, n_len, c_off, c_len, t_off, t_len, mtime, size, _ = \
+                _VIDX_FILE.unpack_from(mm, self._files_at + i * _VIDX_FILE.size)
+            if max(n_off + n_len, c_off + c_len, t_off + t_len) > self._pool_len:
+                raise ValueError("string out of range")
+            out.append((str(mm[pool + n_off:pool + n_off + n_len], "utf-8"),
+                        str(mm[pool + c_off:pool + c_off + c_len], "utf-8"),
+                        str(mm[pool + t_off:pool + t_off + t_len], "utf-8"), mtime, size))
+        return out
+
+    def save(self, path: Path):
+        pool = bytearray()
+        interned: dict[str, tuple[int, int]] = {}
+
+        def ref(text: str) -> tuple[int, int]:
+            r = interned.get(text)
+            if r is None:
+                b = text.encode("utf-8")
+                r = interned[text] = (len(pool), len(b))
+                pool.extend(b)
+            return r
+
+        root_ref = ref(str(self.vault_root))
+        dir_recs, file_recs = bytearray(), bytearray()
+        n_files = 0
+        for d, rel in enumerate(sorted(self.dirs)):
+            files = sorted(self.files_in(rel))
+            dir_recs += _VIDX_DIR.pack(*ref(rel), self.dirs[rel][0], n_files, len(files))
+            for name, name_cf, stem_cf, mtime, size in files:
+                file_recs += _VIDX_FILE.pack(d, *ref(name), *ref(name_cf), *ref(stem_cf), mtime, size,
+                                             _VIDX_MD if name.endswith(".md") else 0)
+            n_files += len(files)
+        header = _VIDX_HEADER.pack(_VIDX_MAGIC, VAULT_INDEX_VERSION, _VIDX_HIDDEN if self.include_hidden else 0,
+                                   len(self.dirs), n_files, len(pool), self.created_ns, *root_ref)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(header); f.write(dir_recs); f.write(file_recs); f.write(pool)
+        os.replace(tmp, path)
+
+    # ---- listing ----
+    def files_in(self, rel: str) -> list[tuple]:
+        """(name, name_cf, stem_cf, mtime_ns, size) for each file directly in dir rel ("" = vault root)."""
+        entry = self.dirs.get(rel)
+        if entry is None:
+            return []
+        if isinstance(entry[1], tuple):
+            entry[1] = self._snapshot_files(*entry[1])
+        return entry[1]
+
+    def _list_dir(self, rel: str, path: Path, mtime: int) -> list[str]:
+        files, subdirs = [], []
+        with os.scandir(path) as it:
+            for e in it:
+                if not self.include_hidden and e.name.startswith("."):
+                    continue
+                try:
+                    if e.is_dir(follow_symlinks=False):   # like rglob: no symlinked dirs
+                        subdirs.append(f"{rel}/{e.name}" if rel else e.name)
+                    elif e.is_file():
+                        st = e.stat()
+                        files.append((e.name, nfc_cf(e.name), nfc_cf(Path(e.name).stem), st.st_mtime_ns, st.st_size))
+                except OSError:
+                    continue
+        files.sort()
+        subdirs.sort()
+        self.dirs[rel] = [mtime, files, subdirs]
+        self.relisted += 1
+        return subdirs
+
+    def refresh(self) -> bool:
+        """Re-stat every known directory, re-list the ones that changed. Returns True if the tree changed."""
+        started = time.time_ns()
+        old, self.dirs = self.dirs, {}
+        changed = not old
+        self.relisted = 0
+        stack = [""]
+        while stack:
+            rel = stack.pop()
+            path = self.vault_root / rel if rel else self.vault_root
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                changed = True
+                continue
+            prev = old.get(rel)
+            if prev is not None and prev[0] == mtime and mtime < self.created_ns - _VIDX_RACY_NS:
+                self.dirs[rel] = prev
+                stack.extend(prev[2])
+                continue
+            try:
+                subdirs = self._list_dir(rel, path, mtime)
+            except OSError:
+                changed = True
+                continue
+            if prev is None or prev[2] != subdirs or self.files_in(rel) != (
+                    self._snapshot_files(*prev[1]) if isinstance(prev[1], tuple) else prev[1]):
+                changed = True
+            stack.extend(subdirs)
+        changed = changed or set(old) != set(self.dirs)
+        self.created_ns = started
+        return changed
+
+    def md_files(self) -> list[Path]:
+        out = []
+        for rel in sorted(self.dirs):
+            base = self.vault_root / rel if rel else self.vault_root
+            files = self.dirs[rel][1]
+            if isinstance(files, tuple):
+                # straight from the mapped records: decode only the names flagged as notes
+                mm, pool, start = self._mm, self._pool_at, self._files_at + files[0] * _VIDX_FILE.size
+                for rec in _VIDX_FILE.iter_unpack(mm[start:start + files[1] * _VIDX_FILE.size]):
+                    if rec[9] & _VIDX_MD:
+                        out.append(base / str(mm[pool + rec[1]:pool + rec[1] + rec[2]], "utf-8"))
+            else:
+                out.extend(base / f[0] for f in files if f[0].endswith(".md"))
+        return out
+
+# ================= Git change detection (optional change source) =================
+GIT_STATE_VERSION = 1
+# porcelain status letters that map onto added/modified/deleted/renamed; anything else
+# (unmerged, type changes, copies) is a state we do not interpret -> full scan
+_GIT_KNOWN_STATUS = set(" MADR?")
+
+def git_state_path(cfg: dict) -> Path:
+    """Where the commit of the last successful build is kept (next to the vault index snapshot)."""
+    idx = vault_index_path(cfg) or vault_index_path({**cfg, "vault_index": "auto"})
+    return idx.with_name(idx.stem + ".git.json")
+
+def _json_dates(o):
+    """json default for parsed frontmatter: YAML dates/timestamps survive a round trip (see _json_dates_hook)."""
+    if isinstance(o, datetime):
+        return {"$datetime": o.isoformat()}
+    if isinstance(o, date):
+        return {"$date": o.isoformat()}
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
+
+def _json_dates_hook(d: dict):
+    if len(d) == 1:
+        if "$datetime" in d:
+            return datetime.fromisoformat(d["$datetime"])
+        if "$date" in d:
+            return date.fromisoformat(d["$date"])
+    return d
+
+def _git(cwd: Path, *args: str) -> bytes:
+    return subprocess.run(["git", "-C", str(cwd), *args], check=True,
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+
+class GitChanges:
+    """
+    Vault paths (vault-relative, POSIX) changed since a recorded commit, read from the local
+    repository only: committed changes via `git diff -M <since> HEAD`, plus whatever
+    `git status` reports as dirty now, plus every gitignored file (git never reports edits
+    to those). complete=False means there was no usable baseline, so callers must treat every
+    file as possibly changed.
+    """
+    def __init__(self, commit: str, since: str | None):
+        self.commit = commit
+        self.since = since
+        self.complete = since is not None
+        self.added: set[str] = set()
+        self.modified: set[str] = set()
+        self.deleted: set[str] = set()
+        self.renamed: dict[str, str] = {}    # old -> new
+        self.dirty: set[str] = set()
+        self.stale: set[str] = set()         # dirty at the baseline: may have changed again since
+        self.ignored: set[str] = set()       # gitignored: invisible to diff and status, always re-stated
+
+    @classmethod
+    def detect(cls, vault_root: Path, since: str | None, debug: bool=False) -> "GitChanges | None":
+        """None when the vault is not in a git work tree or its state cannot be interpreted."""
+        try:
+            top = Path(_git(vault_root, "rev-parse", "--show-toplevel").decode().strip()).resolve()
+            head = _git(vault_root, "rev-parse", "--verify", "-q", "HEAD").decode().strip()
+        except (OSError, subprocess.CalledProcessError):
+            if debug:
+                tqdm.write(f"[git] {vault_root} is not a git work tree with commits; scanning")
+            return None
+        try:
+            prefix = vault_root.relative_to(top).as_posix()
+        except ValueError:
+            return None
+        prefix = "" if prefix == "." else prefix
+        spec = prefix or "."
+
+        def vrel(p: bytes) -> str | None:
+            p = p.decode("utf-8", "surrogateescape")
+            if not prefix:
+                return p
+            return p[len(prefix) + 1:] if p.startswith(prefix + "/") else None
+
+        if since is not None:
+            try:
+                _git(top, "cat-file", "-e", f"{since}^{{commit}}")
+            except subprocess.CalledProcessError:
+                tqdm.write(f"[git] last build commit {since[:12]} is gone (rebased?); scanning")
+                since = None
+        out = cls(head, since)
+
+        if since is not None and since != head:
+            fields = _git(top, "diff", "--name-status", "-z", "-M", since, head, "--", spec).split(b"\0")
+            i = 0
+            while i < len(fields) - 1:
+                code = fields[i].decode()[:1]
+                if code in "RC":
+                    old, new = vrel(fields[i + 1]), vrel(fields[i + 2])
+                    i += 3
+                    if old is not None and new is not None and code == "R":
+                        out.renamed[old] = new
+                    elif new is not None:
+                        out.added.add(new)       # copy, or moved into the vault
+                    elif old is not None and code == "R":
+                        out.deleted.add(old)     # moved out of the vault
+                    continue
+                path = vrel(fields[i + 1])
+                i += 2
+                if path is None:
+                    continue
+                {"A": out.added, "D": out.deleted}.get(code, out.modified).add(path)
+
+        fields = _git(top, "status", "--porcelain=v1", "-z", "--untracked-files=all", "--", spec).split(b"\0")
+        i = 0
+        while i < len(fields) - 1:
+            entry = fields[i]
+            xy, path = entry[:2].decode(), vrel(entry[3:])
+            i += 1
+            if "R" in xy:
+                # "R  new\0old": both sides are dirty
+                old = vrel(fields[i])
+                i += 1
+                if old is not None:
+                    out.dirty.add(old)
+            if not set(xy) <= _GIT_KNOWN_STATUS or xy in ("DD", "AA"):
+                tqdm.write(f"[git] unresolved state {xy.strip()!r} for {path}; scanning")
+                return None
+            if path is not None:
+                out.dirty.add(path)
+
+        for p in _git(top, "ls-files", "-z", "-o", "-i", "--exclude-standard", "--", spec).split(b"\0"):
+            path = vrel(p) if p else None
+            if path is not None:
+                out.ignored.add(path)
+        return out
+
+    def paths(self) -> set[str]:
+        return (self.added | self.modified | self.deleted | set(self.renamed) | set(self.renamed.values())
+                | self.dirty | self.stale | self.ignored)
+
+    def to_dict(self) -> dict:
+        return {
+            "source": "git", "commit": self.commit, "since": self.since, "complete": self.complete,
+            "added": sorted(self.added), "modified": sorted(self.modified), "deleted": sorted(self.deleted),
+            "renamed": [[o, n] for o, n in sorted(self.renamed.items())], "dirty": sorted(self.dirty),
+            "ignored": sorted(self.ignored),
+        }
+
+    def summary(self) -> str:
+        if not self.complete:
+            return f"no baseline commit; full scan at {self.commit[:12]}"
+        return (f"{self.since[:12]}..{self.commit[:12]}: {len(self.added)} added, {len(self.modified)} modified, "
+                f"{len(self.deleted)} deleted, {len(self.renamed)} renamed, {len(self.dirty)} dirty, "
+                f"{len(self.ignored)} ignored")
+
+# ================= Vault scan (shared by every target) =================
+RESOLVE_PARALLEL_MIN = 64   # fewer uncached notes than this resolve serially (pool start-up dominates)
+
+def resolve_note_refs(note: Path, vault_root: Path, media_exts: set[str], include_hidden: bool,
+                      scope: str, debug: bool=False) -> tuple[list[tuple[str, Path, str | None]], list[str]]:
+    """
+    ([(ref, hit, media ref key or None)], [unresolved refs]) for one note, in note order.
+    Depends only on the note and the vault (process-pool task of VaultScan.resolve_all).
+    """
+    out, unresolved = [], []
+    current_rel_noext = note.relative_to(vault_root).as_posix()[:-3]
+    for ref, has_ext in extract_media_refs(note, debug=debug):
+        suffix = Path(ref).suffix.lower()
+        hit, ref_key = None, None
+        # try media first if looks like media (or no ext — stem match later)
+        if suffix in media_exts or (not has_ext):
+            hit = resolve_media(
+                note_dir=note.parent, vault_root=vault_root, raw_ref=ref, has_ext=has_ext,
+                include_hidden=include_hidden, scope=scope, MEDIA_EXTS=media_exts
+            )
+            if hit and hit.suffix.lower() != ".md":
+                ref_key = _media_ref_key(current_rel_noext, ref)
+        if not hit:
+            hit = resolve_note(
+                note_dir=note.parent, vault_root=vault_root, raw_ref=ref, has_ext=has_ext,
+                include_hidden=include_hidden, scope=scope
+            )
+        if hit:
+            out.append((ref, hit, ref_key))
+        else:
+            unresolved.append(ref)
+    return out, unresolved
+
+class VaultScan:
+    """
+    One listing + frontmatter parse of the vault, with reference resolution memoized per note,
+    so several targets select, map and render from the same scan. With track_changes, refresh()
+    picks up later edits by re-stating files instead of re-parsing the whole vault. The listing
+    comes from the VaultIndex snapshot when config.vault_index is set, else from rglob. With
+    change_source "git" the stamps and frontmatter of the last successful build are kept with the
+    git baseline, so a new scan re-parses only the notes git reports as changed.
+    """
+    def __init__(self, cfg: dict, track_changes: bool=False):
+        self.vault_root = Path(cfg["vault"]).resolve()
+        self.include_hidden = bool(cfg["include_hidden"])
+        self.scope = cfg["scope"]
+        self.media_exts = set(e.lower() for e in cfg.get("media_exts", []))
+        self.debug = bool(cfg["debug"])
+        self.jobs = int(cfg.get("jobs") or 0)
+
+        self.md_files: list[Path] = []
+        self.frontmatter: dict[Path, dict] = {}
+        self._stamps: dict[Path, tuple[int, int]] = {}
+        self._refs: dict[Path, list[tuple[str, Path, str | None]]] = {}
+        self.index_path = vault_index_path(cfg)
+        self.index = (VaultIndex.load(self.index_path, self.vault_root, self.include_hidden, self.debug)
+                      if self.index_path else None)
+        self._dirs = self._dir_stamps() if track_changes and self.index is None else None
+        self.git: GitChanges | None = None
+        self._git_state_path = git_state_path(cfg) if cfg.get("change_source") == "git" else None
+        self._renamed_keys: dict[str, tuple[str, str]] | None = None
+        if self._git_state_path is not None:
+            state = self._load_git_state()
+            self.git = GitChanges.detect(self.vault_root, state.get("commit"), self.debug)
+            if self.git is not None:
+                if self.git.complete:
+                    self.git.stale = set(state.get("dirty") or [])
+                    # notes as parsed by the baseline build; git names every one that changed since
+                    for rel, (mtime_ns, size, fm) in (state.get("notes") or {}).items():
+                        self._stamps[self.vault_root / rel] = (mtime_ns, size)
+                        self.frontmatter[self.vault_root / rel] = fm
+                print(f"[git] {self.git.summary()}")
+        self._update(self._collect(), self._git_paths() if self._stamps else None)
+        print(f"[scan] md files found (after hidden filter): {len(self.md_files)}")
+
+    def _load_git_state(self) -> dict:
+        try:
+            state = json.loads(self._git_state_path.read_text(encoding="utf-8"), object_hook=_json_dates_hook)
+        except (OSError, ValueError):
+            return {}
+        if state.get("version") != GIT_STATE_VERSION or state.get("vault") != str(self.vault_root):
+            return {}
+        return state
+
+    def record_build(self):
+        """
+        After a successful build: HEAD (and what is dirty) becomes the next git baseline, with the
+        stamps and parsed frontmatter of every note (notes whose frontmatter JSON cannot carry are
+        left out and parsed again next time).
+        """
+        if self._git_state_path is None or self.git is None:
+            return
+        notes = {}
+        for p in self.md_files:
+            fm = self.frontmatter.get(p) or {}
+            try:
+                if json.loads(json.dumps(fm, default=_json_dates), object_hook=_json_dates_hook) != fm:
+                    continue                    # e.g. non-string keys
+            except (TypeError, ValueError):
+                continue
+            notes[p.relative_to(self.vault_root).as_posix()] = [*self._stamps[p], fm]
+        state = {"version": GIT_STATE_VERSION, "vault": str(self.vault_root),
+                 "commit": self.git.commit, "dirty": sorted(self.git.dirty), "notes": notes}
+        try:
+            self._git_state_path.parent.mkdir(parents=True, exist_ok=True)
+            self._git_state_path.write_text(json.dumps(state, default=_json_dates, separators=(",", ":")) + "\n",
+                                            encoding="utf-8")
+        except OSError as e:
+            tqdm.write(f"[git] could not save {self._git_state_path}: {e}")
+
+    def _git_touched(self) -> set[Path] | None:
+        """Paths git reports as possibly changed since the last look; None = unknown, stat every note."""
+        if self._git_state_path is None:
+            return None
+        prev = self.git
+        self.git = GitChanges.detect(self.vault_root, prev.commit if prev else None, self.debug)
+        self._renamed_keys = None
+        if self.git is None or prev is None or not self.git.complete:
+            return None
+        self.git.stale = set(prev.dirty)
+        return self._git_paths()
+
+    def _git_paths(self) -> set[Path] | None:
+        if self.git is None or not self.git.complete:
+            return None
+        return {self.vault_root / r for r in self.git.paths()}
+
+    def _collect(self) -> list[Path]:
+        # 1) collect md files (skip hidden unless asked)
+        if self.index is not None:
+            self._refresh_index()
+            return self.index.md_files()
+        md_files = []
+        for p in self.vault_root.rglob("*.md"):
+            try:
+                rel = p.relative_to(self.vault_root)
+            except Exception:
+                continue
+            if not self.include_hidden and is_hidden(rel):
+                continue
+            if p.is_file():
+                md_files.append(p)
+        return md_files
+
+    def _refresh_index(self) -> bool:
+        changed = self.index.refresh()
+        if changed or self.index.relisted:
+            try:
+                self.index.save(self.index_path)
+            except OSError as e:
+                tqdm.write(f"[index] could not save {self.index_path}: {e}")
+        if self.debug:
+            tqdm.write(f"[index] {len(self.index.dirs)} dirs, {self.index.relisted} re-listed"
+                       f"{', snapshot updated' if changed else ''}")
+        return changed
+
+    def _dir_stamps(self) -> dict[str, int]:
+        # adding, removing or renaming any file bumps its directory's mtime
+        return {d: os.stat(d).st_mtime_ns for d, _, _ in os.walk(self.vault_root)}
+
+    def _update(self, md_files: list[Path], only: set[Path] | None = None) -> bool:
+        """
+        (Re)parse frontmatter of new or edited notes only. Returns True when anything changed.
+        With only, known notes outside it are trusted without a stat (git said they are untouched).
+        """
+        changed = False
+        stamps: dict[Path, tuple[int, int]] = {}
+        for p in md_files:
+            if only is not None and p not in only and p in self._stamps:
+                stamps[p] = self._stamps[p]
+                continue
+            try:
+                st = p.stat()
+            except OSError:
+                continue
+            stamps[p] = (st.st_mtime_ns, st.st_size)
+            if self._stamps.get(p) != stamps[p]:
+                self.frontmatter[p] = parse_frontmatter_yaml(p)[0]
+                self._refs.pop(p, None)
+                changed = True
+        for p in set(self._stamps) - set(stamps):
+            self.frontmatter.pop(p, None)
+            self._refs.pop(p, None)
+            changed = True
+        self.md_files = [p for p in md_files if p in stamps]
+        self._stamps = stamps
+        return changed
+
+    def refresh(self) -> bool:
+        """
+        Catch up with vault edits. Edited notes are re-parsed and re-resolved; if any file was
+        added, removed or renamed, every cached resolution is dropped. Returns True on any change.
+        """
+        only = self._git_touched()
+        if self.index is not None:
+            tree_changed = self._refresh_index()
+            changed = self._update(self.index.md_files() if tree_changed else list(self.md_files), only)
+            if tree_changed:
+                self._refs.clear()
+            return changed or tree_changed
+        dirs = self._dir_stamps()
+        tree_changed = dirs != self._dirs
+        self._dirs = dirs
+        changed = self._update(self._collect() if tree_changed else list(self.md_files), only)
+        if tree_changed:
+            self._refs.clear()
+        return changed or tree_changed
+
+    def select(self, select: dict) -> list[Path]:
+        return [md for md in self.md_files
+                if should_publish(md, debug=self.debug, select=select, fm=self.frontmatter[md])]
+
+    def resolve(self, note: Path) -> list[tuple[str, Path, str | None]]:
+        """(ref, hit, media ref key or None) for every ref in note that resolves, in note order."""
+        cached = self._refs.get(note)
+        if cached is not None:
+            return cached
+        return self._store(note, *resolve_note_refs(note, self.vault_root, self.media_exts,
+                                                    self.include_hidden, self.scope, self.debug))
+
+    def resolve_all(self, notes: list[Path], jobs: int | None = None) -> list[list[tuple[str, Path, str | None]]]:
+        """
+        resolve() for many notes. Uncached notes are resolved as independent tasks on a process
+        pool (jobs workers; 0 = CPU count, 1 = serial) and stored in note order, so the results and
+        warnings are exactly those of a serial run.
+        """
+        todo = [n for n in dict.fromkeys(notes) if n not in self._refs]
+        workers = min((self.jobs if jobs is None else jobs) or os.cpu_count() or 1, len(todo))
+        if workers > 1 and len(todo) >= RESOLVE_PARALLEL_MIN:
+            task = partial(resolve_note_refs, vault_root=self.vault_root, media_exts=self.media_exts,
+                           include_hidden=self.include_hidden, scope=self.scope, debug=self.debug)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                results = pool.map(task, todo, chunksize=max(1, len(todo) // (workers * 8)))
+                for note, res in zip(todo, tqdm(results, total=len(todo), desc="Resolving notes", unit="note")):
+                    self._store(note, *res)
+            return [self._refs[n] for n in notes]
+        return [self.resolve(n) for n in tqdm(notes, desc="Resolving notes", unit="note")]
+
+    def _store(self, note: Path, out: list, unresolved: list[str]) -> list:
+        if self.git is not None and self.git.renamed:
+            for ref in unresolved:
+                self._warn_renamed(note, ref)
+        self._refs[note] = out
+        return out
+
+    def _warn_renamed(self, note: Path, ref: str):
+        # an unresolved link whose target git saw being renamed since the last build
+        if self._renamed_keys is None:
+            self._renamed_keys = {}
+            for old, new in self.git.renamed.items():
+                old_noext = old[:-3] if old.lower().endswith(".md") else old
+                for key in (old, old_noext, PurePosixPath(old).name, PurePosixPath(old_noext).name):
+                    self._renamed_keys.setdefault(nfc_cf(key), (old, new))
+        hit = self._renamed_keys.get(nfc_cf(ref.strip().lstrip("/")))
+        if hit:
+            tqdm.write(f"[git] {note.relative_to(self.vault_root).as_posix()}: link '{ref}' is unresolved; "
+                       f"'{hit[0]}' was renamed to '{hit[1]}'")
 
-    vault_root   = Path(cfg["vault"]).resolve()
+# ================= Build plan: decide everything before touching the publish vault =================
+PLAN_VERSION = 2
+
+def _changeset_path(cfg: dict, publish_root: Path) -> Path | None:
+    if not cfg.get("changeset_file"):
+        return None
+    p = Path(cfg["changeset_file"])
+    return p if p.is_absolute() else publish_root / p
+
+def _planned_asset_names(publish_root: Path) -> set[str]:
+    """Root files build_assets_from_script_dir() will leave in place (plus logos already present)."""
+    script_dir = Path(__file__).resolve().parent
+    names = {n for n in ("publish.css", "publish.js") if (script_dir / n).is_file()}
+    names |= {p.name for p in script_dir.glob("logo.*") if p.is_file()}
+    names |= {p.name for p in publish_root.glob("logo.*")}
+    return names
+
+def build_plan(cfg: dict, profile: FilterProfile | None = None, scan: VaultScan | None = None,
+               only: list[str] | None = None) -> dict:
+    """
+    Select notes, resolve refs and compute every destination for one target.
+    Pass a VaultScan to share the vault scan and resolution between targets.
+    With only, just the matching notes are resolved and the plan is narrowed to them (see narrow_plan).
+    Returns a JSON-serializable plan; nothing under publish_root is modified.
+    """
+    if scan is None:
+        scan = VaultScan(cfg)
+    vault_root   = scan.vault_root
     publish_root = Path(cfg["publish"]).resolve()
     MD_ROOT_DIR  = cfg.get("md_root_dir", "content")
 
-    MEDIA_EXTS = set(e.lower() for e in cfg.get("media_exts", []))
     global_contents_filter = compile_regex_list(cfg.get("global_contents_filter", []), "global_contents_filter")
     MD_FOLDERPATH_REWRITE = compile_regex_list(cfg.get("md_folderpath_rewrite", []), "md_folderpath_rewrite")
+    if profile is not None:
+        profile.register(_field_label(cfg, "global_contents_filter"), global_contents_filter)
+        profile.register(_field_label(cfg, "md_folderpath_rewrite"), MD_FOLDERPATH_REWRITE)
 
     APPLY_NAME = bool(cfg.get("apply_filters_to_filenames", True))
     APPLY_DIRS = bool(cfg.get("apply_filters_to_dirs", True))
 
-    md_root = publish_root / MD_ROOT_DIR
-    publish_root.mkdir(parents=True, exist_ok=True)
-    md_root.mkdir(parents=True, exist_ok=True)
-
+    if cfg.get("target"):
+        print(f"[target] {cfg['target']}")
     print(f"[start] vault_root = {vault_root}")
     print(f"[start] publish_root = {publish_root}")
-    print(f"[start] md_root_dir  = {md_root}")
+    print(f"[start] md_root_dir  = {publish_root / MD_ROOT_DIR}")
 
-    # 0) styles, scripts, logos FROM SCRIPT DIR ONLY
-    build_assets_from_script_dir(
-        publish_root,
-        debug=cfg["debug"],
-        css_hoist_imports_top=cfg.get("css_hoist_imports_top", True),
-    )
+    # 1) md files come from the (shared) scan
+    md_files = scan.md_files
 
-    # 1) collect md files (skip hidden unless asked)
-    md_files=[]
-    for p in vault_root.rglob("*.md"):
-        try:
-            rel = p.relative_to(vault_root)
-        except Exception:
-            continue
-        if not cfg["include_hidden"] and is_hidden(rel): 
-            continue
-        if p.is_file(): 
-            md_files.append(p)
-    print(f"[scan] md files found (after hidden filter): {len(md_files)}")
-
-    # 2) select publish:true
-    publish_notes=[]
-    for md in md_files:
-        if should_publish(md, debug=cfg["debug"]):
-            publish_notes.append(md)
-    print(f"[scan] publish:true selected: {len(publish_notes)}")
+    # 2) select by frontmatter (publish:true unless config.select says otherwise)
+    select = cfg.get("select") or {}
+    publish_notes = scan.select(select)
+    print(f"[scan] {describe_select(select)} selected: {len(publish_notes)}")
     if cfg["list_selected"] and publish_notes:
         for n in sorted(publish_notes, key=lambda p: p.relative_to(vault_root).as_posix()):
             print(" -", n.relative_to(vault_root))
 
     allowed_note_paths = set(p.resolve() for p in publish_notes)
 
-    # 3) keep assets copied earlier
-    keep_paths:set[Path]=set()
-    for core in ("publish.css","publish.js"):
-        cand = publish_root / core
-        if cand.exists(): keep_paths.add(cand)
-    for logo in publish_root.glob("logo.*"):
-        keep_paths.add(logo)
+    # 3) keep assets built from the script dir; copy user-specified extras (root-relative)
+    keep: set[str] = _planned_asset_names(publish_root)
+    for report_path in (_changeset_path(cfg, publish_root), _page_weight_path(cfg, publish_root)):
+        if report_path is not None and report_path.resolve().is_relative_to(publish_root):
+            keep.add(report_path.resolve().relative_to(publish_root).as_posix())
+    ops: list[dict] = [{"op": "assets"}]
 
-    # copy user-specified extras (root-relative)
     root_srcs:set[Path]=set()
     for a in (cfg.get("always_root") or []):
         cand = (vault_root / a)
@@ -1002,52 +3852,41 @@ def main():
             root_srcs.add(cand)
     for src in sorted(root_srcs):
         rel = src.relative_to(vault_root)
-        dst = publish_root / rel.name
-        keep_paths.add(dst)
-        if cfg["dry_run"]:
-            tqdm.write(f"[dry] copy (root) {rel} -> {dst.relative_to(publish_root)}")
-        else:
-            assert_in_publish_root(publish_root, dst)
-            dst.parent.mkdir(parents=True, exist_ok=True)
-            shutil.copy2(src, dst)
+        ops.append({"op": "copy", "kind": "root", "src": rel.as_posix(), "dst": rel.name})
+        keep.add(rel.name)
 
     # 4) resolve refs for notes (collect required files)
     required_srcs:set[Path]=set()
-    # For media: record how it was referenced so we can expand bare names later
+    # For media: record how it was referenced so we can expand bare names later (per linking folder:
+    # the same bare name can resolve to different files from different folders)
     ref_links_by_hit: dict[Path, set[str]] = defaultdict(set)
+    media_hits_by_folder: dict[str, dict[str, Path]] = defaultdict(dict)
+    refs_by_note: dict[str, list] = {}
 
-    for note in tqdm(publish_notes, desc="Resolving notes", unit="note"):
+    # a partial build resolves only its own notes: the note maps below need just the selection,
+    # and media destinations / (per-folder) ref keys of one note do not depend on any other note
+    resolve_notes = publish_notes if not only else [
+        n for n in publish_notes if only_matches(n.relative_to(vault_root).as_posix(), only)]
+    # (independent per-note tasks on a process pool, merged here in note order)
+    for note, note_refs in zip(resolve_notes, scan.resolve_all(resolve_notes)):
         required_srcs.add(note)
-        refs = extract_media_refs(note, debug=cfg["debug"])
         current_rel_noext = note.relative_to(vault_root).as_posix()[:-3]
-        for ref, has_ext in refs:
-            suffix = Path(ref).suffix.lower()
-            hit = None
-            # try media first if looks like media (or no ext — stem match later)
-            if suffix in MEDIA_EXTS or (not has_ext):
-                hit = resolve_media(
-                    note_dir=note.parent, vault_root=vault_root, raw_ref=ref, has_ext=has_ext,
-                    include_hidden=cfg["include_hidden"], scope=cfg["scope"], MEDIA_EXTS=MEDIA_EXTS
-                )
-                if hit and hit.suffix.lower() != ".md":
-                    # Record reference key -> this media file
-                    ref_key = _media_ref_key(current_rel_noext, ref)
-                    ref_links_by_hit[hit].add(ref_key)
-            if not hit:
-                hit = resolve_note(
-                    note_dir=note.parent, vault_root=vault_root, raw_ref=ref, has_ext=has_ext,
-                    include_hidden=cfg["include_hidden"], scope=cfg["scope"]
-                )
-            if hit:
-                if hit.suffix.lower() == ".md" and hit.resolve() not in allowed_note_paths:
+        resolved = refs_by_note.setdefault(current_rel_noext + ".md", [])
+        for ref, hit, ref_key in note_refs:
+            if ref_key is not None:
+                # Record reference key -> this media file
+                ref_links_by_hit[hit].add(ref_key)
+                media_hits_by_folder[_media_ref_folder(current_rel_noext)][ref_key] = hit
+            if hit.suffix.lower() == ".md" and hit.resolve() not in allowed_note_paths:
+                continue
+            try:
+                rel = hit.relative_to(vault_root)
+                if not cfg["include_hidden"] and is_hidden(rel):
                     continue
-                try:
-                    rel = hit.relative_to(vault_root)
-                    if not cfg["include_hidden"] and is_hidden(rel):
-                        continue
-                except Exception:
-                    pass
-                required_srcs.add(hit)
+            except Exception:
+                pass
+            required_srcs.add(hit)
+            resolved.append([ref, hit.relative_to(vault_root).as_posix()])
 
     # 5) Build NOTE path mapping (folder rewrite + filename filters)
     # map: original note rel-noext (posix, lowercase) -> new note rel-noext under md_root_dir
@@ -1060,16 +3899,16 @@ def main():
         rel = src.relative_to(vault_root)           # e.g., "Trips/Italy/Day1.md"
         folder_posix = rel.parent.as_posix()        # e.g., "Trips/Italy"
         # 5a) folder path rewrite (markdown-only)
-        folder_rewritten = apply_folderpath_rewrite(folder_posix, md_folder_rules)
+        folder_rewritten = apply_folderpath_rewrite(folder_posix, md_folder_rules, profile=profile)
         # 5b) pass dir segments through name filters if enabled (to keep redactions aligned)
         if folder_rewritten:
-            parts = [safe_filename(apply_name_filters(seg, global_contents_filter, enabled=APPLY_DIRS)) for seg in folder_rewritten.split("/")]
+            parts = [safe_filename(apply_name_filters(seg, global_contents_filter, enabled=APPLY_DIRS, profile=profile)) for seg in folder_rewritten.split("/")]
             new_folder = "/".join([p for p in parts if p])
         else:
             new_folder = ""  # flatten
         # 5c) filename transform
         stem = src.stem
-        stem = apply_name_filters(stem, global_contents_filter, enabled=APPLY_NAME)
+        stem = apply_name_filters(stem, global_contents_filter, enabled=APPLY_NAME, profile=profile)
         stem = safe_filename(stem)
         new_noext = f"{new_folder + '/' if new_folder else ''}{stem}"
 
@@ -1086,7 +3925,7 @@ def main():
 
     # 6) Build MEDIA path mapping (original rel -> NEW rel under md_root_dir)
     media_dst_by_rel: dict[str, str] = {}
-    media_ref_to_newrel: dict[str, str] = {}
+    media_ref_to_newrel: dict[str, dict[str, str]] = {}
 
     for src in sorted(required_srcs):
         if src.suffix.lower() == ".md":
@@ -1096,84 +3935,1037 @@ def main():
             rel,
             name_filters=global_contents_filter,
             apply_to_names=APPLY_NAME,
-            apply_to_dirs=APPLY_DIRS
+            apply_to_dirs=APPLY_DIRS,
+            profile=profile,
         )
-        new_rel_s = new_rel.as_posix()
-        media_dst_by_rel[rel.as_posix().lower()] = new_rel_s
+        media_dst_by_rel[rel.as_posix().lower()] = new_rel.as_posix()
 
-        # Also map every ref-string that resolved to this src
-        for ref_key in (ref_links_by_hit.get(src) or ()):
-            media_ref_to_newrel[ref_key] = new_rel_s
+    # Also map every ref-string to the file it resolved to, per linking folder
+    for folder, hits in sorted(media_hits_by_folder.items()):
+        media_ref_to_newrel[folder] = {ref_key: media_dst_by_rel[hit.relative_to(vault_root).as_posix().lower()]
+                                       for ref_key, hit in sorted(hits.items()) if hit in required_srcs}
 
-    # 7) copy notes & media under md_root_dir + rewrite links
-    for src in tqdm(sorted(required_srcs), desc="Copying content", unit="file"):
+    # 7) notes & media under md_root_dir (notes get links rewritten at apply time)
+    for src in sorted(required_srcs):
         rel = src.relative_to(vault_root)
         if src.suffix.lower()==".md":
-            rel_noext = rel.as_posix()[:-3].lower()
-            new_noext = note_new_noext_by_relnoext[rel_noext]  # path-within-root, no extension
-            dst = (publish_root / MD_ROOT_DIR / f"{new_noext}.md")
-            keep_paths.add(dst)
-            if cfg["dry_run"]:
-                tqdm.write(f"[dry] copy (note) {rel} -> {dst.relative_to(publish_root)}")
-            else:
-                content = read_text(src)
-                # Apply content redaction first
-                content = apply_text_filters(content, regexes=global_contents_filter)
-                current_rel_noext = rel.as_posix()[:-3]
-                # Rewrite links (notes -> md_root_dir/<new_noext>.md; media EMBEDS -> md_root_dir/<mapped>)
-                content = rewrite_wikilinks(
-                    content,
-                    current_rel_noext=current_rel_noext,
-                    map_note_relnoext_to_new_noext=note_new_noext_by_relnoext,
-                    map_by_unique_stem=unique_stem_to_new_noext,
-                    MEDIA_EXTS=MEDIA_EXTS,
-                    media_map_by_rel=media_dst_by_rel,
-                    media_ref_to_newrel=media_ref_to_newrel,
-                    md_root_dir=MD_ROOT_DIR
-                )
-                content = rewrite_md_links(
-                    content,
-                    current_rel_noext=current_rel_noext,
-                    map_note_relnoext_to_new_noext=note_new_noext_by_relnoext,
-                    map_by_unique_stem=unique_stem_to_new_noext,
-                    md_root_dir=MD_ROOT_DIR,
-                    MEDIA_EXTS=MEDIA_EXTS,
-                    media_map_by_rel=media_dst_by_rel,
-                    media_ref_to_newrel=media_ref_to_newrel
-                )
-                assert_in_publish_root(publish_root, dst)
-                dst.parent.mkdir(parents=True, exist_ok=True)
-                dst.write_text(content, encoding="utf-8")
+            new_noext = note_new_noext_by_relnoext[rel.as_posix()[:-3].lower()]  # path-within-root, no extension
+            dst = f"{MD_ROOT_DIR}/{new_noext}.md"
+            ops.append({"op": "render", "src": rel.as_posix(), "dst": dst})
         else:
-            rel = src.relative_to(vault_root)
-            new_rel = Path(media_dst_by_rel.get(rel.as_posix().lower(), rel.as_posix()))
-            dst = publish_root / MD_ROOT_DIR / new_rel
-            keep_paths.add(dst)
-            if cfg["dry_run"]:
-                tqdm.write(f"[dry] copy (media) {rel} -> {dst.relative_to(publish_root)}")
-            else:
-                assert_in_publish_root(publish_root, dst)
+            new_rel = media_dst_by_rel.get(rel.as_posix().lower(), rel.as_posix())
+            dst = f"{MD_ROOT_DIR}/{new_rel}"
+            ops.append({"op": "copy", "kind": "media", "src": rel.as_posix(), "dst": dst})
+        keep.add(dst)
+
+    # 7a) frontmatter projection edits and static date/map blocks, from the frontmatter parsed at selection
+    fm_proj = FrontmatterProjection.from_config(cfg)
+    fm_edits: dict[str, dict] = {}
+    bcfg = cfg.get("static_blocks") or {}
+    blocks: dict[str, str] = {}
+    if fm_proj is not None and fm_proj.normalize and yaml is None:
+        tqdm.write("[frontmatter] PyYAML not installed; frontmatter.normalize is ignored")
+    if fm_proj is not None or bcfg.get("dates") or bcfg.get("maps"):
+        for note in resolve_notes:
+            rel_s = note.relative_to(vault_root).as_posix()
+            fm = scan.frontmatter.get(note) or {}
+            edits = fm_proj.plan_note(fm) if fm_proj is not None else None
+            if edits:
+                fm_edits[rel_s] = edits
+            # blocks only show what the published frontmatter keeps (a denied address stays out of the body)
+            text = render_static_blocks(fm_proj.project(fm) if fm_proj is not None else fm, bcfg)
+            if text:
+                blocks[rel_s] = text
+
+    # 7b) gallery thumbnails / image metadata for embedded images (js/image-lightbox.js, js/image-meta.js)
+    tcfg = cfg.get("thumbnails") or {}
+    icfg = cfg.get("image_meta") or {}
+    embedded: dict[str, str] = {}
+    if tcfg.get("enabled") or icfg.get("enabled"):
+        for src in sorted(ref_links_by_hit):
+            if src in required_srcs:
+                rel_s = src.relative_to(vault_root).as_posix()
+                embedded[rel_s] = media_dst_by_rel[rel_s.lower()]
+    if tcfg.get("enabled"):
+        ops.append({"op": "thumbnails"})
+    if icfg.get("enabled"):
+        ops.append({"op": "image_meta"})
+        keep.add(image_meta_rel(MD_ROOT_DIR, icfg))
+
+    # 7c) reading-order prefetch map (consumed by js/next-previous-story.js)
+    pcfg = cfg.get("prefetch") or {}
+    if pcfg.get("enabled"):
+        ops.append({"op": "prefetch"})
+        keep.add(prefetch_rel(MD_ROOT_DIR, pcfg))
+
+    # 7d) full-text search index over the rendered notes (consumed by js/search-index.js)
+    scfg = cfg.get("search") or {}
+    if scfg.get("enabled"):
+        ops.append({"op": "search"})
+        keep.add(search_index_rel(MD_ROOT_DIR, scfg))
+
+    # 8) what prune would delete right now (thumbnail names are content hashes, decided at apply time)
+    thumbs_prefix = f"{MD_ROOT_DIR}/{str(tcfg.get('dir', '_thumbs')).strip('/')}/" if tcfg.get("enabled") else None
+    deletes: list[str] = []
+    if publish_root.is_dir() and not only:
+        for p in publish_root.rglob("*"):
+            rel_s = p.relative_to(publish_root).as_posix()
+            if not p.is_file() or rel_s in keep or rel_s == JOURNAL_NAME or rel_s.split("/", 1)[0] == ".obsidian":
+                continue
+            if thumbs_prefix and rel_s.startswith(thumbs_prefix):
+                continue
+            deletes.append(rel_s)
+
+    plan = {
+        "version": PLAN_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "target": cfg.get("target"),
+        "config": cfg,
+        "vault_root": str(vault_root),
+        "publish_root": str(publish_root),
+        "md_root_dir": MD_ROOT_DIR,
+        "stats": {"md_files": len(md_files), "selected": len(publish_notes)},
+        "notes": sorted(p.relative_to(vault_root).as_posix() for p in publish_notes),
+        "refs": refs_by_note,
+        "note_map": note_new_noext_by_relnoext,
+        "unique_stem_map": unique_stem_to_new_noext,
+        "media_map": media_dst_by_rel,
+        "media_ref_map": media_ref_to_newrel,
+        "frontmatter": fm_edits,
+        "blocks": blocks,
+        "embedded": embedded,
+        "ops": ops,
+        "keep": sorted(keep),
+        "deletes": sorted(deletes),
+        "vault_changes": scan.git.to_dict() if scan.git is not None else None,
+    }
+    return narrow_plan(plan, only) if only else plan
+
+def only_matches(rel: str, only: list[str]) -> bool:
+    """--only globs match vault-relative note paths from the right, like pathlib ("Day1.md", "Trips/*/*.md")."""
+    return any(PurePosixPath(rel).match(g) for g in only)
+
+def narrow_plan(plan: dict, only: list[str]) -> dict:
+    """
+    The part of a plan that renders the notes matching only and copies the media they reference.
+    Note/media maps stay global, so those files come out exactly as in the full build; assets,
+    root extras, thumbnails, indexes, the change set and prune are left to the next full build.
+    """
+    notes = [n for n in plan["notes"] if only_matches(n, only)]
+    if not notes:
+        raise SystemExit(f"--only {' '.join(only)}: no selected note matches")
+    wanted = set(notes)
+    for n in notes:
+        wanted.update(hit for _, hit in plan["refs"].get(n, []) if not hit.lower().endswith(".md"))
+    ops = [op for op in plan["ops"]
+           if op["op"] in ("render", "copy") and op.get("kind") != "root" and op["src"] in wanted]
+    return {**plan, "only": list(only), "notes": notes, "ops": ops,
+            "keep": sorted(op["dst"] for op in ops), "deletes": []}
+
+def save_plan(plan: dict, path: Path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(plan, indent=1, ensure_ascii=False, default=str) + "\n", encoding="utf-8")
+
+def load_plan(path: Path) -> dict:
+    plan = json.loads(Path(path).read_text(encoding="utf-8"))
+    if plan.get("version") != PLAN_VERSION:
+        raise RuntimeError(f"Unsupported build plan version {plan.get('version')!r} in {path}")
+    return plan
+
+def print_plan_summary(plan: dict, debug: bool=False):
+    counts = defaultdict(int)
+    for op in plan["ops"]:
+        counts[op.get("kind") or op["op"]] += 1
+    print("\n=== Build plan ===")
+    print(f"Notes to render:  {counts['render']}")
+    print(f"Media to copy:    {counts['media']}")
+    print(f"Root extras:      {counts['root']}")
+    print(f"Thumbnails:       {'yes' if counts['thumbnails'] else 'no'}")
+    print(f"Search index:     {'yes' if counts['search'] else 'no'}")
+    print(f"Image metadata:   {'yes' if counts['image_meta'] else 'no'}")
+    print(f"Prefetch map:     {'yes' if counts['prefetch'] else 'no'}")
+    print(f"Files kept:       {len(plan['keep'])}")
+    print(f"To delete:        {len(plan['deletes'])}")
+    if debug:
+        for op in plan["ops"]:
+            if "src" in op:
+                tqdm.write(f"[plan] {op.get('kind') or op['op']:6} {op['src']} -> {op['dst']}")
+        for rel in plan["deletes"]:
+            tqdm.write(f"[plan] delete {rel}")
+
+# ================= Page weight: embedded bytes per published note =================
+PAGE_WEIGHT_VERSION = 1
+_MEDIA_KINDS = {
+    "image": {".png", ".jpg", ".jpeg", ".jpe", ".webp", ".gif", ".svg", ".heic", ".bmp", ".tiff", ".tif", ".avif"},
+    "video": {".mp4", ".mov", ".m4v", ".webm"},
+    "audio": {".mp3", ".wav", ".m4a", ".ogg", ".flac"},
+    "document": {".pdf"},
+}
+PAGE_WEIGHT_BUDGETS = ("page_bytes", "asset_bytes", "assets_per_page")
+
+class PageWeightBudgetExceeded(RuntimeError):
+    pass
+
+def media_kind(path: str) -> str:
+    ext = PurePosixPath(path).suffix.lower()
+    return next((k for k, exts in _MEDIA_KINDS.items() if ext in exts), "other")
+
+def _page_weight_path(cfg: dict, publish_root: Path) -> Path | None:
+    """The JSON report: relative to the publish root, or to the archive's directory for archive builds."""
+    wcfg = cfg.get("page_weight") or {}
+    if not wcfg.get("enabled") or not wcfg.get("file"):
+        return None
+    p = Path(wcfg["file"])
+    if p.is_absolute():
+        return p
+    return (Path(cfg["archive"]).parent if cfg.get("archive") else publish_root) / p
+
+def page_weight_report(plan: dict) -> dict:
+    """
+    Per published note: its own bytes plus every media file it references (the bytes a first visit
+    loads), the largest assets, bytes by media kind; site-wide: assets shared by several pages and
+    the notes over the configured budgets. Sizes are those of the vault sources.
+    """
+    wcfg = plan["config"].get("page_weight") or {}
+    vault_root = Path(plan["vault_root"])
+    dst_by_src = {op["src"]: op["dst"] for op in plan["ops"] if op["op"] in ("render", "copy")}
+    sizes: dict[str, int] = {}
+    def _size(rel: str) -> int:
+        if rel not in sizes:
+            try: sizes[rel] = (vault_root / rel).stat().st_size
+            except OSError: sizes[rel] = 0
+        return sizes[rel]
+
+    pages, pages_by_asset = [], defaultdict(int)
+    for note in plan["notes"]:
+        if note not in dst_by_src:
+            continue
+        assets = list(dict.fromkeys(hit for _, hit in plan["refs"].get(note, [])
+                                    if not hit.lower().endswith(".md") and hit in dst_by_src))
+        by_kind: dict[str, int] = defaultdict(int)
+        for a in assets:
+            by_kind[media_kind(a)] += _size(a)
+            pages_by_asset[a] += 1
+        asset_bytes = sum(by_kind.values())
+        largest = sorted(assets, key=lambda a: (-_size(a), a))[:3]
+        pages.append({
+            "note": note,
+            "dst": dst_by_src[note],
+            "bytes": _size(note) + asset_bytes,
+            "note_bytes": _size(note),
+            "assets": len(assets),
+            "asset_bytes": asset_bytes,
+            "by_kind": dict(sorted(by_kind.items())),
+            "largest": [[dst_by_src[a], _size(a)] for a in largest],
+        })
+    pages.sort(key=lambda p: (-p["bytes"], p["note"]))
+
+    by_kind_total: dict[str, list[int]] = {}
+    for a in pages_by_asset:
+        st = by_kind_total.setdefault(media_kind(a), [0, 0])
+        st[0] += 1; st[1] += _size(a)
+    shared = sorted(([dst_by_src[a], _size(a), n] for a, n in pages_by_asset.items() if n > 1),
+                    key=lambda r: (-r[2] * r[1], r[0]))
+
+    budgets = {k: int((wcfg.get("budgets") or {}).get(k) or 0) for k in PAGE_WEIGHT_BUDGETS}
+    over = []
+    for p in pages:
+        for key, value in (("page_bytes", p["bytes"]), ("asset_bytes", p["largest"][0][1] if p["largest"] else 0),
+                           ("assets_per_page", p["assets"])):
+            if budgets[key] and value > budgets[key]:
+                over.append({"note": p["note"], "budget": key, "value": value, "limit": budgets[key]})
+
+    return {
+        "version": PAGE_WEIGHT_VERSION,
+        "target": plan.get("target"),
+        "budgets": budgets,
+        "pages": pages,
+        "assets": {
+            "count": len(pages_by_asset),
+            "bytes": sum(_size(a) for a in pages_by_asset),
+            "by_kind": {k: {"count": c, "bytes": b} for k, (c, b) in sorted(by_kind_total.items())},
+            "shared": [{"dst": d, "bytes": b, "pages": n} for d, b, n in shared],
+        },
+        "over_budget": over,
+    }
+
+def _kb(n: int) -> str:
+    return f"{n / 1024:.1f}"
+
+def print_page_weight(report: dict, top: int=20):
+    pages = report["pages"]
+    print("\n=== Page weight (heaviest first) ===")
+    print(f"{'total KB':>10} {'note KB':>8} {'assets':>6} {'largest KB':>10}  note")
+    for p in pages[:top]:
+        largest = p["largest"][0][1] if p["largest"] else 0
+        print(f"{_kb(p['bytes']):>10} {_kb(p['note_bytes']):>8} {p['assets']:6d} {_kb(largest):>10}  {p['note']}")
+    if len(pages) > top:
+        print(f"{'':>10} ... {len(pages) - top} more")
+    a = report["assets"]
+    kinds = ", ".join(f"{k} {v['count']} ({_kb(v['bytes'])} KB)" for k, v in a["by_kind"].items()) or "none"
+    print(f"Assets:         {a['count']} files, {_kb(a['bytes'])} KB: {kinds}")
+    if a["shared"]:
+        print(f"Shared assets:  {len(a['shared'])} used by several pages, e.g. "
+              + ", ".join(f"{s['dst']} ({s['pages']} pages)" for s in a["shared"][:3]))
+
+def page_weight_stage(plan: dict, dry: bool=False) -> dict:
+    """Report, JSON file (not on dry runs) and budget check for one plan (config.page_weight)."""
+    wcfg = plan["config"].get("page_weight") or {}
+    report = page_weight_report(plan)
+    print_page_weight(report, top=int(wcfg.get("top", 20)))
+    path = _page_weight_path(plan["config"], Path(plan["publish_root"]))
+    # a partial build's report covers only its notes; the file keeps the last full build's
+    if path is not None and not dry and not plan.get("only"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(report, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"[weight] report written to {path}")
+    for o in report["over_budget"]:
+        tqdm.write(f"[weight] {o['note']}: {o['budget']} {o['value']} > {o['limit']}")
+    if report["over_budget"] and wcfg.get("budget_action") == "fail":
+        raise PageWeightBudgetExceeded(f"[weight] {len(report['over_budget'])} page budget(s) exceeded")
+    return report
+
+# ================= Plan executor =================
+def _render_context(plan: dict, profile: FilterProfile | None = None) -> dict:
+    cfg = plan["config"]
+    global_contents_filter = compile_regex_list(cfg.get("global_contents_filter", []), "global_contents_filter")
+    if profile is not None:
+        profile.register(_field_label(cfg, "global_contents_filter"), global_contents_filter)
+    # streaming render applies only when every content filter has a bounded match window
+    stream_threshold = int(cfg.get("stream_threshold_bytes") or 0)
+    if stream_threshold:
+        unbounded = streaming_supported(global_contents_filter)
+        if unbounded:
+            tqdm.write(f"[stream] global_contents_filter{unbounded} can match unbounded spans; large notes render in memory")
+            stream_threshold = 0
+    media_exts = set(e.lower() for e in cfg.get("media_exts", []))
+    return {
+        "filters": global_contents_filter,
+        "media_exts": media_exts,
+        "md_root_dir": plan["md_root_dir"],
+        "note_map": plan["note_map"],
+        "unique_stem_map": plan["unique_stem_map"],
+        "media_map": plan["media_map"],
+        "media_ref_map": plan["media_ref_map"],
+        "stream_threshold": stream_threshold,
+        "stream_chunk_chars": int(cfg.get("stream_chunk_chars") or 1 << 20),
+        "profile": profile,
+        "frontmatter": FrontmatterProjection.from_config(cfg, plan.get("frontmatter")),
+        "blocks": plan.get("blocks") or {},
+        # link targets repeat across notes (hubs, shared attachments); the maps are fixed from here on
+        "links": LinkMemo(plan["note_map"], plan["unique_stem_map"], media_exts,
+                          plan["media_map"], plan["media_ref_map"]),
+        "search": (SearchIndex(plan["md_root_dir"], cfg.get("search") or {})
+                   if any(op["op"] == "search" for op in plan["ops"]) else None),
+    }
+
+def _link_replacers(current_rel_noext: str, ctx: dict):
+    media_refs = ctx["media_ref_map"].get(_media_ref_folder(current_rel_noext)) or {}
+    wl_repl = wikilink_replacer(
+        current_rel_noext, ctx["note_map"], ctx["unique_stem_map"],
+        ctx["media_exts"], ctx["media_map"], media_refs, ctx["md_root_dir"], ctx["links"]
+    )
+    md_repl = md_link_replacer(
+        current_rel_noext, ctx["note_map"], ctx["unique_stem_map"],
+        ctx["md_root_dir"], ctx["media_exts"], ctx["media_map"], media_refs, ctx["links"]
+    )
+    return wl_repl, md_repl
+
+def render_note_text(src: Path, current_rel_noext: str, ctx: dict) -> str:
+    """Published text of one note, in memory."""
+    wl_repl, md_repl = _link_replacers(current_rel_noext, ctx)
+    content = read_text(src)
+    # Project frontmatter and add static blocks, then apply content redaction (which therefore also
+    # covers the kept keys and the blocks)
+    if ctx["frontmatter"] is not None or ctx["blocks"]:
+        sp = note_head_span(content, ctx, current_rel_noext + ".md")
+        if sp is not None:
+            content = sp[1] + content[sp[0]:]
+    content = apply_text_filters(content, regexes=ctx["filters"], profile=ctx["profile"], note=current_rel_noext + ".md")
+    # Rewrite links (notes -> md_root_dir/<new_noext>.md; media EMBEDS -> md_root_dir/<mapped>),
+    # leaving code and comments alone
+    content, skip = sub_skipping(WIKILINK_ALL, wl_repl, content, SkipSpans(markdown_skip_spans(content)[0]))
+    if skip is None:
+        skip = SkipSpans(markdown_skip_spans(content)[0])
+    return sub_skipping(MD_LINK, md_repl, content, skip)[0]
+
+def render_note_file(src: Path, dst: Path, current_rel_noext: str, ctx: dict, publish_root: Path,
+                     changes: ChangeSet | None = None, debug: bool=False,
+                     archive: ArchiveOutput | None = None, out: OutputWriter | None = None) -> str:
+    """Redact + rewrite one note into dst (streamed for very large notes). Returns the change status."""
+    if ctx["stream_threshold"] and src.stat().st_size > ctx["stream_threshold"]:
+        wl_repl, md_repl = _link_replacers(current_rel_noext, ctx)
+        if out is not None:
+            out.make_dirs([os.path.dirname(out.check(dst))])
+        else:
+            assert_in_publish_root(publish_root, dst)
+        if archive is not None:
+            fd, tmp = tempfile.mkstemp(prefix="publish-", suffix=".md")
+            os.close(fd)
+            tmp = Path(tmp)
+        else:
+            if out is None:
                 dst.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy2(src, dst)
+            tmp = dst.with_name(dst.name + ".tmp")
+        for errors in ("strict", "ignore"):  # same fallback as read_text()
+            try:
+                head = (read_note_head(src, lambda c: note_head_span(c, ctx, current_rel_noext + ".md"),
+                                       errors, ctx["stream_chunk_chars"])
+                        if ctx["frontmatter"] is not None or ctx["blocks"] else None)
+                with open(tmp, "w", encoding="utf-8") as fh:
+                    render_note_streaming(src, fh, ctx["filters"], wl_repl, md_repl,
+                                          chunk_chars=ctx["stream_chunk_chars"], errors=errors,
+                                          profile=ctx["profile"], note=current_rel_noext + ".md", head=head)
+                break
+            except UnicodeDecodeError:
+                continue
+        if debug:
+            tqdm.write(f"[stream] {current_rel_noext}.md ({src.stat().st_size} bytes) rendered in chunks")
+        if ctx["search"] is not None:
+            ctx["search"].add_file(_search_slug(publish_root, dst), tmp)
+        return replace_if_changed(publish_root, tmp, dst, changes, archive, out)
+
+    content = render_note_text(src, current_rel_noext, ctx)
+    if ctx["search"] is not None:
+        ctx["search"].add_text(_search_slug(publish_root, dst), content)
+    return write_text_if_changed(publish_root, dst, content, changes, archive, out)
+
+def _search_slug(publish_root: Path, dst: Path) -> str:
+    return dst.relative_to(publish_root).as_posix()[:-3]
+
+def _apply_file_ops(plan: dict, file_ops: list[dict], ctx: dict, changes: ChangeSet | None,
+                    jobs: int=0, debug: bool=False, archive: ArchiveOutput | None = None,
+                    journal: BuildJournal | None = None):
+    """
+    Render/copy ops into the publish root (parallel I/O). Directory builds hand the writes to an
+    OutputWriter and return only after it has flushed, so pruning never races a pending write.
+    With a journal, every landed op is recorded and ops it already holds (resume) are skipped.
+    """
+    vault_root   = Path(plan["vault_root"])
+    publish_root = Path(plan["publish_root"])
+    workers = jobs or min(32, (os.cpu_count() or 1) + 4)
+    out = None
+    pending: dict[str, tuple[dict, os.stat_result]] = {}
+    if journal is not None and journal.done:
+        todo = []
+        for op in file_ops:
+            try:
+                src_st = (vault_root / op["src"]).stat()
+            except OSError:
+                src_st = None
+            rec = journal.completed(op, src_st) if src_st is not None else None
+            if rec is None:
+                todo.append(op)
+            elif changes is not None:
+                dst = publish_root / op["dst"]
+                changes.record(dst, rec["status"], rec["sha256"] or changes.cached_hash(dst))
+        tqdm.write(f"[journal] {len(file_ops) - len(todo)} of {len(file_ops)} file ops already done")
+        file_ops = todo
+
+    def _written(dst: Path, status: str):
+        op, src_st = pending.pop(str(dst))
+        journal.record(op, src_st, status, changes)
+
+    if archive is None:
+        ocfg = plan["config"].get("output") or {}
+        out = OutputWriter(publish_root, {(publish_root / op["dst"]).parent for op in file_ops},
+                           writers=int(ocfg.get("writers") or workers),
+                           queue_size=int(ocfg.get("queue_size") or 64), fsync=ocfg.get("fsync") or "none",
+                           on_written=_written if journal is not None else None)
+
+    def _run(op: dict):
+        src = vault_root / op["src"]
+        dst = publish_root / op["dst"]
+        if journal is not None:
+            pending[str(dst)] = (op, src.stat())
+        if op["op"] == "render":
+            render_note_file(src, dst, op["src"][:-3], ctx, publish_root, changes, debug=debug,
+                             archive=archive, out=out)
+        else:
+            copy_file_if_changed(publish_root, src, dst, changes, archive, out)
+
+    ok = False
+    try:
+        if workers == 1:
+            # main thread: lets filter_budget_action 'fail' interrupt a runaway rule
+            for op in tqdm(file_ops, desc="Copying content", unit="file"):
+                _run(op)
+        else:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                futs = [pool.submit(_run, op) for op in file_ops]
+                for fut in tqdm(as_completed(futs), total=len(futs), desc="Copying content", unit="file"):
+                    fut.result()
+        ok = True
+    finally:
+        if out is not None:
+            out.close(ok)
+    if debug:
+        tqdm.write(ctx["links"].report())
+
+def _open_publish_root(plan: dict) -> tuple[Path, Path | None, ChangeSet | None]:
+    cfg = plan["config"]
+    publish_root = Path(plan["publish_root"])
+    publish_root.mkdir(parents=True, exist_ok=True)
+    (publish_root / plan["md_root_dir"]).mkdir(parents=True, exist_ok=True)
+    changeset_path = _changeset_path(cfg, publish_root)
+    changes = ChangeSet.load(publish_root, changeset_path) if changeset_path else None
+    return publish_root, changeset_path, changes
+
+def _apply_assets(plan: dict, changes: ChangeSet | None, debug: bool=False, archive: ArchiveOutput | None = None):
+    cfg = plan["config"]
+    for op in plan["ops"]:
+        if op["op"] == "assets":
+            # 0) styles, scripts, logos FROM SCRIPT DIR ONLY
+            build_assets_from_script_dir(
+                Path(plan["publish_root"]),
+                debug=debug,
+                css_hoist_imports_top=cfg.get("css_hoist_imports_top", True),
+                changes=changes,
+                archive=archive,
+            )
+
+def _finish_plan(plan: dict, keep_paths: set[Path], changeset_path: Path | None,
+                 changes: ChangeSet | None, debug: bool=False, journal: BuildJournal | None = None):
+    """Thumbnails, prune and the change set: the steps that need every file op to have completed."""
+    if plan.get("only"):
+        # partial build: everything else stays as the last full build left it
+        return
+    vault_root   = Path(plan["vault_root"])
+    publish_root = Path(plan["publish_root"])
+    if journal is not None:
+        # prune only once the journal holds every planned render/copy
+        missing = journal.missing([op for op in plan["ops"] if op["op"] in ("render", "copy")])
+        if missing:
+            raise RuntimeError(f"[journal] refusing to prune: {len(missing)} planned file(s) never landed "
+                               f"(first: {missing[0]})")
+        journal.checkpoint("files")
+        keep_paths.add(journal.path)
+    if changeset_path is not None:
+        keep_paths.add(changeset_path.resolve())
+
+    # 7b) gallery thumbnails for embedded images (consumed by js/image-lightbox.js)
+    if any(op["op"] == "thumbnails" for op in plan["ops"]):
+        embedded = {vault_root / rel: new_rel for rel, new_rel in plan["embedded"].items()}
+        keep_paths |= build_thumbnails(
+            publish_root, plan["md_root_dir"], embedded, plan["config"].get("thumbnails") or {},
+            debug=debug, changes=changes,
+        )
+    if any(op["op"] == "image_meta" for op in plan["ops"]):
+        write_image_meta(plan, changes, debug=debug)
+    if any(op["op"] == "prefetch" for op in plan["ops"]):
+        write_prefetch_map(plan, changes, debug=debug)
 
     # 8) prune anything not needed (protect .obsidian/)
-    prune_extraneous(publish_root, keep_paths, dry=cfg["dry_run"])
+    prune_extraneous(publish_root, keep_paths, changes=changes)
+    if changes is not None and changeset_path is not None:
+        changes.write(changeset_path)
+    if journal is not None:
+        journal.checkpoint("finish")
+
+def apply_plan(plan: dict, jobs: int=0, debug: bool=False, profile: FilterProfile | None = None,
+               resume: bool=False) -> tuple[set[Path], ChangeSet | None]:
+    """
+    Execute a build plan: assets, parallel render/copy, thumbnails, prune. Returns (kept paths, change set).
+    Full builds keep a BuildJournal until they complete; resume skips the file ops it records as done.
+    """
+    publish_root, changeset_path, changes = _open_publish_root(plan)
+    keep_paths: set[Path] = {publish_root / rel for rel in plan["keep"]}
+    ctx = _render_context(plan, profile)
+    journal = None if plan.get("only") else BuildJournal(publish_root, plan_content_digest(plan), resume=resume)
+    if journal is not None and changes is not None:
+        changes.carry(journal.carried())
+    ok = False
+    try:
+        _apply_assets(plan, changes, debug=debug)
+        if journal is not None:
+            journal.checkpoint("assets", dict(changes.status) if changes is not None else None)
+        # 7) copy notes & media under md_root_dir + rewrite links
+        file_ops = [op for op in plan["ops"] if op["op"] in ("render", "copy")]
+        _apply_file_ops(plan, file_ops, ctx, changes, jobs=jobs, debug=debug, journal=journal)
+        if ctx["search"] is not None:
+            write_search_index(plan, ctx["search"], changes, debug=debug)
+        _finish_plan(plan, keep_paths, changeset_path, changes, debug=debug, journal=journal)
+        ok = True
+    finally:
+        if journal is not None:
+            journal.close(complete=ok)
+            keep_paths.discard(journal.path)
+    return keep_paths, changes
+
+def apply_plan_to_archive(plan: dict, archive_path: Path, jobs: int=0, debug: bool=False,
+                          profile: FilterProfile | None = None) -> ArchiveOutput:
+    """
+    Execute a build plan straight into a tar/zip archive. The archive holds exactly the kept files,
+    so there is nothing to prune; nothing under publish_root is written.
+    """
+    cfg = plan["config"]
+    tcfg = cfg.get("thumbnails") or {}
+    thumbs = any(op["op"] == "thumbnails" for op in plan["ops"])
+    prefixes = (f"{plan['md_root_dir']}/{str(tcfg.get('dir', '_thumbs')).strip('/')}/",) if thumbs else ()
+    archive = ArchiveOutput(archive_path, Path(plan["publish_root"]), keep=set(plan["keep"]), keep_prefixes=prefixes)
+    ok = False
+    try:
+        ctx = _render_context(plan, profile)
+        _apply_assets(plan, None, debug=debug, archive=archive)
+        file_ops = [op for op in plan["ops"] if op["op"] in ("render", "copy")]
+        _apply_file_ops(plan, file_ops, ctx, None, jobs=jobs, debug=debug, archive=archive)
+        if ctx["search"] is not None:
+            write_search_index(plan, ctx["search"], archive=archive, debug=debug)
+        if thumbs:
+            embedded = {Path(plan["vault_root"]) / rel: new_rel for rel, new_rel in plan["embedded"].items()}
+            build_thumbnails(Path(plan["publish_root"]), plan["md_root_dir"], embedded, tcfg,
+                             debug=debug, archive=archive)
+        if any(op["op"] == "image_meta" for op in plan["ops"]):
+            write_image_meta(plan, archive=archive, debug=debug)
+        if any(op["op"] == "prefetch" for op in plan["ops"]):
+            write_prefetch_map(plan, archive=archive, debug=debug)
+        ok = True
+    finally:
+        archive.close(ok)
+    if debug:
+        for rel in archive.skipped:
+            tqdm.write(f"[archive] left out {rel} (not in the plan's keep set)")
+    return archive
+
+# ================= Sharded apply: K independent render/copy runs + one merge =================
+# --apply-plan P --shard I/K renders/copies one stable-hash partition and writes its manifest;
+# --apply-plan P --merge-shards checks that all K manifests match P, then builds assets/thumbnails and prunes.
+SHARD_MANIFEST_VERSION = 1
+
+def shard_of(dst: str, shards: int) -> int:
+    """Stable (process- and machine-independent) shard for a destination path."""
+    return int(hashlib.sha1(dst.encode("utf-8")).hexdigest()[:8], 16) % shards
+
+def plan_ops_digest(plan: dict) -> str:
+    return hashlib.sha256(json.dumps(plan["ops"], sort_keys=True).encode("utf-8")).hexdigest()
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    try:
+        index, count = (int(x) for x in spec.split("/", 1))
+    except ValueError:
+        raise ValueError(f"--shard expects I/K (e.g. 0/4), got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"--shard {spec}: need 0 <= I < K")
+    return index, count
+
+def shard_manifest_path(shard_dir: Path, plan_path: Path, index: int, count: int) -> Path:
+    return Path(shard_dir) / f"{Path(plan_path).stem}.shard-{index}-of-{count}.json"
+
+def apply_shard(plan: dict, index: int, count: int, jobs: int=0, debug: bool=False,
+                profile: FilterProfile | None = None) -> dict:
+    """
+    Render/copy the plan's file ops that hash to shard `index` of `count`. Assets, thumbnails
+    and prune are left to merge_shards(). Returns the shard manifest.
+    """
+    publish_root, _, changes = _open_publish_root(plan)
+    if changes is None:
+        changes = ChangeSet(publish_root)  # the manifest always carries per-file hashes
+    ctx = _render_context(plan, profile)
+    file_ops = [op for op in plan["ops"]
+                if op["op"] in ("render", "copy") and shard_of(op["dst"], count) == index]
+    print(f"[shard] {index}/{count}: {len(file_ops)} file ops")
+    _apply_file_ops(plan, file_ops, ctx, changes, jobs=jobs, debug=debug)
+    return {
+        "version": SHARD_MANIFEST_VERSION,
+        "plan": plan_ops_digest(plan),
+        "shard": index,
+        "shards": count,
+        "files": {rel: changes.files[rel] for rel in sorted(changes.files)},
+        "status": {rel: changes.status[rel] for rel in sorted(changes.status)},
+        "search": ctx["search"].partial() if ctx["search"] is not None else None,
+    }
+
+def load_shard_manifests(shard_dir: Path, plan_path: Path, plan: dict) -> list[dict]:
+    """Every manifest for this plan; refuses to continue unless all K shards are present and current."""
+    paths = sorted(Path(shard_dir).glob(f"{Path(plan_path).stem}.shard-*-of-*.json"))
+    manifests = [json.loads(p.read_text(encoding="utf-8")) for p in paths]
+    if not manifests:
+        raise RuntimeError(f"No shard manifests for {plan_path} in {shard_dir}")
+    digest = plan_ops_digest(plan)
+    counts = {m.get("shards") for m in manifests}
+    if len(counts) != 1:
+        raise RuntimeError(f"Shard manifests disagree on the shard count: {sorted(counts, key=str)}")
+    count = counts.pop()
+    for p, m in zip(paths, manifests):
+        if m.get("version") != SHARD_MANIFEST_VERSION or m.get("plan") != digest:
+            raise RuntimeError(f"Shard manifest {p} was produced from a different plan")
+    missing = sorted(set(range(count)) - {m["shard"] for m in manifests})
+    if missing:
+        raise RuntimeError(f"Shard(s) {missing} of {count} have not completed; not merging")
+    written = set().union(*(m["files"] for m in manifests))
+    expected = {op["dst"] for op in plan["ops"] if op["op"] in ("render", "copy")}
+    if expected - written:
+        raise RuntimeError(f"{len(expected - written)} planned file(s) missing from the shard manifests")
+    return manifests
+
+def merge_shards(plan: dict, manifests: list[dict], debug: bool=False) -> tuple[set[Path], ChangeSet | None]:
+    """Assets + thumbnails + prune over the union of completed shards. Returns (kept paths, change set)."""
+    publish_root, changeset_path, changes = _open_publish_root(plan)
+    keep_paths: set[Path] = {publish_root / rel for rel in plan["keep"]}
+    if changes is not None:
+        for m in manifests:
+            changes.absorb(m["files"], m["status"])
+    _apply_assets(plan, changes, debug=debug)
+    if any(op["op"] == "search" for op in plan["ops"]):
+        index = SearchIndex(plan["md_root_dir"], plan["config"].get("search") or {})
+        for m in manifests:
+            index.absorb(m.get("search") or {})
+        write_search_index(plan, index, changes, debug=debug)
+    _finish_plan(plan, keep_paths, changeset_path, changes, debug=debug)
+    return keep_paths, changes
+
+# ================= Python API (import via publish_build.py) =================
+class BuildResult:
+    """What Builder.build() did for one target."""
+    def __init__(self, plan: dict, keep_paths: set[Path] | None, changes: ChangeSet | None = None,
+                 archive: ArchiveOutput | None = None, seconds: float=0.0):
+        self.target = plan.get("target")
+        self.publish_root = Path(plan["publish_root"])
+        self.archive = archive.path if archive is not None else None
+        self.dry_run = keep_paths is None
+        self.notes: list[str] = plan["notes"]
+        if keep_paths is None:
+            self.files = list(plan["keep"])
+        else:
+            self.files = sorted(p.relative_to(self.publish_root).as_posix()
+                                for p in keep_paths if p.is_relative_to(self.publish_root))
+        self.changes: dict[str, list[str]] | None = changes.to_dict()["changes"] if changes is not None else None
+        self.deletes: list[str] = plan["deletes"] if self.dry_run else []
+        self.seconds = seconds
+        self.plan = plan
+
+    def to_dict(self) -> dict:
+        return {
+            "target": self.target,
+            "publish_root": str(self.publish_root),
+            "archive": str(self.archive) if self.archive else None,
+            "dry_run": self.dry_run,
+            "notes": self.notes,
+            "files": self.files,
+            "changes": self.changes,
+            "deletes": self.deletes,
+            "seconds": round(self.seconds, 3),
+        }
+
+class Builder:
+    """
+    Importable builder for tools that build repeatedly (editor hooks, CI checks):
+
+        from publish_build import Builder
+        b = Builder({"vault": "~/Vault", "publish": "~/Publish Vault"})
+        result = b.build()                   # BuildResult
+        text = b.render("Trips/Italy/Day1.md")
+
+    The vault scan, parsed frontmatter, resolved references and per-target plans stay cached
+    between calls; every call re-stats the vault and redoes only what edits invalidated.
+    The steps are also available one by one: scan, select, resolve, plan (map), render, copy, prune.
+    """
+    def __init__(self, config: dict | None = None, config_path: str | Path | None = None):
+        if config_path is not None:
+            cfg = load_config(Path(config_path))
+            self.cfg = finalize_config(_deep_merge(cfg, config)) if config else cfg
+        else:
+            self.cfg = finalize_config(_deep_merge(CFG_DEFAULTS, config or {}))
+        self.profile = FilterProfile.from_config(self.cfg)
+        self._scan: VaultScan | None = None
+        self._plans: dict[str | None, dict] = {}
+        self._contexts: dict[str | None, dict] = {}
+        self._pending: dict[str | None, tuple] = {}
+        self._last_changes: dict[str | None, ChangeSet] = {}
 
+    def targets(self) -> list[str | None]:
+        return [t.get("target") for t in target_configs(self.cfg)]
+
+    def _target_cfg(self, target: str | None) -> dict:
+        tcfgs = target_configs(self.cfg, only=[target] if target else None)
+        if len(tcfgs) != 1:
+            raise ValueError(f"config has {len(tcfgs)} targets; pass one of {[t['target'] for t in tcfgs]}")
+        return tcfgs[0]
+
+    def scan(self, refresh: bool=True) -> VaultScan:
+        if self._scan is None:
+            self._scan = VaultScan(self.cfg, track_changes=True)
+        elif refresh and self._scan.refresh():
+            self._plans.clear()
+            self._contexts.clear()
+        return self._scan
+
+    def _note_path(self, note: str | Path) -> Path:
+        scan = self.scan(refresh=False)
+        p = Path(note)
+        return (p if p.is_absolute() else scan.vault_root / p).resolve()
+
+    def select(self, target: str | None = None) -> list[Path]:
+        return self.scan().select(self._target_cfg(target).get("select") or {})
+
+    def resolve(self, note: str | Path) -> list[tuple[str, Path, str | None]]:
+        scan = self.scan()
+        return scan.resolve(self._note_path(note))
+
+    def plan(self, target: str | None = None) -> dict:
+        scan = self.scan()
+        if target not in self._plans:
+            self._plans[target] = build_plan(self._target_cfg(target), profile=self.profile, scan=scan)
+        return self._plans[target]
+
+    map = plan  # note/media destination maps live in the plan
+
+    def render(self, note: str | Path, target: str | None = None) -> str:
+        """Published text of one selected note (nothing is written)."""
+        plan = self.plan(target)
+        rel = self._note_path(note).relative_to(Path(plan["vault_root"])).as_posix()
+        if rel not in plan["notes"]:
+            raise KeyError(f"{rel} is not selected for {'target ' + target if target else 'this build'}")
+        if target not in self._contexts:
+            self._contexts[target] = _render_context(plan, self.profile)
+        return render_note_text(Path(plan["vault_root"]) / rel, rel[:-3], self._contexts[target])
+
+    def page_weight(self, target: str | None = None) -> dict:
+        """Page-weight report of the current plan (see page_weight_report; nothing is printed)."""
+        return page_weight_report(self.plan(target))
+
+    def copy(self, target: str | None = None, jobs: int | None = None, resume: bool=False) -> ChangeSet:
+        """
+        Assets + render/copy of every planned file (no prune yet), journaled like apply_plan() until
+        prune() completes the build; resume skips the file ops an interrupted build's journal holds.
+        """
+        plan = self.plan(target)
+        stale = self._pending.pop(target, None)
+        if stale is not None:
+            stale[2].close()                    # copied but never pruned: the journal stays behind
+        publish_root, changeset_path, changes = _open_publish_root(plan)
+        if changes is None:
+            # results always carry a change set; the last one doubles as the hash cache
+            last = self._last_changes.get(target)
+            changes = ChangeSet(publish_root, last.to_dict() if last is not None else None)
+        ctx = _render_context(plan, self.profile)
+        journal = BuildJournal(publish_root, plan_content_digest(plan), resume=resume)
+        changes.carry(journal.carried())
+        ok = False
+        try:
+            _apply_assets(plan, changes, debug=self.cfg["debug"])
+            journal.checkpoint("assets", dict(changes.status))
+            file_ops = [op for op in plan["ops"] if op["op"] in ("render", "copy")]
+            _apply_file_ops(plan, file_ops, ctx, changes, jobs=self.cfg.get("jobs", 0) if jobs is None else jobs,
+                            debug=self.cfg["debug"], journal=journal)
+            if ctx["search"] is not None:
+                write_search_index(plan, ctx["search"], changes, debug=self.cfg["debug"])
+            ok = True
+        finally:
+            if not ok:
+                journal.close()
+        self._pending[target] = (changeset_path, changes, journal)
+        return changes
+
+    def prune(self, target: str | None = None) -> set[Path]:
+        """Thumbnails, prune and the change set after copy(). Returns the kept paths."""
+        plan = self.plan(target)
+        if target not in self._pending:
+            raise RuntimeError("prune() needs a completed copy() for this target")
+        changeset_path, changes, journal = self._pending.pop(target)
+        keep_paths: set[Path] = {Path(plan["publish_root"]) / rel for rel in plan["keep"]}
+        ok = False
+        try:
+            _finish_plan(plan, keep_paths, changeset_path, changes, debug=self.cfg["debug"], journal=journal)
+            ok = True
+        finally:
+            journal.close(complete=ok)
+            keep_paths.discard(journal.path)
+        self._last_changes[target] = changes
+        return keep_paths
+
+    def build(self, target: str | None = None, dry_run: bool | None = None, jobs: int | None = None,
+              resume: bool=False) -> BuildResult:
+        t0 = time.perf_counter()
+        plan = self.plan(target)
+        if self.cfg["dry_run"] if dry_run is None else dry_run:
+            return BuildResult(plan, None, seconds=time.perf_counter() - t0)
+        jobs = self.cfg.get("jobs", 0) if jobs is None else jobs
+        if plan["config"].get("archive"):
+            archive = apply_plan_to_archive(plan, Path(plan["config"]["archive"]), jobs=jobs,
+                                            debug=self.cfg["debug"], profile=self.profile)
+            keep = {Path(plan["publish_root"]) / n for n in archive.names}
+            self.scan(refresh=False).record_build()
+            return BuildResult(plan, keep, archive=archive, seconds=time.perf_counter() - t0)
+        changes = self.copy(target, jobs=jobs, resume=resume)
+        keep_paths = self.prune(target)
+        self.scan(refresh=False).record_build()
+        # the publish root changed underneath the plan's delete preview
+        self._plans.pop(target, None)
+        return BuildResult(plan, keep_paths, changes, seconds=time.perf_counter() - t0)
+
+    def build_all(self, dry_run: bool | None = None, jobs: int | None = None, resume: bool=False) -> list[BuildResult]:
+        return [self.build(t, dry_run=dry_run, jobs=jobs, resume=resume) for t in self.targets()]
+
+# ================= Main =================
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--config", help="Path to YAML/JSON config (default: publish.build.yaml|yml|json if present)")
+    ap.add_argument("--vault", help="Override config.vault")
+    ap.add_argument("--publish", help="Override config.publish")
+    ap.add_argument("--dry-run", action="store_true", help="Plan only: print a summary, write nothing (overrides config)")
+    ap.add_argument("--debug",   action="store_true", help="Force debug (overrides config)")
+    ap.add_argument("--changeset", help="Write the run's change set JSON here (overrides config.changeset_file)")
+    ap.add_argument("--jobs", type=int, help="Parallel workers for resolving references and applying a plan (overrides config.jobs)")
+    ap.add_argument("--plan-out", help="Write the computed build plan (JSON) to this path")
+    ap.add_argument("--apply-plan", help="Apply a saved build plan without re-scanning the vault")
+    ap.add_argument("--archive", help="Write the build into this .zip/.tar[.gz|.bz2|.xz] (overrides config.archive)")
+    ap.add_argument("--vault-index", help="Vault listing snapshot: 'auto' (user cache dir) or a path; '' (default) always walks the vault")
+    ap.add_argument("--change-source", choices=("stat", "git"), help="How vault changes are detected (overrides config)")
+    ap.add_argument("--only", action="append", metavar="GLOB",
+                    help="Render/copy only notes matching GLOB (and their media); no prune (repeatable)")
+    ap.add_argument("--resume", action="store_true",
+                    help="Continue an interrupted directory build: skip the file ops its journal records as done")
+    ap.add_argument("--page-weight", action="store_true",
+                    help="Print the page-weight report and check its budgets (enables config.page_weight)")
+    ap.add_argument("--target", action="append", help="Build only this target (config.targets[].name; repeatable)")
+    ap.add_argument("--shard", help="With --apply-plan: render/copy only shard I of K (e.g. 0/4) and write its manifest")
+    ap.add_argument("--merge-shards", action="store_true",
+                    help="With --apply-plan: combine the shard manifests, then build assets/thumbnails and prune")
+    ap.add_argument("--shard-dir", help="Where shard manifests are written/read (default: next to the plan)")
+    args = ap.parse_args()
+    if (args.shard or args.merge_shards) and not args.apply_plan:
+        ap.error("--shard/--merge-shards need --apply-plan (write one with --dry-run --plan-out)")
+    if args.shard and args.merge_shards:
+        ap.error("--shard and --merge-shards are separate steps")
+    if args.only and (args.shard or args.merge_shards or args.archive):
+        ap.error("--only is a partial directory build; it cannot be combined with --archive or shards")
+    if args.archive and (args.shard or args.merge_shards):
+        ap.error("--archive cannot be combined with sharded builds")
+    if args.resume and (args.only or args.shard or args.merge_shards or args.archive or args.dry_run):
+        ap.error("--resume continues a full directory build; it cannot be combined with --only, --archive, shards or --dry-run")
+
+    if args.apply_plan:
+        plan = load_plan(Path(args.apply_plan))
+        cfg = plan["config"]
+        cfg["dry_run"] = False  # a plan saved by --dry-run is still meant to be applied
+        print(f"[plan] applying {args.apply_plan} (created {plan.get('created')})")
+    else:
+        cfg = load_config(Path(args.config) if args.config else None)
+
+    if args.vault:   cfg["vault"]   = args.vault
+    if args.publish:
+        if cfg.get("targets") and not args.apply_plan:
+            raise SystemExit("--publish cannot be combined with config.targets; set targets[].publish instead")
+        cfg["publish"] = args.publish
+    if args.dry_run: cfg["dry_run"] = True
+    if args.debug:   cfg["debug"]   = True
+    if args.changeset: cfg["changeset_file"] = args.changeset
+    if args.archive:
+        if cfg.get("targets") and not args.apply_plan:
+            raise SystemExit("--archive cannot be combined with config.targets; set targets[].archive instead")
+        cfg["archive"] = args.archive
+    if args.jobs is not None: cfg["jobs"] = args.jobs
+    if args.vault_index is not None: cfg["vault_index"] = args.vault_index
+    if args.change_source: cfg["change_source"] = args.change_source
+    if args.page_weight: cfg["page_weight"] = {**(cfg.get("page_weight") or {}), "enabled": True}
+
+    profile = FilterProfile.from_config(cfg)
+    if args.shard or args.merge_shards:
+        shard_dir = Path(args.shard_dir) if args.shard_dir else Path(args.apply_plan).parent
+        if args.shard:
+            index, count = parse_shard(args.shard)
+            try:
+                manifest = apply_shard(plan, index, count, jobs=int(cfg.get("jobs") or 0),
+                                       debug=cfg["debug"], profile=profile)
+            except FilterBudgetExceeded as e:
+                raise SystemExit(str(e))
+            out = shard_manifest_path(shard_dir, Path(args.apply_plan), index, count)
+            out.parent.mkdir(parents=True, exist_ok=True)
+            out.write_text(json.dumps(manifest, indent=1, ensure_ascii=False) + "\n", encoding="utf-8")
+            print(f"[shard] manifest written to {out}")
+            if profile.enabled:
+                profile.report()
+            return
+        manifests = load_shard_manifests(shard_dir, Path(args.apply_plan), plan)
+        keep_paths, changes = merge_shards(plan, manifests, debug=cfg["debug"])
+        for m in manifests:
+            shard_manifest_path(shard_dir, Path(args.apply_plan), m["shard"], m["shards"]).unlink()
+        print_build_summary(plan, keep_paths, changes)
+        print("Done.")
+        return
+
+    scan = None
+    if args.apply_plan:
+        plans = [narrow_plan(plan, args.only) if args.only else plan]
+    else:
+        # one vault scan + resolution; every target selects, maps, renders and prunes on its own
+        targets = target_configs(cfg, only=args.target)
+        scan = VaultScan(cfg)
+        plans = (build_plan(tcfg, profile=profile, scan=scan, only=args.only) for tcfg in targets)
+
+    for plan in plans:
+        if args.plan_out:
+            plan_out = Path(args.plan_out)
+            if plan.get("target"):
+                plan_out = plan_out.with_name(f"{plan_out.stem}.{plan['target']}{plan_out.suffix}")
+            save_plan(plan, plan_out)
+            print(f"[plan] written to {plan_out}")
+        if (plan["config"].get("page_weight") or {}).get("enabled"):
+            try:
+                page_weight_stage(plan, dry=cfg["dry_run"])
+            except PageWeightBudgetExceeded as e:
+                raise SystemExit(str(e))
+        if cfg["dry_run"]:
+            print_plan_summary(plan, debug=cfg["debug"])
+            continue
+
+        archive_path = plan["config"].get("archive")
+        if archive_path and plan.get("only"):
+            raise SystemExit("--only is a partial directory build; it cannot write config.archive")
+        try:
+            if archive_path:
+                archive = apply_plan_to_archive(plan, Path(archive_path), jobs=int(cfg.get("jobs") or 0),
+                                                debug=cfg["debug"], profile=profile)
+                print_build_summary(plan, {Path(plan["publish_root"]) / n for n in archive.names}, archive=archive)
+                continue
+            keep_paths, changes = apply_plan(plan, jobs=int(cfg.get("jobs") or 0), debug=cfg["debug"],
+                                             profile=profile, resume=args.resume)
+        except FilterBudgetExceeded as e:
+            # raised before pruning (or before the archive is moved into place): previous output is left as is
+            if profile.enabled:
+                profile.report()
+            raise SystemExit(str(e))
+        print_build_summary(plan, keep_paths, changes)
+
+    if profile.enabled:
+        profile.report()
+    if not cfg["dry_run"]:
+        if scan is not None and not args.only:
+            scan.record_build()
+        print("Done.")
+
+def print_build_summary(plan: dict, keep_paths: set[Path], changes: ChangeSet | None = None,
+                        archive: ArchiveOutput | None = None):
     # 9) summary
-    print("\n=== Publish vault build ===")
-    print(f"Main vault:     {vault_root}")
-    print(f"Publish vault:  {publish_root}")
-    print(f"Root dir:       {MD_ROOT_DIR}/")
-    print(f"Notes scanned:  {len(md_files)}")
-    print(f"Selected:       {len(publish_notes)} notes (publish:true only)")
+    cfg = plan["config"]
+    publish_root = Path(plan["publish_root"])
+    names = archive.names if archive is not None else None
+    def _present(name: str) -> bool:
+        return name in names if names is not None else (publish_root / name).exists()
+    def _logos() -> bool:
+        return any(n.startswith("logo.") for n in names) if names is not None else any(publish_root.glob('logo.*'))
+    print("\n=== Publish vault build" + (f": {plan['target']}" if plan.get("target") else "") + " ===")
+    print(f"Main vault:     {plan['vault_root']}")
+    if archive is not None:
+        print(f"Archive:        {archive.path} ({archive.kind}, {len(names)} files)")
+    else:
+        print(f"Publish vault:  {publish_root}")
+    print(f"Root dir:       {plan['md_root_dir']}/")
+    print(f"Notes scanned:  {plan['stats']['md_files']}")
+    print(f"Selected:       {plan['stats']['selected']} notes ({describe_select(cfg.get('select') or {})} only)")
     print(f"Files kept:     {len(keep_paths)} (notes + media + root assets)")
     print("Hidden files:   " + ("INCLUDED" if cfg["include_hidden"] else "SKIPPED"))
-    print("Styles:         " + ("publish.css present" if (publish_root/'publish.css').exists() else "none"))
-    print("Scripts:        " + ("publish.js present" if (publish_root/'publish.js').exists() else "none"))
-    print("Logos:          " + ("logo.* present" if any(publish_root.glob('logo.*')) else "none"))
-    print("Done.")
+    print("Styles:         " + ("publish.css present" if _present("publish.css") else "none"))
+    print("Scripts:        " + ("publish.js present" if _present("publish.js") else "none"))
+    print("Logos:          " + ("logo.* present" if _logos() else "none"))
+    if changes is not None and not plan.get("only"):
+        # partial builds leave the change set file as the last full build wrote it
+        c = changes.summary()
+        print(f"Changes:        +{c['added']} ~{c['modified']} -{c['deleted']} ={c['unchanged']} -> {_changeset_path(cfg, publish_root)}")
 
-def prune_extraneous(dest_root: Path, keep_paths: set[Path], dry: bool=False):
+def prune_extraneous(dest_root: Path, keep_paths: set[Path], dry: bool=False, changes: ChangeSet | None = None):
     def _is_protected(p: Path) -> bool:
         try:
             rel = p.relative_to(dest_root)
@@ -1188,6 +4980,7 @@ def prune_extraneous(dest_root: Path, keep_paths: set[Path], dry: bool=False):
             if dry: tqdm.write(f"[dry] delete {p.relative_to(dest_root)}")
             else:
                 assert_in_publish_root(dest_root, p)
+                if changes is not None: changes.record_deleted(p)
                 p.unlink()
     for d in sorted([x for x in dest_root.rglob("*") if x.is_dir()], key=lambda x: len(x.parts), reverse=True):
         if _is_protected(d):
@@ -35,11 +35,13 @@ function loadScript(path, { id, module = false, defer = true, async = false, rep
    Load your scripts (classic)
    =========================== */
 loadScript('/js/style-settings.js');
+loadScript('/js/image-meta.js');
 loadScript('/js/photo-captions.js');
 loadScript('/js/auto-light-dark-switching.js');
 loadScript('/js/sanitize-filenames.js');
 loadScript('/js/image-lightbox.js');
 loadScript('/js/next-previous-story.js');
+loadScript('/js/search-index.js');
 loadScript('/js/h1-page-header.js');
 loadScript('/js/insert-maps.js');
 loadScript('/js/insert-dates.js');
@@ -0,0 +1,11 @@
+# publish_build.py — importable name for publish.build.py (a dotted file name cannot be imported)
+#   from publish_build import Builder
+#   result = Builder({"vault": "..", "publish": "../../Publish Vault"}).build()
+import importlib.util as _util
+import sys as _sys
+from pathlib import Path as _Path
+
+_spec = _util.spec_from_file_location(__name__, _Path(__file__).resolve().with_name("publish.build.py"))
+_module = _util.module_from_spec(_spec)
+_sys.modules[__name__] = _module
+_spec.loader.exec_module(_module)
@@ -0,0 +1,95 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import publish_build  # noqa: E402  (loads publish.build.py)
+
+
+@pytest.fixture(autouse=True)
+def _user_cache(tmp_path, monkeypatch):
+    """Keep snapshots and caches that default to the user cache dir inside the test's tmp_path."""
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def pb():
+    return publish_build
+
+
+@pytest.fixture
+def write(tmp_path):
+    """write("a/b.md", "text") -> Path under tmp_path, parents created."""
+    def _write(rel: str, text: str | bytes = "") -> Path:
+        p = tmp_path / rel
+        p.parent.mkdir(parents=True, exist_ok=True)
+        if isinstance(text, bytes):
+            p.write_bytes(text)
+        else:
+            p.write_text(text, encoding="utf-8")
+        return p
+    return _write
+
+
+@pytest.fixture
+def vault(write, tmp_path):
+    """A tiny vault: two published notes with media, one draft. Returns the vault root."""
+    write("vault/Home/Home.md", "---\npublish: true\ntitle: Home\n---\nWelcome ![[pic.png]] and [[Day1]].\n")
+    write("vault/Trips/Italy/Day1.md",
+          "---\npublish: true\n---\n# Rome\n![[rome.jpg]]\nBack [[Home]]. CALEB-PRIVATE\n")
+    write("vault/Trips/Italy/rome.jpg", b"\xff\xd8\xff\xe0rome")
+    write("vault/Home/pic.png", b"\x89PNGpic")
+    write("vault/Drafts/Draft.md", "---\npublish: false\n---\nnot yet ![[draft.png]]\n")
+    write("vault/Drafts/draft.png", b"\x89PNGdraft")
+    return tmp_path / "vault"
+
+
+@pytest.fixture
+def base_cfg(vault, tmp_path):
+    """Config for the tiny vault, publishing to tmp_path/publish."""
+    return {
+        "vault": str(vault),
+        "publish": str(tmp_path / "publish"),
+        "md_root_dir": "content",
+        "md_folderpath_rewrite": [{"pattern": "^Trips/", "replacement": "Stories/"}],
+        "global_contents_filter": [{"pattern": "CALEB-PRIVATE", "replacement": "[redacted]"}],
+    }
+
+
+@pytest.fixture
+def config_file(pb, base_cfg, tmp_path):
+    """config_file(**overrides) -> base_cfg (+ overrides) written as tmp_path/publish.build.json."""
+    def _write(**over) -> Path:
+        path = tmp_path / "publish.build.json"
+        path.write_text(json.dumps(pb._deep_merge(base_cfg, over)), encoding="utf-8")
+        return path
+    return _write
+
+
+@pytest.fixture
+def make_cfg(pb, config_file):
+    """make_cfg(**overrides) -> the config as --config would load it."""
+    def _make(**over):
+        return pb.load_config(config_file(**over))
+    return _make
+
+
+@pytest.fixture
+def run_build(pb, config_file, monkeypatch):
+    """run_build(*flags, **overrides): run the CLI on base_cfg (+ overrides)."""
+    def _run(*flags, **over):
+        monkeypatch.setattr(sys, "argv", ["publish.build.py", "--config", str(config_file(**over)), *flags])
+        pb.main()
+    return _run
+
+
+@pytest.fixture
+def snapshot():
+    """snapshot(root) -> {relative posix path: bytes} for every file under root."""
+    def _snap(root: Path) -> dict[str, bytes]:
+        root = Path(root)
+        return {p.relative_to(root).as_posix(): p.read_bytes() for p in sorted(root.rglob("*")) if p.is_file()}
+    return _snap
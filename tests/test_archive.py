@@ -0,0 +1,41 @@
+import tarfile
+import zipfile
+
+import pytest
+
+
+def _members(path):
+    if path.name.endswith(".zip"):
+        with zipfile.ZipFile(path) as z:
+            return {n: z.read(n) for n in z.namelist()}
+    with tarfile.open(path) as t:
+        return {m.name: t.extractfile(m).read() for m in t.getmembers() if m.isfile()}
+
+
+@pytest.mark.parametrize("name", ["site.zip", "site.tar.gz", "site.tar"])
+def test_archive_holds_exactly_the_directory_build(pb, make_cfg, tmp_path, snapshot, name):
+    pb.apply_plan(pb.build_plan(make_cfg(publish=str(tmp_path / "dir"))))
+    expected = snapshot(tmp_path / "dir")
+
+    (tmp_path / "publish").mkdir()
+    (tmp_path / "publish/stale.html").write_text("old", encoding="utf-8")
+    plan = pb.build_plan(make_cfg())
+    archive = pb.apply_plan_to_archive(plan, tmp_path / "out" / name)
+    assert _members(tmp_path / "out" / name) == expected
+    assert archive.names == set(expected)
+    # the publish root is neither written nor pruned
+    assert snapshot(tmp_path / "publish") == {"stale.html": b"old"}
+    assert not (tmp_path / "out" / (name + ".tmp")).exists()
+
+
+def test_archive_kind_rejects_unknown_suffixes(pb):
+    assert pb.archive_kind("a/site.TGZ")[0] == "tar"
+    with pytest.raises(ValueError, match="archive must end in one of"):
+        pb.archive_kind("site.rar")
+
+
+def test_cli_archive_flag(run_build, tmp_path, snapshot):
+    run_build(publish=str(tmp_path / "dir"))
+    run_build("--archive", str(tmp_path / "site.tgz"))
+    assert _members(tmp_path / "site.tgz") == snapshot(tmp_path / "dir")
+    assert not (tmp_path / "publish").exists()
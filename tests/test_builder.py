@@ -0,0 +1,59 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+
+@pytest.fixture
+def builder(pb, base_cfg):
+    return pb.Builder(base_cfg)
+
+
+def test_shim_loads_the_script(pb):
+    assert sys.modules["publish_build"] is pb
+    assert Path(pb.__spec__.origin).name == "publish.build.py"
+    assert pb.Builder and pb.BuildResult
+
+
+def test_build_writes_the_selected_notes_and_their_media(pb, builder, tmp_path):
+    result = builder.build()
+    assert isinstance(result, pb.BuildResult)
+    assert not result.dry_run
+    assert result.notes == ["Home/Home.md", "Trips/Italy/Day1.md"]
+    assert {"content/Home/Home.md", "content/Stories/Italy/Day1.md", "content/Trips/Italy/rome.jpg",
+            "content/Home/pic.png", "publish.css", "publish.js"} <= set(result.files)
+    assert not any("raft" in f for f in result.files)
+    for rel in result.files:
+        assert (tmp_path / "publish" / rel).is_file()
+
+    day = (tmp_path / "publish/content/Stories/Italy/Day1.md").read_text(encoding="utf-8")
+    assert "![[content/Trips/Italy/rome.jpg]]" in day
+    assert "[[Home/Home]]" in day
+    assert "[redacted]" in day and "CALEB" not in day
+    assert set(result.changes["added"]) == set(result.files)
+
+
+def test_rebuild_reports_unchanged_then_picks_up_edits(builder, vault):
+    first = builder.build()
+    second = builder.build()
+    assert second.changes["added"] == second.changes["modified"] == []
+    assert set(second.changes["unchanged"]) == set(first.files)
+
+    note = vault / "Home/Home.md"
+    note.write_text(note.read_text(encoding="utf-8") + "\nMore.\n", encoding="utf-8")
+    third = builder.build()
+    assert third.changes["modified"] == ["content/Home/Home.md"]
+
+
+def test_dry_run_and_render_write_nothing(builder, tmp_path):
+    result = builder.build(dry_run=True)
+    assert result.dry_run and "content/Home/Home.md" in result.files
+    assert "[[Stories/Italy/Day1]]" in builder.render("Home/Home.md")
+    assert not (tmp_path / "publish").exists()
+    with pytest.raises(KeyError):
+        builder.render("Drafts/Draft.md")
+
+
+def test_prune_needs_copy(builder):
+    with pytest.raises(RuntimeError):
+        builder.prune()
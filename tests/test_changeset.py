@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+
+
+def _sha(b: bytes) -> str:
+    return hashlib.sha256(b).hexdigest()
+
+
+def test_write_statuses_and_untouched_mtime(pb, tmp_path):
+    root = tmp_path / "pub"
+    dst = root / "a/x.md"
+    changes = pb.ChangeSet(root)
+    assert pb.write_bytes_if_changed(root, dst, b"one", changes) == "added"
+    mtime = dst.stat().st_mtime_ns
+    assert pb.write_bytes_if_changed(root, dst, b"one", changes) == "unchanged"
+    assert dst.stat().st_mtime_ns == mtime
+    assert pb.write_bytes_if_changed(root, dst, b"two", changes) == "modified"
+    assert changes.files["a/x.md"]["sha256"] == _sha(b"two")
+    assert not (root / "a/x.md.tmp").exists()
+
+
+def test_cached_hash_skips_rehashing_matching_stamps(pb, tmp_path, monkeypatch):
+    root = tmp_path / "pub"
+    dst = root / "x.bin"
+    first = pb.ChangeSet(root)
+    pb.write_bytes_if_changed(root, dst, b"payload", first)
+    cs = root / "changes.json"
+    first.write(cs)
+
+    second = pb.ChangeSet.load(root, cs)
+    monkeypatch.setattr(pb, "_sha256_file", lambda p: "rehashed")
+    assert second.cached_hash(dst) == _sha(b"payload")
+    os.utime(dst, ns=(0, 0))                            # stamp no longer matches
+    assert second.cached_hash(dst) == "rehashed"
+
+
+def test_copy_reuses_dst_hash_when_copy2_kept_the_mtime(pb, tmp_path, write):
+    root = tmp_path / "pub"
+    src = write("v/img.png", b"\x89PNG-1")
+    changes = pb.ChangeSet(root)
+    assert pb.copy_file_if_changed(root, src, root / "img.png", changes) == "added"
+    assert pb.copy_file_if_changed(root, src, root / "img.png", changes) == "unchanged"
+    src.write_bytes(b"\x89PNG-2")                       # same size, new content and mtime
+    assert pb.copy_file_if_changed(root, src, root / "img.png", changes) == "modified"
+    assert (root / "img.png").read_bytes() == b"\x89PNG-2"
+
+
+def test_prune_records_deletions_but_not_files_added_and_removed_in_one_run(pb, tmp_path):
+    root = tmp_path / "pub"
+    changes = pb.ChangeSet(root)
+    old = root / "old.md"
+    old.parent.mkdir(parents=True)
+    old.write_text("stale")
+    pb.write_bytes_if_changed(root, root / "temp.md", b"t", changes)
+    pb.write_bytes_if_changed(root, root / "keep.md", b"k", changes)
+    pb.prune_extraneous(root, {root / "keep.md"}, changes=changes)
+    d = changes.to_dict()
+    assert d["changes"] == {"added": ["keep.md"], "modified": [], "deleted": ["old.md"], "unchanged": []}
+    assert d["summary"]["deleted"] == 1
+    assert d["deleted"]["old.md"]["sha256"] == _sha(b"stale")
+
+
+def test_unreadable_previous_change_set_is_ignored(pb, tmp_path, capsys):
+    cs = tmp_path / "changes.json"
+    cs.write_text("{not json")
+    changes = pb.ChangeSet.load(tmp_path, cs)
+    assert changes.files == {}
+    assert "Ignoring unreadable change set" in capsys.readouterr().out
+
+
+def test_change_set_file_round_trip(pb, tmp_path):
+    root = tmp_path / "pub"
+    changes = pb.ChangeSet(root)
+    pb.write_bytes_if_changed(root, root / "n.md", b"n", changes)
+    changes.write(root / "sub/changes.json")
+    data = json.loads((root / "sub/changes.json").read_text())
+    assert data["version"] == 1 and data["files"]["n.md"]["size"] == 1
+
+
+def test_rebuild_reports_everything_unchanged_and_leaves_mtimes_alone(run_build, tmp_path):
+    run_build(changeset_file=".publish-changes.json")
+    note = tmp_path / "publish/content/Stories/Italy/Day1.md"
+    assert "[redacted]" in note.read_text(encoding="utf-8")
+    mtime = note.stat().st_mtime_ns
+
+    run_build(changeset_file=".publish-changes.json")
+    data = json.loads((tmp_path / "publish/.publish-changes.json").read_text(encoding="utf-8"))
+    assert data["summary"]["added"] == data["summary"]["modified"] == data["summary"]["deleted"] == 0
+    assert "content/Stories/Italy/Day1.md" in data["changes"]["unchanged"]
+    assert note.stat().st_mtime_ns == mtime
+
+
+def test_edits_and_removals_show_up_in_the_next_change_set(run_build, vault, tmp_path):
+    run_build(changeset_file=".publish-changes.json")
+    (vault / "Home/Home.md").write_text("---\npublish: true\n---\nedited\n", encoding="utf-8")
+    (vault / "Trips/Italy/Day1.md").write_text("---\npublish: false\n---\n", encoding="utf-8")
+    run_build(changeset_file=".publish-changes.json")
+    changes = json.loads((tmp_path / "publish/.publish-changes.json").read_text(encoding="utf-8"))["changes"]
+    assert changes["modified"] == ["content/Home/Home.md"]
+    assert {"content/Stories/Italy/Day1.md", "content/Trips/Italy/rome.jpg"} <= set(changes["deleted"])
@@ -0,0 +1,62 @@
+import re
+
+import pytest
+
+
+@pytest.mark.parametrize("pattern, problem", [
+    (r"(a+)+", "nested quantifier"),
+    (r"(?:x\w*)*y", "nested quantifier"),
+    (r"\s*\s*x", "adjacent unbounded quantifiers"),
+    (r"(a|ab)*c", "alternation with overlapping branches"),
+])
+def test_lint_regex_flags_backtracking_shapes(pb, pattern, problem):
+    found = pb.lint_regex(re.compile(pattern))
+    assert any(problem in p for p in found), found
+
+
+@pytest.mark.parametrize("pattern", [r"CALEB-PRIVATE", r"(a|b)*c", r"^\s*#+\s", r"\d{4}-\d{2}", r"(?s)<!--.*?-->"])
+def test_lint_regex_leaves_ordinary_patterns_alone(pb, pattern):
+    assert pb.lint_regex(re.compile(pattern)) == []
+
+
+def test_finalize_config_warns_about_risky_filters(make_cfg, capsys):
+    make_cfg(global_contents_filter=[{"pattern": r"(\w+\s?)+$", "replacement": ""}])
+    assert "[regex] global_contents_filter[0]" in capsys.readouterr().out
+
+
+def test_finalize_config_checks_every_target_filter(make_cfg, tmp_path, capsys):
+    risky = [{"pattern": r"(a|a)*b", "replacement": ""}]
+    make_cfg(targets=[{"name": "public", "publish": str(tmp_path / "public")},
+                      {"name": "drafts", "publish": str(tmp_path / "drafts"), "md_folderpath_rewrite": risky}])
+    out = capsys.readouterr().out
+    assert "[regex] drafts:md_folderpath_rewrite[0]" in out
+    assert "public:" not in out and out.count("[regex]") == 1
+    with pytest.raises(ValueError, match=r"drafts:global_contents_filter\[0\] invalid regex"):
+        make_cfg(targets=[{"name": "drafts", "publish": str(tmp_path / "drafts"),
+                           "global_contents_filter": [{"pattern": "(", "replacement": ""}]}])
+
+
+def test_profile_counts_calls_and_matches_per_rule(pb):
+    profile = pb.FilterProfile(enabled=True)
+    rx = re.compile("a")
+    profile.register("global_contents_filter", [(rx, "b")])
+    assert pb.apply_text_filters("banana", [(rx, "o")], profile, note="N.md") == "bonono"
+    assert pb.apply_text_filters("a", [(rx, "o")], profile, note="M.md") == "o"
+    [((label, where), (calls, _, _, matches))] = profile.stats.items()
+    assert (label, where, calls, matches) == ("global_contents_filter[0] 'a'", "body", 2, 4)
+
+
+def test_budget_warns_once_per_note(pb, capsys):
+    profile = pb.FilterProfile(budget_ms=1e-9)
+    regs = [(re.compile("a"), "b"), (re.compile("b"), "c")]
+    assert pb.apply_text_filters("aaa", regs, profile, note="N.md") == "ccc"
+    out = capsys.readouterr().out
+    assert out.count("[filters] N.md") == 1 and "budget" in out
+
+
+def test_budget_fail_interrupts_a_runaway_rule(pb):
+    if not hasattr(__import__("signal"), "setitimer"):
+        pytest.skip("needs POSIX interval timers")
+    profile = pb.FilterProfile(budget_ms=50, action="fail")
+    with pytest.raises(pb.FilterBudgetExceeded, match="still running"):
+        pb.apply_text_filters("a" * 40 + "b", [(re.compile(r"(a+)+$"), "")], profile, note="N.md")
@@ -0,0 +1,78 @@
+import itertools
+from datetime import date
+
+import pytest
+
+
+def _proj(pb, **fcfg):
+    return pb.FrontmatterProjection(fcfg)
+
+
+def test_allow_deny_globs_deny_wins(pb):
+    p = _proj(pb, allow=["title", "date*", "sync_*"], deny=["sync_*"])
+    assert [k for k in ("title", "date", "date_modified", "sync_id", "tags") if p.keeps(k)] == [
+        "title", "date", "date_modified"]
+    assert pb.FrontmatterProjection.from_config({"frontmatter": {"allow": [], "deny": []}}) is None
+
+
+def test_project_block_copies_kept_entries_verbatim(pb):
+    block = '# leading comment\ntitle: "Rome: day one"  # quoted\ntags:\n  - italy\n  - rome\nsync_id: 42\n"quoted key": x'
+    assert _proj(pb, deny=["sync_id"]).project_block(block) == (
+        '# leading comment\ntitle: "Rome: day one"  # quoted\ntags:\n  - italy\n  - rome\n"quoted key": x')
+    assert _proj(pb, allow=["tags"]).project_block(block) == "# leading comment\ntags:\n  - italy\n  - rome"
+    assert _proj(pb, deny=["*"]).project_block(block) == ""
+
+
+@pytest.mark.parametrize("kind,value,expected", [
+    ("list", "a, b,,c", ["a", "b", "c"]),
+    ("list", 3, [3]),
+    ("date", "2024-10-01T09:00", date(2024, 10, 1)),
+    ("date", "soon", "soon"),
+    ("number", " 12 ", 12),
+    ("number", "1.5", 1.5),
+    ("string", date(2024, 1, 2), "2024-01-02"),
+    ("string", 7, "7"),
+])
+def test_normalize(pb, kind, value, expected):
+    assert pb._fm_normalize(value, kind) == expected
+
+
+def test_plan_note_edits(pb):
+    pytest.importorskip("yaml")
+    p = _proj(pb, normalize={"tags": "list", "lat": "string"}, drop_empty=True)
+    edits = p.plan_note({"tags": "a, b", "lat": 41.9, "empty": "  ", "title": "kept as is"})
+    assert edits == {"drop": ["empty"], "set": {"tags": "tags: [a, b]", "lat": "lat: '41.9'"}}
+    assert p.plan_note({"title": "x"}) is None
+
+    p = pb.FrontmatterProjection({"drop_empty": True, "normalize": {"tags": "list"}}, {"n.md": edits})
+    assert p.project_block("title: kept as is\ntags: a, b\nempty:\nlat: 41.9", "n.md") == (
+        "title: kept as is\ntags: [a, b]\nlat: '41.9'")
+
+
+@pytest.fixture
+def head_ctx(pb):
+    return {"frontmatter": _proj(pb, deny=["sync_*"]), "blocks": {"n.md": '<div data-publish-static>B</div>'}}
+
+
+def test_note_head_span(pb, head_ctx):
+    end, repl = pb.note_head_span("---\ntitle: T\nsync_id: 1\n---\nbody\n", head_ctx, "n.md")
+    assert repl == "---\ntitle: T\n---\n<div data-publish-static>B</div>\n\n"
+    # no frontmatter: blocks go on top
+    assert pb.note_head_span("body\n", head_ctx, "n.md") == (0, "<div data-publish-static>B</div>\n\n")
+
+
+def test_read_note_head_matches_the_in_memory_head_for_any_chunk_size(pb, head_ctx, tmp_path):
+    """The streamed head is decided from a prefix; it must agree with note_head_span on the full text."""
+    parts = ["---", "\n", "a: 1", "sync_id: q", "  - y", "#c", "c:", "text", "\r\n", " "]
+    p = tmp_path / "n.md"
+    for n, combo in enumerate(itertools.product(parts, repeat=4)):
+        if n % 7:
+            continue
+        raw = "---\n" + "".join(combo) + "\n---\nbody"
+        p.write_text(raw, encoding="utf-8", newline="")
+        text = pb.read_text(p)
+        span = pb.note_head_span(text, head_ctx, "n.md")
+        ref = text if span is None else span[1] + text[span[0]:]
+        for chunk in (1, 3, 64):
+            k, repl = pb.read_note_head(p, lambda c: pb.note_head_span(c, head_ctx, "n.md"), "strict", chunk)
+            assert repl + text[k:] == ref, (raw, chunk)
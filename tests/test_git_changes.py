@@ -0,0 +1,116 @@
+import shutil
+import subprocess
+
+import pytest
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="needs git")
+
+
+@pytest.fixture
+def repo(tmp_path, vault, monkeypatch):
+    """tmp_path as a git work tree with the vault one level down (so paths carry a prefix)."""
+    for k, v in {"GIT_AUTHOR_NAME": "t", "GIT_AUTHOR_EMAIL": "t@t", "GIT_COMMITTER_NAME": "t",
+                 "GIT_COMMITTER_EMAIL": "t@t", "GIT_CONFIG_GLOBAL": "/dev/null"}.items():
+        monkeypatch.setenv(k, v)
+    (tmp_path / "outside.md").write_text("x", encoding="utf-8")
+
+    def git(*args):
+        return subprocess.run(["git", "-C", str(tmp_path), *args], check=True,
+                              capture_output=True, text=True).stdout.strip()
+    git("init", "-q")
+    git("add", "-A")
+    git("commit", "-qm", "base")
+    return git
+
+
+def test_outside_a_work_tree_there_is_nothing_to_detect(pb, vault, monkeypatch):
+    monkeypatch.setenv("GIT_CEILING_DIRECTORIES", str(vault.parent))
+    assert pb.GitChanges.detect(vault, None) is None
+
+
+def test_committed_changes_since_the_baseline(pb, repo, vault, tmp_path):
+    base = repo("rev-parse", "HEAD")
+    repo("mv", "vault/Home/Home.md", "vault/Home/Start.md")
+    (vault / "New.md").write_text("new", encoding="utf-8")
+    (vault / "Trips/Italy/Day1.md").write_text("edited", encoding="utf-8")
+    repo("rm", "-q", "vault/Drafts/Draft.md")
+    (tmp_path / "outside.md").write_text("y", encoding="utf-8")
+    repo("add", "-A")
+    repo("commit", "-qm", "edits")
+
+    ch = pb.GitChanges.detect(vault, base)
+    assert ch.complete and ch.since == base and ch.commit == repo("rev-parse", "HEAD")
+    assert ch.renamed == {"Home/Home.md": "Home/Start.md"}
+    assert (ch.added, ch.modified, ch.deleted) == ({"New.md"}, {"Trips/Italy/Day1.md"}, {"Drafts/Draft.md"})
+    assert ch.dirty == set()
+
+
+def test_porcelain_status_entries_mark_both_sides_of_a_rename_dirty(pb, repo, vault, tmp_path):
+    head = repo("rev-parse", "HEAD")
+    repo("mv", "vault/Home/Home.md", "vault/Home/Start.md")
+    (vault / "Trips/Italy/Day1.md").write_text("edited", encoding="utf-8")
+    (vault / "Trips/Italy/untracked.md").write_text("u", encoding="utf-8")
+    (tmp_path / "outside.md").write_text("y", encoding="utf-8")
+
+    ch = pb.GitChanges.detect(vault, head)
+    assert ch.complete and not (ch.added or ch.modified or ch.deleted or ch.renamed)
+    assert ch.dirty == {"Home/Home.md", "Home/Start.md", "Trips/Italy/Day1.md", "Trips/Italy/untracked.md"}
+
+
+def test_a_missing_baseline_means_a_full_scan(pb, repo, vault, capsys):
+    ch = pb.GitChanges.detect(vault, "0" * 40)
+    assert not ch.complete and ch.since is None
+    assert "is gone" in capsys.readouterr().out
+    assert pb.GitChanges.detect(vault, None).summary().startswith("no baseline commit")
+
+
+def test_scan_refresh_reparses_what_git_reports(pb, repo, vault, make_cfg, tmp_path):
+    scan = pb.VaultScan(make_cfg(change_source="git", vault_index=str(tmp_path / "cache/vault.idx")), track_changes=True)
+    scan.record_build()
+    day1 = vault / "Trips/Italy/Day1.md"
+    day1.write_text("---\npublish: false\n---\n", encoding="utf-8")
+    assert scan.refresh()
+    assert scan.git.dirty == {"Trips/Italy/Day1.md"}
+    assert scan.frontmatter[day1] == {"publish": False}
+    assert day1 not in scan.select({"publish": True})
+
+
+def test_git_change_source_plans_like_stat(pb, repo, make_cfg):
+    stat = pb.build_plan(make_cfg())
+    git = pb.build_plan(make_cfg(change_source="git"))
+    assert git["ops"] == stat["ops"] and git["notes"] == stat["notes"]
+
+
+def test_ignored_notes_are_always_looked_at(pb, repo, vault, make_cfg, tmp_path):
+    (tmp_path / ".gitignore").write_text("vault/Secret/\n", encoding="utf-8")
+    secret = vault / "Secret/Note.md"
+    secret.parent.mkdir()
+    secret.write_text("---\npublish: true\n---\n", encoding="utf-8")
+    repo("add", "-A")
+    repo("commit", "-qm", "ignore")
+    assert pb.GitChanges.detect(vault, repo("rev-parse", "HEAD")).ignored == {"Secret/Note.md"}
+
+    scan = pb.VaultScan(make_cfg(change_source="git"), track_changes=True)
+    scan.record_build()
+    secret.write_text("---\npublish: false\nedited: in place\n---\n", encoding="utf-8")
+    assert scan.refresh()
+    assert scan.frontmatter[secret] == {"publish": False, "edited": "in place"}
+
+
+def test_a_new_scan_reparses_only_what_git_reports(pb, repo, vault, make_cfg, monkeypatch):
+    home = vault / "Home/Home.md"
+    home.write_text("---\npublish: true\ndate: 2024-03-01\n---\nWelcome\n", encoding="utf-8")
+    repo("commit", "-qam", "dated")
+    cfg = make_cfg(change_source="git")
+    pb.VaultScan(cfg).record_build()
+
+    day1 = vault / "Trips/Italy/Day1.md"
+    day1.write_text("---\npublish: false\n---\n", encoding="utf-8")
+    parsed = []
+    real = pb.parse_frontmatter_yaml
+    monkeypatch.setattr(pb, "parse_frontmatter_yaml", lambda p: parsed.append(p) or real(p))
+    scan = pb.VaultScan(cfg)
+    assert parsed == [day1]
+    monkeypatch.setattr(pb, "parse_frontmatter_yaml", real)
+    assert scan.frontmatter == pb.VaultScan(make_cfg()).frontmatter
+    assert scan.frontmatter[home]["date"] == pb.date(2024, 3, 1)
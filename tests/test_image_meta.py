@@ -0,0 +1,89 @@
+import json
+import struct
+import zlib
+from pathlib import Path
+
+import pytest
+
+
+def _png(w, h):
+    ihdr = struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)
+    chunk = struct.pack(">I", len(ihdr)) + b"IHDR" + ihdr + struct.pack(">I", zlib.crc32(b"IHDR" + ihdr))
+    return b"\x89PNG\r\n\x1a\n" + chunk
+
+
+def test_header_only_sizes(pb, write):
+    assert pb.read_image_meta(write("a.png", _png(640, 480))) == {"w": 640, "h": 480}
+    assert pb.read_image_meta(write("a.gif", b"GIF89a" + struct.pack("<HH", 12, 34) + b"\0" * 8)) == {"w": 12, "h": 34}
+    assert pb.read_image_meta(write("a.txt", b"not an image")) is None
+    assert pb.read_image_meta(write("short.png", b"\x89PNG\r\n\x1a\n")) is None
+
+
+def test_jpeg_exif_orientation_time_and_gps(pb, tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    exif = Image.Exif()
+    exif[0x0112] = 6                                     # rotated 90 degrees: w/h swap
+    exif[0x0132] = "2024:10:01 09:30:00"
+    gps = exif.get_ifd(0x8825)
+    gps.update({1: "N", 2: (41.0, 54.0, 0.0), 3: "E", 4: (12.0, 30.0, 0.0)})
+    p = tmp_path / "x.jpg"
+    Image.new("RGB", (40, 20)).save(p, exif=exif)
+    meta = pb.read_image_meta(p)
+    assert (meta["w"], meta["h"], meta["orientation"]) == (20, 40, 6)
+    assert meta["taken"] == "2024-10-01T09:30:00"
+    assert meta["gps"] == pytest.approx([41.9, 12.5])
+
+
+def test_cache_reuses_stamps_and_content_hashes(pb, tmp_path, write, monkeypatch):
+    a, b = write("v/a.png", _png(1, 2)), write("v/b.png", _png(3, 4))
+    path = tmp_path / "cache.json"
+    cache = pb.ImageMetaCache(path)
+    assert cache.get(a) == {"w": 1, "h": 2} and cache.get(b) == {"w": 3, "h": 4}
+    cache.save()
+
+    monkeypatch.setattr(pb, "read_image_meta", lambda p: pytest.fail("re-read an unchanged image"))
+    cache = pb.ImageMetaCache(path)
+    assert cache.get(a) == {"w": 1, "h": 2}
+    # same bytes under another name: found by content hash, still not opened
+    assert cache.get(write("v/copy.png", _png(1, 2))) == {"w": 1, "h": 2}
+
+
+def test_sidecar_maps_published_paths(pb, make_cfg, vault, tmp_path):
+    (vault / "Home/pic.png").write_bytes(_png(800, 600))
+    pb.apply_plan(pb.build_plan(make_cfg(image_meta={"enabled": True})))
+    data = json.loads((tmp_path / "publish/content/_media/meta.json").read_text(encoding="utf-8"))
+    assert data["images"]["content/Home/pic.png"] == {"w": 800, "h": 600}
+
+
+def test_save_forgets_only_sources_that_are_gone(pb, tmp_path, write):
+    a, b = write("v/a.png", _png(1, 2)), write("v/b.png", _png(3, 4))
+    path = tmp_path / "cache.json"
+    cache = pb.ImageMetaCache(path)
+    cache.get(a), cache.get(b)
+    cache.save()
+    cache = pb.ImageMetaCache(path)
+    cache.get(a)
+    cache.save()                                        # b belongs to another target: kept
+    assert set(json.loads(path.read_text())["stamps"]) == {str(a), str(b)}
+
+    b.unlink()
+    pb.ImageMetaCache(path).save()
+    data = json.loads(path.read_text())
+    assert list(data["stamps"]) == [str(a)]
+    assert list(data["by_hash"]) == [data["stamps"][str(a)][2]]
+
+
+def test_targets_sharing_the_cache_do_not_rehash(pb, run_build, vault, tmp_path, monkeypatch):
+    (vault / "Home/pic.png").write_bytes(_png(800, 600))
+    (vault / "Drafts/draft.png").write_bytes(_png(30, 20))
+    targets = [{"name": "public", "publish": str(tmp_path / "public")},
+               {"name": "drafts", "publish": str(tmp_path / "drafts"), "select": {"publish": False}}]
+    run_build(targets=targets, image_meta={"enabled": True})
+
+    hashed = []
+    real = pb._sha256_file
+    monkeypatch.setattr(pb, "_sha256_file", lambda p: (Path(p).is_relative_to(vault) and hashed.append(p)) or real(p))
+    run_build(targets=targets, image_meta={"enabled": True})
+    assert hashed == []
+    data = json.loads((tmp_path / "drafts/content/_media/meta.json").read_text(encoding="utf-8"))
+    assert data["images"] == {"content/Drafts/draft.png": {"w": 30, "h": 20}}
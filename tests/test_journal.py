@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def cfg(make_cfg):
+    return make_cfg(changeset_file=".publish-changes.json", jobs=1)
+
+
+def _interrupt_media_copies(pb, monkeypatch):
+    real = pb._copy_file
+
+    def copy(src, dst, *args, **kw):
+        if "/content/" in dst.as_posix():
+            raise OSError("disk went away")
+        return real(src, dst, *args, **kw)
+    monkeypatch.setattr(pb, "_copy_file", copy)
+    return real
+
+
+def _changes(tmp_path):
+    return json.loads((tmp_path / "publish/.publish-changes.json").read_text())["changes"]
+
+
+def test_completed_build_removes_its_journal(pb, cfg, tmp_path):
+    pb.apply_plan(pb.build_plan(cfg))
+    assert not (tmp_path / "publish" / pb.JOURNAL_NAME).exists()
+    assert (tmp_path / "publish/content/Home/Home.md").is_file()
+
+
+def test_resume_skips_landed_files_and_reports_like_one_build(pb, cfg, tmp_path, monkeypatch):
+    real = _interrupt_media_copies(pb, monkeypatch)
+    with pytest.raises(OSError):
+        pb.apply_plan(pb.build_plan(cfg))
+    journal = tmp_path / "publish" / pb.JOURNAL_NAME
+    assert journal.is_file()
+    assert not (tmp_path / "publish/.publish-changes.json").exists()   # prune/finish never ran
+
+    monkeypatch.setattr(pb, "_copy_file", real)
+    rendered = []
+    real_render = pb.render_note_file
+    monkeypatch.setattr(pb, "render_note_file", lambda src, *a, **kw: rendered.append(src.name) or real_render(src, *a, **kw))
+    keep_paths, _ = pb.apply_plan(pb.build_plan(cfg), resume=True)
+    # Home.md landed before the interruption (Day1.md may have, too: writes are queued)
+    assert "Home.md" not in rendered
+    assert not journal.exists()
+
+    changes = _changes(tmp_path)
+    assert changes["deleted"] == [] and changes["modified"] == [] and changes["unchanged"] == []
+    assert set(changes["added"]) == {p.relative_to(tmp_path / "publish").as_posix() for p in keep_paths} - {
+        ".publish-changes.json"}
+
+
+def test_without_resume_an_interrupted_build_starts_over(pb, cfg, tmp_path, monkeypatch, capsys):
+    real = _interrupt_media_copies(pb, monkeypatch)
+    with pytest.raises(OSError):
+        pb.apply_plan(pb.build_plan(cfg))
+    monkeypatch.setattr(pb, "_copy_file", real)
+    pb.apply_plan(pb.build_plan(cfg))
+    assert "starting over" in capsys.readouterr().out
+
+
+def test_changed_plan_is_not_resumed(pb, cfg, make_cfg, tmp_path, monkeypatch, capsys):
+    real = _interrupt_media_copies(pb, monkeypatch)
+    with pytest.raises(OSError):
+        pb.apply_plan(pb.build_plan(cfg))
+    monkeypatch.setattr(pb, "_copy_file", real)
+    other = make_cfg(changeset_file=".publish-changes.json", jobs=1, global_contents_filter=[])
+    pb.apply_plan(pb.build_plan(other), resume=True)
+    assert "plan changed" in capsys.readouterr().out
+
+
+def test_prune_is_refused_until_every_file_op_landed(pb, cfg, tmp_path):
+    plan = pb.build_plan(cfg)
+    publish_root = tmp_path / "publish"
+    stray = publish_root / "stray.txt"
+    stray.parent.mkdir(parents=True)
+    stray.write_text("keep me until the build is whole")
+    journal = pb.BuildJournal(publish_root, pb.plan_content_digest(plan))
+    try:
+        with pytest.raises(RuntimeError, match="refusing to prune"):
+            pb._finish_plan(plan, set(), None, None, journal=journal)
+    finally:
+        journal.close()
+    assert stray.is_file()
+
+
+def test_torn_last_line_is_ignored(pb, tmp_path):
+    root = tmp_path / "publish"
+    j = pb.BuildJournal(root, "digest")
+    j.checkpoint("assets", {"publish.css": "added"})
+    j.close()
+    with open(root / pb.JOURNAL_NAME, "a") as f:
+        f.write('{"dst": "content/x.md", "src"')
+    j = pb.BuildJournal(root, "digest", resume=True)
+    assert j.reached("assets") and j.done == {} and j.carried() == {"publish.css": "added"}
+    j.close(complete=True)
+    assert not (root / pb.JOURNAL_NAME).exists()
+
+
+def test_builder_builds_are_journaled_and_resumable(pb, cfg, tmp_path, monkeypatch):
+    real = _interrupt_media_copies(pb, monkeypatch)
+    with pytest.raises(OSError):
+        pb.Builder(cfg).build()
+    journal = tmp_path / "publish" / pb.JOURNAL_NAME
+    assert journal.is_file()
+
+    monkeypatch.setattr(pb, "_copy_file", real)
+    rendered = []
+    real_render = pb.render_note_file
+    monkeypatch.setattr(pb, "render_note_file", lambda src, *a, **kw: rendered.append(src.name) or real_render(src, *a, **kw))
+    result = pb.Builder(cfg).build(resume=True)
+    assert "Home.md" not in rendered
+    assert not journal.exists() and pb.JOURNAL_NAME not in result.files
+    assert set(_changes(tmp_path)["added"]) == set(result.files) - {".publish-changes.json"}
@@ -0,0 +1,54 @@
+import itertools
+
+NOTE_MAP = {"trips/italy/day1": "Stories/Italy/Day1", "trips/italy/day2": "Stories/Italy/Day2",
+            "home/home": "Home/Home", "day1": "Day1"}
+STEM_MAP = {"day2": "Stories/Italy/Day2", "home": "Home/Home"}
+MEDIA_EXTS = {".png", ".jpg"}
+MEDIA_MAP = {"trips/italy/rome.jpg": "Trips/Italy/rome.jpg", "home/pic.png": "Home/pic.png"}
+MEDIA_REF_MAP = {"Trips/Italy": {"rome.jpg": "Trips/Italy/rome.jpg", "trips/italy/rome.jpg": "Trips/Italy/rome.jpg"},
+                 "Home": {"pic.png": "Home/pic.png"}, "": {"pic.png": "Other/pic.png"}}
+
+NOTES = ["Trips/Italy/Day1", "Trips/Italy/Day2", "Trips/France/Day1", "Home/Home", "Day1"]
+TARGETS = ["Day1", "Day2", "Home", "day2", "Missing", "./Day2", "../Italy/Day1", "Italy/Day2",
+           "/Home/Home", "rome.jpg", "./rome.jpg", "../Italy/rome.jpg", "Trips/Italy/rome.jpg",
+           "pic.png", "../Home/pic.png", "..\\Home\\pic.png", ".hidden", "Day1.md"]
+
+
+def _memo(pb, maxsize=1 << 16):
+    return pb.LinkMemo(NOTE_MAP, STEM_MAP, MEDIA_EXTS, MEDIA_MAP, MEDIA_REF_MAP, maxsize=maxsize)
+
+
+def test_memo_answers_like_direct_resolution(pb):
+    memo = _memo(pb)
+    for _ in range(2):  # second pass is served from the memo
+        for note, target in itertools.product(NOTES, TARGETS):
+            assert memo.note(target, note) == pb._resolve_note_newpath(target, note, NOTE_MAP, STEM_MAP, MEDIA_EXTS)
+            refs = MEDIA_REF_MAP.get(note.rpartition("/")[0], {})
+            assert memo.media(target, note) == pb._media_newrel(target, note, MEDIA_MAP, refs)
+    lookups = 2 * len(NOTES) * len(TARGETS)
+    assert memo.hits["note"] + memo.misses["note"] == lookups
+    assert memo.hits["note"] >= lookups // 2
+    assert "memo hits" in memo.report()
+
+
+def test_bare_targets_share_one_entry_across_folders(pb):
+    memo = _memo(pb)
+    for note in NOTES:
+        memo.note("Home", note)
+        memo.note("./Day2", note)
+    assert memo.misses["note"] == 1 + len({n.rpartition("/")[0] for n in NOTES})
+
+
+def test_bare_media_names_resolve_per_folder(pb):
+    memo = _memo(pb)
+    assert memo.media("pic.png", "Home/Home") == "Home/pic.png"
+    assert memo.media("pic.png", "Day1") == "Other/pic.png"
+    assert memo.media("pic.png", "Trips/Italy/Day1") is None
+
+
+def test_memo_starts_over_at_maxsize(pb):
+    memo = _memo(pb, maxsize=4)
+    for target in TARGETS:
+        memo.media(target, NOTES[0])
+        assert len(memo._media) <= 4
+    assert memo.media("rome.jpg", NOTES[0]) == "Trips/Italy/rome.jpg"
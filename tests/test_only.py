@@ -0,0 +1,62 @@
+import pytest
+
+
+def test_only_matches_from_the_right(pb):
+    assert pb.only_matches("Trips/Italy/Day1.md", ["Day1.md"])
+    assert pb.only_matches("Trips/Italy/Day1.md", ["Trips/*/*.md"])
+    assert not pb.only_matches("Trips/Italy/Day1.md", ["Italy.md"])
+
+
+def test_narrow_plan_keeps_matching_notes_and_their_media(pb, make_cfg):
+    plan = pb.build_plan(make_cfg())
+    part = pb.narrow_plan(plan, ["Day1.md"])
+    assert part["only"] == ["Day1.md"]
+    assert part["notes"] == ["Trips/Italy/Day1.md"]
+    assert sorted(op["dst"] for op in part["ops"]) == [
+        "content/Stories/Italy/Day1.md", "content/Trips/Italy/rome.jpg"]
+    assert part["deletes"] == []
+    # the maps stay global, so links to notes outside the selection still resolve
+    assert part["note_map"] == plan["note_map"]
+
+
+def test_only_without_a_match_is_a_usage_error(pb, make_cfg):
+    plan = pb.build_plan(make_cfg())
+    with pytest.raises(SystemExit, match="no selected note matches"):
+        pb.narrow_plan(plan, ["Nope.md"])
+
+
+def test_partial_build_leaves_the_change_set_alone(pb, make_cfg, tmp_path, capsys):
+    cfg = make_cfg(changeset_file=".publish-changes.json")
+    pb.apply_plan(pb.build_plan(cfg))
+    changes_file = tmp_path / "publish/.publish-changes.json"
+    before = changes_file.read_bytes()
+
+    plan = pb.build_plan(cfg, only=["Day1.md"])
+    keep_paths, changes = pb.apply_plan(plan)
+    pb.print_build_summary(plan, keep_paths, changes)
+    assert "Changes:" not in capsys.readouterr().out
+    assert changes_file.read_bytes() == before
+
+
+def test_partial_output_matches_the_full_build(run_build, vault, tmp_path, snapshot):
+    run_build()
+    full = snapshot(tmp_path / "publish")
+    (tmp_path / "publish/content/Stories/Italy/Day1.md").unlink()
+    (vault / "Home/Home.md").write_text("---\npublish: true\n---\nedited\n", encoding="utf-8")
+    run_build("--only", "Day1.md")
+    after = snapshot(tmp_path / "publish")
+    assert after["content/Stories/Italy/Day1.md"] == full["content/Stories/Italy/Day1.md"]
+    assert after["content/Home/Home.md"] == full["content/Home/Home.md"]   # not selected: untouched
+
+
+def test_bare_media_names_resolve_from_each_note(run_build, write, tmp_path, snapshot):
+    for folder in ("A", "B"):
+        write(f"vault/{folder}/{folder}.md", "---\npublish: true\n---\n![[pic.png]]\n")
+        write(f"vault/{folder}/pic.png", f"\x89PNG{folder}".encode())
+    run_build()
+    full = snapshot(tmp_path / "publish")
+    assert b"![[content/A/pic.png]]" in full["content/A/A.md"]
+    assert b"![[content/B/pic.png]]" in full["content/B/B.md"]
+    (tmp_path / "publish/content/A/A.md").unlink()
+    run_build("--only", "A.md")
+    assert snapshot(tmp_path / "publish") == full
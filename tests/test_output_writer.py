@@ -0,0 +1,61 @@
+import pytest
+
+
+def _writer(pb, root, **kw):
+    return pb.OutputWriter(root, **{"writers": 2, "queue_size": 2, **kw})
+
+
+def _put(path, text):
+    path.write_text(text, encoding="utf-8")
+    return "added"
+
+
+def test_writes_land_by_flush_and_report_back(pb, tmp_path):
+    landed = []
+    w = _writer(pb, tmp_path, dirs=[tmp_path / "a/b"], on_written=lambda dst, status: landed.append((dst, status)))
+    assert (tmp_path / "a/b").is_dir()
+    for i in range(20):
+        dst = tmp_path / f"c/d/{i}.md"
+        assert w.submit(dst, _put, dst, str(i)) == "queued"
+    w.close()
+    assert sorted(landed) == sorted((tmp_path / f"c/d/{i}.md", "added") for i in range(20))
+    assert all((tmp_path / f"c/d/{i}.md").read_text(encoding="utf-8") == str(i) for i in range(20))
+    assert {str(tmp_path / "c"), str(tmp_path / "c/d")} <= w.dirs
+
+
+def test_destinations_outside_the_root_are_refused_lexically(pb, tmp_path):
+    w = _writer(pb, tmp_path / "pub")
+    try:
+        assert w.check("x/../y.md") == str(tmp_path / "pub/y.md")
+        with pytest.raises(RuntimeError, match="Refusing to modify outside publish_root"):
+            w.submit(tmp_path / "pub/../elsewhere.md", _put, tmp_path / "elsewhere.md", "x")
+        with pytest.raises(RuntimeError):
+            w.check(tmp_path / "pubx/y.md")
+    finally:
+        w.close()
+    assert not (tmp_path / "elsewhere.md").exists()
+
+
+def test_first_write_error_surfaces_and_stops_later_writes(pb, tmp_path):
+    def _fail():
+        raise OSError("disk full")
+
+    w = _writer(pb, tmp_path, writers=1)
+    w.submit(tmp_path / "bad.md", _fail)
+    w.submit(tmp_path / "late.md", _put, tmp_path / "late.md", "late")
+    with pytest.raises(OSError, match="disk full"):
+        w.close()
+    assert not (tmp_path / "late.md").exists()
+
+
+def test_unknown_fsync_policy_is_rejected(pb, tmp_path):
+    with pytest.raises(ValueError, match="fsync policy"):
+        pb.OutputWriter(tmp_path, fsync="sometimes")
+
+
+def test_fsync_all_still_builds_the_same_tree(pb, make_cfg, tmp_path, snapshot):
+    pb.apply_plan(pb.build_plan(make_cfg()))
+    ref = snapshot(tmp_path / "publish")
+    pb.apply_plan(pb.build_plan(make_cfg(publish=str(tmp_path / "synced"),
+                                         output={"writers": 3, "queue_size": 1, "fsync": "all"})))
+    assert snapshot(tmp_path / "synced") == ref
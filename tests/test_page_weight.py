@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+
+def _pw(**over):
+    return {"page_weight": {"enabled": True, "file": "weight.json", **over}}
+
+
+def test_report_counts_note_and_media_bytes(pb, make_cfg, vault):
+    report = pb.page_weight_report(pb.build_plan(make_cfg(**_pw())))
+    pages = {p["note"]: p for p in report["pages"]}
+    assert set(pages) == {"Home/Home.md", "Trips/Italy/Day1.md"}
+    day = pages["Trips/Italy/Day1.md"]
+    jpg = (vault / "Trips/Italy/rome.jpg").stat().st_size
+    assert day["assets"] == 1 and day["asset_bytes"] == jpg
+    assert day["bytes"] == (vault / "Trips/Italy/Day1.md").stat().st_size + jpg
+    assert day["by_kind"] == {"image": jpg}
+    assert [p["bytes"] for p in report["pages"]] == sorted((p["bytes"] for p in report["pages"]), reverse=True)
+
+
+def test_budgets_warn_or_fail(pb, make_cfg):
+    plan = pb.build_plan(make_cfg(**_pw(budgets={"assets_per_page": 0, "page_bytes": 10})))
+    assert {o["budget"] for o in pb.page_weight_report(plan)["over_budget"]} == {"page_bytes"}
+    plan = pb.build_plan(make_cfg(**_pw(budgets={"page_bytes": 10}, budget_action="fail")))
+    with pytest.raises(pb.PageWeightBudgetExceeded):
+        pb.page_weight_stage(plan, dry=True)
+
+
+def test_report_file_goes_under_the_publish_root(pb, make_cfg, tmp_path):
+    plan = pb.build_plan(make_cfg(**_pw()))
+    assert "weight.json" in plan["keep"]
+    pb.page_weight_stage(plan)
+    assert json.loads((tmp_path / "publish/weight.json").read_text())["pages"]
+
+
+def test_cli_page_weight_prints_the_table(run_build, capsys):
+    run_build("--page-weight", "--dry-run")
+    out = capsys.readouterr().out
+    assert "Trips/Italy/Day1.md" in out and "Home/Home.md" in out
+
+
+def test_archive_builds_write_the_report_next_to_the_archive(pb, make_cfg, tmp_path):
+    plan = pb.build_plan(make_cfg(archive=str(tmp_path / "dist/site.zip"), **_pw()))
+    pb.page_weight_stage(plan)
+    assert (tmp_path / "dist/weight.json").is_file()
+    assert not (tmp_path / "publish").exists()
+
+
+def test_partial_builds_do_not_write_the_report(pb, make_cfg, tmp_path):
+    plan = pb.build_plan(make_cfg(**_pw()), only=["Day1.md"])
+    pb.page_weight_stage(plan)
+    assert not (tmp_path / "publish/weight.json").exists()
@@ -0,0 +1,41 @@
+import json
+import sys
+
+import pytest
+
+
+def test_plan_round_trips_through_json(pb, make_cfg, tmp_path):
+    plan = pb.build_plan(make_cfg())
+    pb.save_plan(plan, tmp_path / "plans/plan.json")
+    loaded = pb.load_plan(tmp_path / "plans/plan.json")
+    assert loaded == json.loads(json.dumps(plan, default=str))
+    assert loaded["version"] == pb.PLAN_VERSION
+
+
+def test_load_plan_rejects_other_versions(pb, make_cfg, tmp_path):
+    plan = pb.build_plan(make_cfg())
+    pb.save_plan({**plan, "version": -1}, tmp_path / "plan.json")
+    with pytest.raises(RuntimeError, match="Unsupported build plan version"):
+        pb.load_plan(tmp_path / "plan.json")
+
+
+def test_applying_a_saved_plan_matches_a_direct_build(pb, make_cfg, tmp_path, snapshot):
+    pb.apply_plan(pb.build_plan(make_cfg()))
+    direct = snapshot(tmp_path / "publish")
+
+    pb.save_plan(pb.build_plan(make_cfg(publish=str(tmp_path / "planned"))), tmp_path / "plan.json")
+    pb.apply_plan(pb.load_plan(tmp_path / "plan.json"))
+    assert snapshot(tmp_path / "planned") == direct
+    assert "content/Stories/Italy/Day1.md" in direct
+    assert not any("raft" in rel for rel in direct)
+
+
+def test_dry_run_plan_out_then_apply_plan(run_build, monkeypatch, pb, tmp_path, snapshot):
+    run_build()
+    direct = snapshot(tmp_path / "publish")
+
+    run_build("--dry-run", "--plan-out", str(tmp_path / "plan.json"), publish=str(tmp_path / "cli"))
+    assert not (tmp_path / "cli/content").exists()
+    monkeypatch.setattr(sys, "argv", ["publish.build.py", "--apply-plan", str(tmp_path / "plan.json")])
+    pb.main()
+    assert snapshot(tmp_path / "cli") == direct
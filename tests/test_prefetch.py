@@ -0,0 +1,36 @@
+import json
+
+
+def test_reading_order_is_folders_first_and_natural(pb):
+    paths = ["content/b.md", "content/Day10.md", "content/day2.md", "content/A/z.md", "content/a2/x.md",
+             "content/A10/y.md", "content/Day1.md"]
+    assert sorted(paths, key=pb.reading_order_key) == [
+        "content/A/z.md", "content/a2/x.md", "content/A10/y.md",
+        "content/b.md", "content/Day1.md", "content/day2.md", "content/Day10.md"]
+
+
+def test_prefetch_map_links_neighbours_and_hero_images(pb, make_cfg, write):
+    write("vault/Trips/Italy/Day2.md", "---\npublish: true\n---\nno pictures, just [[Day1]]\n")
+    write("vault/Trips/Italy/Day10.md", "---\npublish: true\n---\n[[Day1]] ![[notes.pdf]] ![[map.png]]\n")
+    write("vault/Trips/Italy/notes.pdf", b"%PDF")
+    write("vault/Trips/Italy/map.png", b"\x89PNGmap")
+    nav = pb.prefetch_map(pb.build_plan(make_cfg()))
+    order = ["content/Home/Home", "content/Stories/Italy/Day1", "content/Stories/Italy/Day2",
+             "content/Stories/Italy/Day10"]
+    assert list(nav) == order
+    assert [(nav[s]["prev"], nav[s]["next"]) for s in order] == list(zip([None] + order[:-1], order[1:] + [None]))
+    assert nav["content/Home/Home"]["hero"] == "content/Home/pic.png"
+    assert nav["content/Stories/Italy/Day2"]["hero"] is None
+    assert nav["content/Stories/Italy/Day10"]["hero"] == "content/Trips/Italy/map.png"
+
+
+def test_prefetch_file_is_opt_in_and_kept(pb, make_cfg, tmp_path):
+    pb.apply_plan(pb.build_plan(make_cfg()))
+    assert not (tmp_path / "publish/content/_nav").exists()
+
+    keep_paths, _ = pb.apply_plan(pb.build_plan(make_cfg(prefetch={"enabled": True})))
+    path = tmp_path / "publish/content/_nav/prefetch.json"
+    assert path in keep_paths
+    data = json.loads(path.read_text(encoding="utf-8"))
+    assert data["version"] == pb.PREFETCH_VERSION and data["md_root_dir"] == "content"
+    assert data["notes"]["content/Stories/Italy/Day1"]["prev"] == "content/Home/Home"
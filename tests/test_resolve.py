@@ -0,0 +1,45 @@
+def _many_notes(write, n):
+    for i in range(n):
+        links = " ".join(f"[[N{(i * 7 + k) % n}]]" for k in range(3))
+        write(f"vault/Notes/{i % 5}/N{i}.md",
+              f"---\npublish: true\n---\n{links} ![[img{i % 4}.png]] [[Missing{i}]] ![x](../../Home/pic.png)\n")
+    for k in range(4):
+        write(f"vault/Notes/{k}/img{k}.png", b"\x89PNG" + bytes([k]))
+
+
+def test_parallel_resolution_matches_serial(pb, make_cfg, write, monkeypatch, capsys):
+    _many_notes(write, 40)
+    monkeypatch.setattr(pb, "RESOLVE_PARALLEL_MIN", 8)
+    cfg = make_cfg()
+    serial_scan = pb.VaultScan(cfg)
+    notes = sorted(serial_scan.md_files)
+    serial = serial_scan.resolve_all(notes, jobs=1)
+    serial_log = capsys.readouterr().out
+
+    parallel_scan = pb.VaultScan(cfg)
+    parallel = parallel_scan.resolve_all(notes, jobs=3)
+    assert parallel == serial
+    assert parallel_scan._refs == serial_scan._refs
+    assert capsys.readouterr().out == serial_log
+    assert any(hit.name == "img1.png" for refs in serial for _, hit, _ in refs)
+
+
+def test_cached_notes_are_not_resolved_again(pb, make_cfg, write, monkeypatch):
+    _many_notes(write, 10)
+    scan = pb.VaultScan(make_cfg())
+    notes = sorted(scan.md_files)
+    first = scan.resolve_all(notes, jobs=1)
+    monkeypatch.setattr(pb, "resolve_note_refs", lambda *a, **k: (_ for _ in ()).throw(AssertionError("re-resolved")))
+    assert scan.resolve_all(notes, jobs=4) == first
+
+
+def test_parallel_plan_matches_serial_plan(pb, make_cfg, write, monkeypatch):
+    _many_notes(write, 40)
+    monkeypatch.setattr(pb, "RESOLVE_PARALLEL_MIN", 8)
+    serial = pb.build_plan(make_cfg(jobs=1))
+    parallel = pb.build_plan(make_cfg(jobs=3))
+    assert parallel.pop("config")["jobs"] == 3
+    for key in ("config", "created"):
+        serial.pop(key)
+    parallel.pop("created")
+    assert parallel == serial
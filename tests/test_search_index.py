@@ -0,0 +1,83 @@
+import json
+
+
+def _index(pb, **scfg):
+    return pb.SearchIndex("content", scfg)
+
+
+def _decode(payload):
+    """{term: {slug: tf}} from the delta-encoded postings."""
+    slugs = [d[0] for d in payload["docs"]]
+    out = {}
+    for term, arr in payload["postings"].items():
+        doc, hits = 0, {}
+        for i in range(0, len(arr), 2):
+            doc += arr[i]
+            hits[slugs[doc]] = arr[i + 1]
+        out[term] = hits
+    return out
+
+
+def test_postings_are_delta_encoded_in_slug_order(pb):
+    idx = _index(pb, title_boost=1)
+    idx.add_text("content/c", "rome rome")
+    idx.add_text("content/a", "rome madrid")
+    idx.add_text("content/b", "madrid")
+    payload = idx.to_dict()
+    assert [d[0] for d in payload["docs"]] == ["content/a", "content/b", "content/c"]
+    # ids 0 and 2 -> deltas 0, 2
+    assert payload["postings"]["rome"] == [0, 1, 2, 2]
+    assert payload["postings"]["madrid"] == [0, 1, 1, 1]
+    assert _decode(payload)["rome"] == {"content/a": 1, "content/c": 2}
+
+
+def test_title_from_frontmatter_is_boosted(pb):
+    idx = _index(pb, title_boost=3)
+    idx.add_text("content/x", "---\ntitle: Roman Holiday\n---\nbody text")
+    payload = idx.to_dict()
+    assert payload["docs"][0][1] == "Roman Holiday"
+    assert _decode(payload)["roman"] == {"content/x": 3}
+    assert "title" not in payload["postings"]
+
+
+def test_links_tags_urls_and_entities_are_not_indexed(pb):
+    idx = _index(pb)
+    idx.add_text("content/x", 'See [[Trips/Rome Day|the forum]] and <span class="q">hi</span>'
+                              " at https://example.com/path &nbsp; &amp; &#160; &#xA0; done")
+    terms = set(idx.to_dict()["postings"])
+    assert {"forum", "hi", "done"} <= terms
+    assert not terms & {"trips", "span", "class", "example", "nbsp", "amp", "160", "xa0"}
+
+
+def test_static_blocks_are_not_indexed(pb):
+    fm = {"date": "2024-10-01", "date_modified": "2024-10-02", "lat": 41.9, "lng": 12.5, "address": "Rome, Italy"}
+    blocks = pb.render_static_blocks(fm, {"dates": True, "maps": True})
+    assert blocks.count("data-publish-static") == 2
+    idx = _index(pb)
+    idx.add_text("content/x", f"---\npublish: true\n---\n{blocks}\n\nThe colosseum\n")
+    assert set(idx.to_dict()["postings"]) == {"the", "colosseum"}
+
+
+def test_add_file_matches_add_text(pb, tmp_path):
+    text = "---\ntitle: Big\n---\n" + "".join(f"line {i} word{i % 7}\n" for i in range(5000))
+    p = tmp_path / "big.md"
+    p.write_text(text, encoding="utf-8")
+    a, b = _index(pb), _index(pb)
+    a.add_text("content/big", text)
+    b.add_file("content/big", p)
+    assert a.to_dict() == b.to_dict()
+
+
+def test_stopwords_and_length_limits(pb):
+    idx = _index(pb, stopwords=["The"], min_token_len=3, max_token_len=5)
+    idx.add_text("content/x", "the ox walks quickly")
+    assert set(idx.to_dict()["postings"]) == {"walks"}
+
+
+def test_index_covers_published_text_only(pb, make_cfg, tmp_path):
+    pb.apply_plan(pb.build_plan(make_cfg(search={"enabled": True})))
+    payload = json.loads((tmp_path / "publish/content/_search/index.json").read_text(encoding="utf-8"))
+    assert {d[0] for d in payload["docs"]} == {"content/Home/Home", "content/Stories/Italy/Day1"}
+    terms = set(payload["postings"])
+    assert {"rome", "redacted", "welcome"} <= terms
+    assert not terms & {"caleb", "private", "yet"}
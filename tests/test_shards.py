@@ -0,0 +1,64 @@
+import json
+import sys
+
+import pytest
+
+
+def test_shard_of_is_stable_and_in_range(pb):
+    # sha1-based, so the same on every machine and interpreter (no PYTHONHASHSEED dependence)
+    assert pb.shard_of("content/Stories/Italy/Day1.md", 1) == 0
+    assert [pb.shard_of(f"content/n{i}.md", 4) for i in range(8)] == \
+        [pb.shard_of(f"content/n{i}.md", 4) for i in range(8)]
+    assert {pb.shard_of(f"content/n{i}.md", 4) for i in range(64)} == {0, 1, 2, 3}
+    assert pb.parse_shard("2/4") == (2, 4)
+    with pytest.raises(ValueError):
+        pb.parse_shard("4/4")
+
+
+def _run_shards(pb, plan, plan_path, shard_dir, count, only=None):
+    for i in (range(count) if only is None else only):
+        manifest = pb.apply_shard(plan, i, count)
+        pb.save_plan(manifest, pb.shard_manifest_path(shard_dir, plan_path, i, count))
+
+
+def test_sharded_apply_matches_a_full_build(pb, make_cfg, tmp_path, snapshot):
+    over = dict(changeset_file=".publish-changes.json", search={"enabled": True})
+    pb.apply_plan(pb.build_plan(make_cfg(**over)))
+    full = snapshot(tmp_path / "publish")
+
+    plan = pb.build_plan(make_cfg(publish=str(tmp_path / "sharded"), **over))
+    plan_path = tmp_path / "plan.json"
+    pb.save_plan(plan, plan_path)
+    _run_shards(pb, plan, plan_path, tmp_path / "shards", 3)
+    manifests = pb.load_shard_manifests(tmp_path / "shards", plan_path, plan)
+    _, changes = pb.merge_shards(plan, manifests)
+    sharded = snapshot(tmp_path / "sharded")
+    # the change set carries a timestamp; compare its contents instead
+    assert changes.to_dict()["changes"] == json.loads(full.pop(".publish-changes.json"))["changes"]
+    sharded.pop(".publish-changes.json")
+    assert sharded == full
+    assert any("search" in rel for rel in full)
+
+
+def test_merge_refuses_incomplete_or_stale_shards(pb, make_cfg, tmp_path):
+    plan = pb.build_plan(make_cfg())
+    plan_path = tmp_path / "plan.json"
+    _run_shards(pb, plan, plan_path, tmp_path / "shards", 2, only=[0])
+    with pytest.raises(RuntimeError, match=r"Shard\(s\) \[1\] of 2 have not completed"):
+        pb.load_shard_manifests(tmp_path / "shards", plan_path, plan)
+
+    _run_shards(pb, plan, plan_path, tmp_path / "shards", 2, only=[1])
+    other = {**plan, "ops": plan["ops"][:-1]}
+    with pytest.raises(RuntimeError, match="different plan"):
+        pb.load_shard_manifests(tmp_path / "shards", plan_path, other)
+
+
+def test_cli_shards_then_merge(pb, run_build, monkeypatch, tmp_path, snapshot):
+    run_build()
+    full = snapshot(tmp_path / "publish")
+    plan_path = tmp_path / "plan.json"
+    run_build("--dry-run", "--plan-out", str(plan_path), publish=str(tmp_path / "sharded"))
+    for step in (["--shard", "0/2"], ["--shard", "1/2"], ["--merge-shards"]):
+        monkeypatch.setattr(sys, "argv", ["publish.build.py", "--apply-plan", str(plan_path), *step])
+        pb.main()
+    assert snapshot(tmp_path / "sharded") == full
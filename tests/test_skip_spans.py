@@ -0,0 +1,66 @@
+import pytest
+
+TEXT = """see [[A]] and `[[B]]`
+```md
+![[C.png]]
+```
+%% [[D]]
+still [[E]] %% then [[F]]
+<!-- ![x](G.png) --> ![y](H.png)
+~~~~
+[[I]]
+~~~
+[[J]]
+~~~~
+``code with ` inside [[K]]`` [[L]]
+"""
+
+
+def _covered(pb, text):
+    spans, state = pb.markdown_skip_spans(text)
+    skip = pb.SkipSpans(spans)
+    return {name for name in "ABCDEFGHIJKL" if text.index(name) in skip}, state
+
+
+def test_code_and_comments_are_skipped(pb):
+    covered, state = _covered(pb, TEXT)
+    assert covered == {"B", "C", "D", "E", "G", "I", "J", "K"}
+    assert state is None
+
+
+def test_references_inside_code_and_comments_are_not_extracted(pb):
+    refs = [ref for ref, _ in pb.extract_media_refs_from_text(TEXT)]
+    assert refs == ["A", "F", "L", "H.png"]
+
+
+def test_unclosed_fence_runs_to_the_end_and_reports_state(pb):
+    text = "x\n```\n[[A]]\n"
+    spans, state = pb.markdown_skip_spans(text)
+    assert spans == [(2, len(text))]
+    assert state == ("fence", "`", 3)
+
+
+@pytest.mark.parametrize("cut", [0, 1, 2, 4, 6, 7, 9, 11, 12])
+def test_state_lets_a_caller_resume_at_any_line_start(pb, cut):
+    lines = TEXT.splitlines(keepends=True)
+    head, tail = "".join(lines[:cut]), "".join(lines[cut:])
+    whole, _ = pb.markdown_skip_spans(TEXT)
+    first, state = pb.markdown_skip_spans(head)
+    rest, _ = pb.markdown_skip_spans(tail, state)
+    joined = pb.SkipSpans(first + [(a + len(head), b + len(head)) for a, b in rest])
+    assert [i for i in range(len(TEXT)) if i in joined] == [i for i in range(len(TEXT)) if i in pb.SkipSpans(whole)]
+
+
+def test_backtick_fence_info_may_not_contain_backticks(pb):
+    spans, state = pb.markdown_skip_spans("```a`b```\n[[A]]\n")
+    assert state is None and spans == [(0, 9)]
+
+
+def test_published_code_keeps_its_links_as_written(pb, make_cfg, vault, tmp_path):
+    (vault / "Home/Home.md").write_text(
+        "---\npublish: true\n---\n[[Day1]] `[[Day1]]`\n```\n![[pic.png]] [x](../Trips/Italy/Day1.md)\n```\n",
+        encoding="utf-8")
+    pb.apply_plan(pb.build_plan(make_cfg()))
+    out = (tmp_path / "publish/content/Home/Home.md").read_text(encoding="utf-8")
+    assert out.endswith("[[Stories/Italy/Day1]] `[[Day1]]`\n```\n![[pic.png]] [x](../Trips/Italy/Day1.md)\n```\n")
+    assert not (tmp_path / "publish/content/Home/pic.png").exists()
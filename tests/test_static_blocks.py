@@ -0,0 +1,95 @@
+from datetime import date
+
+import pytest
+
+# expected values produced by js/insert-maps.js (bboxFor + osmEmbedUrl at 300x400) under node
+OSM = {
+    (41.9028, 12.4964, 12): "https://www.openstreetmap.org/export/embed.html?layer=mapnik&bbox=12.43717709585647%2C"
+                            "41.844028855363916%2C12.55562290414353%2C41.96157114463608&marker=41.9028%2C12.4964"
+                            "#map=12/41.9028/12.4964",
+    (-33.8688, 151.2093, 9): "https://www.openstreetmap.org/export/embed.html?layer=mapnik&bbox=150.73551676685176%2C"
+                             "-34.39331965499026%2C151.68308323314827%2C-33.34428034500974&marker=-33.8688%2C151.2093"
+                             "#map=9/-33.8688/151.2093",
+    (0, 0, 3): "https://www.openstreetmap.org/export/embed.html?layer=mapnik&bbox=-30.322126921487605%2C"
+               "-40.42950256198347%2C30.322126921487605%2C40.42950256198347&marker=0%2C0#map=3/0/0",
+}
+
+
+@pytest.mark.parametrize("args", OSM)
+def test_osm_embed_url_matches_the_js_client(pb, args):
+    assert pb.osm_embed_url(*args) == OSM[args]
+
+
+@pytest.mark.parametrize("tokens, banner", [
+    (["2024-03-01"], 'Friday, March&nbsp;1<sup class="ord">st</sup>,&nbsp;2024'),
+    (["2024-03-01", "2024-03-22"], 'March&nbsp;1<sup class="ord">st</sup>–22<sup class="ord">nd</sup>,&nbsp;2024'),
+    (["2024-03-30", "2024-04-02"],
+     'March&nbsp;30<sup class="ord">th</sup> – April&nbsp;2<sup class="ord">nd</sup>,&nbsp;2024'),
+    (["2023-12-30", "2024-01-02"],
+     'December&nbsp;30<sup class="ord">th</sup>,&nbsp;2023 – January&nbsp;2<sup class="ord">nd</sup>,&nbsp;2024'),
+    (["2024-03"], "March&nbsp;2024"),
+    (["2024", "2023"], '2023&nbsp;<span class="more">(＋1 more)</span>'),
+    (["2024-03-01", "2024-05", "2022"],
+     'Friday, March&nbsp;1<sup class="ord">st</sup>,&nbsp;2024&nbsp;<span class="more">(＋2 more)</span>'),
+    (["[2024-02-11]"], 'Sunday, February&nbsp;11<sup class="ord">th</sup>,&nbsp;2024'),
+    (["nope", "2024-13", "2024-02-30"], ""),
+])
+def test_format_note_dates(pb, tokens, banner):
+    assert pb.format_note_dates(tokens) == banner
+
+
+def test_date_tokens_accept_dates_lists_and_csv(pb):
+    assert pb._date_tokens([date(2024, 1, 2), "2024-03, 2025;2026"]) == ["2024-01-02", "2024-03", "2025", "2026"]
+
+
+def test_date_block_includes_the_modified_date(pb):
+    block = pb.render_date_block({"date": "2024-03-01", "date_modified": "2024-05-06T10:00"})
+    assert block.startswith('<div id="note-date-banner" data-publish-static><span class="primary-date">Friday')
+    assert block.endswith('<span class="mod-date">updated&nbsp;2024-05-06</span></div>')
+    assert pb.render_date_block({"date": "soon"}) == ""
+
+
+@pytest.mark.parametrize("fm, coords", [
+    ({"lat": 41.9, "lng": 12.5}, (41.9, 12.5)),
+    ({"location": ["41.9", "12.5"]}, (41.9, 12.5)),
+    ({"location": [141.9, 12.5]}, (12.5, 141.9)),  # (lon, lat) is swapped back
+    ({"location": "41.9, 12.5"}, (41.9, 12.5)),
+    ({"map_view_link": "[x](geo:41.9,12.5)"}, (41.9, 12.5)),
+    ({"map_link": "https://maps.apple.com/?ll=41.9,12.5"}, (41.9, 12.5)),
+    ({"map_link": "https://www.google.com/maps/place/x/@41.9,12.5,15z"}, (41.9, 12.5)),
+    ({"map_link": "https://www.openstreetmap.org/?mlat=41.9&mlon=12.5"}, (41.9, 12.5)),
+    ({"map_link": "https://www.openstreetmap.org/#map=15/41.9/12.5"}, (41.9, 12.5)),
+    ({"location": "somewhere"}, None),
+])
+def test_note_coords_sources(pb, fm, coords):
+    assert pb.note_coords(fm) == coords
+
+
+def test_map_block_escapes_the_url_and_shortens_the_address(pb):
+    block = pb.render_map_block({"lat": 41.9028, "lng": 12.4964, "address": "Piazza Navona, 00186, Rome, 00186"})
+    assert 'src="' + OSM[(41.9028, 12.4964, 12)].replace("&", "&amp;") + '"' in block
+    assert '<div class="place">Piazza Navona, Rome</div>' in block
+    assert pb.render_map_block({"map_link": "https://example.com/"}) == ""
+
+
+def test_enabled_blocks_land_below_the_frontmatter(pb, make_cfg, vault, tmp_path):
+    day1 = vault / "Trips/Italy/Day1.md"
+    day1.write_text("---\npublish: true\ndate: 2024-03-01\nlat: 41.9\nlng: 12.5\n---\n# Rome\n", encoding="utf-8")
+    pb.apply_plan(pb.build_plan(make_cfg(static_blocks={"dates": True, "maps": True})))
+    out = (tmp_path / "publish/content/Stories/Italy/Day1.md").read_text(encoding="utf-8")
+    head, _, body = out.partition("\n---\n")
+    assert body.startswith('<div id="note-date-banner" data-publish-static>')
+    assert '\n\n<div id="side-map-block" data-publish-static>' in body
+    assert body.endswith("\n\n# Rome\n")
+
+
+def test_blocks_use_only_the_published_frontmatter(pb, make_cfg, vault, tmp_path):
+    day1 = vault / "Trips/Italy/Day1.md"
+    day1.write_text("---\npublish: true\ndate: 2024-03-01\naddress: 1 Secret Lane, Rome\nlat: 41.9\nlng: 12.5\n"
+                    "---\n# Rome\n", encoding="utf-8")
+    cfg = make_cfg(static_blocks={"dates": True, "maps": True},
+                   frontmatter={"deny": ["address", "lat", "lng"], "normalize": {"date": "date"}})
+    pb.apply_plan(pb.build_plan(cfg))
+    out = (tmp_path / "publish/content/Stories/Italy/Day1.md").read_text(encoding="utf-8")
+    assert "Secret" not in out and "41.9" not in out and "side-map-block" not in out
+    assert 'id="note-date-banner"' in out
@@ -0,0 +1,97 @@
+import io
+import random
+import re
+
+import pytest
+
+MAPS = dict(current_rel_noext="Trips/Day1", map_note_relnoext_to_new_noext={"trips/day1": "S/Day1", "foo": "Foo"},
+            map_by_unique_stem={"day1": "S/Day1", "foo": "Foo"}, MEDIA_EXTS={".png"},
+            media_map_by_rel={"trips/img.png": "T/img.png"}, media_ref_to_newrel={"img.png": "T/img.png"})
+ALPHABET = ["a", "b", "x", " ", "\n", "\n\n", "[", "]", "[[", "]]", "![[", "(", ")", "](", "!", "|", "#",
+            "Day1", "img.png", "foo.md", "CALEB", "\r\n", "é", "`", "```\n", "<!--", "-->"]
+BOUNDED = [
+    [("CALEB", "[r]")],
+    [(r"^x", "X", re.M)],
+    [(r"x$", "E")],
+    [(r"\bfoo\b", "F"), (r"(?<=a)b", "B")],
+    [(r"a.*?b", r"<\g<0>>")],
+    [(r"x(?=\n)", "N")],
+    [(r"\s{1,3}", "_")],
+    [(r"a|", "-")],
+    [(r"(a)(b)?", r"\2\1")],
+    [(r"\Aa", "START")],
+    [(r"[^\n]*x", "L")],
+]
+
+
+def _compile(spec):
+    return [(re.compile(f[0], f[2] if len(f) > 2 else 0), f[1]) for f in spec]
+
+
+def _replacers(pb):
+    wl = pb.wikilink_replacer(MAPS["current_rel_noext"], MAPS["map_note_relnoext_to_new_noext"],
+                              MAPS["map_by_unique_stem"], MAPS["MEDIA_EXTS"], MAPS["media_map_by_rel"],
+                              MAPS["media_ref_to_newrel"], "content")
+    md = pb.md_link_replacer(MAPS["current_rel_noext"], MAPS["map_note_relnoext_to_new_noext"],
+                             MAPS["map_by_unique_stem"], "content", MAPS["MEDIA_EXTS"],
+                             MAPS["media_map_by_rel"], MAPS["media_ref_to_newrel"])
+    return wl, md
+
+
+def _in_memory(pb, text, regs):
+    wl, md = _replacers(pb)
+    t = pb.apply_text_filters(text, regs)
+    t = pb.WIKILINK_ALL.sub(pb.skipping(wl, pb.SkipSpans(pb.markdown_skip_spans(t)[0])), t)
+    return pb.MD_LINK.sub(pb.skipping(md, pb.SkipSpans(pb.markdown_skip_spans(t)[0])), t)
+
+
+def _streamed(pb, path, regs, chunk):
+    wl, md = _replacers(pb)
+    out = io.StringIO()
+    pb.render_note_streaming(path, out, regs, wl, md, chunk_chars=chunk)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("spec", BOUNDED, ids=lambda s: s[0][0])
+def test_streamed_output_equals_in_memory(pb, tmp_path, spec):
+    regs = _compile(spec)
+    assert pb.streaming_supported(regs) == []
+    rnd = random.Random(spec[0][0])
+    p = tmp_path / "n.md"
+    for _ in range(150):
+        p.write_text("".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 200))), encoding="utf-8", newline="")
+        ref = _in_memory(pb, pb.read_text(p), regs)
+        for chunk in (1, 2, 7, 64):
+            assert _streamed(pb, p, regs, chunk) == ref
+
+
+def test_spans_moved_through_the_wikilink_pass_match_a_rescan(pb):
+    wl, md = _replacers(pb)
+    rnd = random.Random(7)
+    rescans = 0
+    for _ in range(5000):
+        text = "".join(rnd.choice(ALPHABET) for _ in range(rnd.randint(0, 200)))
+        t, skip = pb.sub_skipping(pb.WIKILINK_ALL, wl, text, pb.SkipSpans(pb.markdown_skip_spans(text)[0]))
+        rescan = pb.SkipSpans(pb.markdown_skip_spans(t)[0])
+        if skip is None:
+            rescans += 1
+            skip = rescan
+        assert [i for i in range(len(t)) if i in skip] == [i for i in range(len(t)) if i in rescan]
+        assert pb.sub_skipping(pb.MD_LINK, md, t, skip)[0] == _in_memory(pb, text, [])
+    assert rescans < 5000
+
+
+@pytest.mark.parametrize("pattern", [r"x*\n.*y", r"(?s)a.*b", r"a(?=.*\n)"])
+def test_unbounded_filters_force_the_in_memory_path(pb, pattern):
+    assert pb.streaming_supported(_compile([(pattern, "-")])) == [0]
+
+
+def test_large_notes_stream_to_the_same_published_file(run_build, vault, tmp_path):
+    big = vault / "Trips/Italy/Day1.md"
+    big.write_text(big.read_text(encoding="utf-8") + "".join(f"line {i} [[Home]] CALEB-PRIVATE\n" for i in range(3000)),
+                   encoding="utf-8")
+    run_build()
+    ref = (tmp_path / "publish/content/Stories/Italy/Day1.md").read_bytes()
+    run_build(publish=str(tmp_path / "streamed"), stream_threshold_bytes=1024, stream_chunk_chars=4096)
+    assert (tmp_path / "streamed/content/Stories/Italy/Day1.md").read_bytes() == ref
+    assert b"CALEB" not in ref
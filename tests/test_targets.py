@@ -0,0 +1,51 @@
+import pytest
+
+
+def _targets(tmp_path):
+    return [{"name": "public", "publish": str(tmp_path / "public")},
+            {"name": "drafts", "publish": str(tmp_path / "drafts"), "select": {"publish": False}}]
+
+
+def test_each_target_gets_its_own_config(make_cfg, pb, tmp_path):
+    cfg = make_cfg(targets=_targets(tmp_path))
+    public, drafts = pb.target_configs(cfg)
+    assert (public["target"], drafts["target"]) == ("public", "drafts")
+    assert public["select"] == {"publish": True} and drafts["select"] == {"publish": False}
+    assert "targets" not in public
+    assert [t["target"] for t in pb.target_configs(cfg, only=["drafts"])] == ["drafts"]
+    with pytest.raises(ValueError, match="unknown target"):
+        pb.target_configs(cfg, only=["nope"])
+
+
+def test_targets_cannot_override_scan_keys_or_nest(pb, make_cfg, tmp_path):
+    with pytest.raises(ValueError, match="cannot override vault"):
+        make_cfg(targets=[{"publish": str(tmp_path / "a"), "vault": str(tmp_path)}])
+    with pytest.raises(ValueError, match="duplicate target name"):
+        make_cfg(targets=[{"publish": str(tmp_path / "a")}, {"publish": str(tmp_path / "x/a")}])
+    cfg = make_cfg(targets=[{"name": "a", "publish": str(tmp_path / "a")},
+                            {"name": "b", "publish": str(tmp_path / "a/b")}])
+    with pytest.raises(ValueError, match="publishes inside target"):
+        pb.target_configs(cfg)
+
+
+def test_targets_from_one_scan_match_separate_builds(pb, make_cfg, tmp_path, snapshot):
+    cfg = make_cfg(targets=_targets(tmp_path))
+    tcfgs = pb.target_configs(cfg)
+    scan = pb.VaultScan(tcfgs[0])
+    for tcfg in tcfgs:
+        pb.apply_plan(pb.build_plan(tcfg, scan=scan))
+    shared = {t["target"]: snapshot(tmp_path / t["target"]) for t in tcfgs}
+    assert "content/Stories/Italy/Day1.md" in shared["public"]
+    assert "content/Drafts/Draft.md" in shared["drafts"]
+    assert not any("Day1" in rel for rel in shared["drafts"])
+
+    for tcfg in tcfgs:
+        alone = {**tcfg, "publish": str(tmp_path / "alone" / tcfg["target"])}
+        pb.apply_plan(pb.build_plan(alone))
+        assert snapshot(tmp_path / "alone" / tcfg["target"]) == shared[tcfg["target"]]
+
+
+def test_cli_target_flag_builds_only_the_named_target(run_build, tmp_path):
+    run_build("--target", "drafts", targets=_targets(tmp_path))
+    assert (tmp_path / "drafts/content/Drafts/Draft.md").is_file()
+    assert not (tmp_path / "public").exists()
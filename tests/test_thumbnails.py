@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def images(tmp_path):
+    out = {}
+    for name, size in (("wide.jpg", (800, 400)), ("tall.png", (300, 900))):
+        p = tmp_path / "vault" / name
+        p.parent.mkdir(parents=True, exist_ok=True)
+        Image.new("RGB", size, (200, 30, 30)).save(p)
+        out[p] = f"Media/{name}"
+    return out
+
+
+def _build(pb, tmp_path, images, **tcfg):
+    keep = pb.build_thumbnails(tmp_path / "publish", "content", images, {"max_px": 64, **tcfg})
+    return keep, json.loads((tmp_path / "publish/content/_thumbs/thumbs.json").read_text())
+
+
+def test_thumbnails_fit_max_px_and_are_mapped(pb, tmp_path, images):
+    keep, payload = _build(pb, tmp_path, images)
+    assert set(payload["thumbs"]) == {"content/Media/wide.jpg", "content/Media/tall.png"}
+    for rel in payload["thumbs"].values():
+        with Image.open(tmp_path / "publish" / rel) as im:
+            assert max(im.size) == 64
+    assert tmp_path / "publish/content/_thumbs/thumbs.json" in keep
+
+
+def test_every_encoding_parameter_is_in_the_name(pb, tmp_path, images):
+    _, a = _build(pb, tmp_path, images, quality=72)
+    _, b = _build(pb, tmp_path, images, quality=40)
+    _, c = _build(pb, tmp_path, images, quality=40, format="webp")
+    _, d = _build(pb, tmp_path, images, quality=40, format="webp", max_px=32)
+    names = [set(x["thumbs"].values()) for x in (a, b, c, d)]
+    assert all(not (names[i] & names[j]) for i in range(4) for j in range(i + 1, 4))
+    assert all(n.endswith("-64-q40.webp") for n in names[2])
+
+
+def test_unchanged_sources_are_not_rehashed(pb, tmp_path, images, monkeypatch):
+    _, first = _build(pb, tmp_path, images)
+    hashed = []
+    real = pb._sha256_file
+    monkeypatch.setattr(pb, "_sha256_file", lambda p: (p in images and hashed.append(p)) or real(p))
+    _, second = _build(pb, tmp_path, images)
+    assert hashed == []
+    assert second["thumbs"] == first["thumbs"]
+
+    src = next(p for p in images if p.name == "wide.jpg")
+    Image.new("RGB", (800, 400), (0, 0, 255)).save(src)
+    _, third = _build(pb, tmp_path, images)
+    assert hashed == [src]
+    assert third["thumbs"]["content/Media/wide.jpg"] != first["thumbs"]["content/Media/wide.jpg"]
+    assert third["thumbs"]["content/Media/tall.png"] == first["thumbs"]["content/Media/tall.png"]
+
+
+def test_thumbnails_survive_prune(run_build, write, tmp_path):
+    Image.new("RGB", (500, 500), (0, 90, 0)).save(write("vault/Home/green.png", b""))
+    (tmp_path / "vault/Home/Home.md").write_text("---\npublish: true\n---\n![[green.png]]\n", encoding="utf-8")
+    run_build(thumbnails={"enabled": True, "max_px": 48, "jobs": 1})
+    payload = json.loads((tmp_path / "publish/content/_thumbs/thumbs.json").read_text())
+    thumb = tmp_path / "publish" / payload["thumbs"]["content/Home/green.png"]
+    run_build(thumbnails={"enabled": True, "max_px": 48, "jobs": 1})
+    assert thumb.is_file()
@@ -0,0 +1,98 @@
+import os
+import time
+
+
+def _index(pb, root):
+    idx = pb.VaultIndex(root, include_hidden=False)
+    idx.refresh()
+    return idx
+
+
+def test_vault_index_is_opt_in(pb):
+    assert pb.CFG_DEFAULTS["vault_index"] == ""
+
+
+def test_snapshot_location(pb, tmp_path):
+    auto = pb.vault_index_path({"vault": str(tmp_path), "vault_index": "auto"})
+    assert auto.parent == tmp_path / "cache/publish-build" and auto.suffix == ".idx"
+    assert pb.vault_index_path({"vault": str(tmp_path), "vault_index": str(tmp_path / "v.idx")}) == tmp_path / "v.idx"
+    assert pb.vault_index_path({"vault": str(tmp_path), "vault_index": ""}) is None
+
+
+def test_snapshot_round_trip(pb, tmp_path, write):
+    write("vault/a.md", "x")
+    write("vault/Trips/Day 1.md", "y")
+    write("vault/Trips/img.png", b"\x89PNG")
+    write("vault/.hidden/skip.md", "z")
+    root = tmp_path / "vault"
+    idx = _index(pb, root)
+    snap = tmp_path / "v.idx"
+    idx.save(snap)
+
+    loaded = pb.VaultIndex.load(snap, root, include_hidden=False)
+    assert sorted(loaded.dirs) == ["", "Trips"]
+    assert loaded.files_in("Trips") == idx.files_in("Trips")
+    assert sorted(loaded.md_files()) == sorted(idx.md_files()) == [root / "Trips/Day 1.md", root / "a.md"]
+
+
+def test_snapshot_rejects_other_vault_or_hidden_mode(pb, tmp_path, write):
+    write("vault/a.md")
+    write("other/b.md")
+    snap = tmp_path / "v.idx"
+    _index(pb, tmp_path / "vault").save(snap)
+    assert pb.VaultIndex.load(snap, tmp_path / "other", include_hidden=False).dirs == {}
+    assert pb.VaultIndex.load(snap, tmp_path / "vault", include_hidden=True).dirs == {}
+
+
+def test_truncated_snapshot_falls_back_to_walk(pb, tmp_path, write):
+    write("vault/a.md")
+    snap = tmp_path / "v.idx"
+    _index(pb, tmp_path / "vault").save(snap)
+    snap.write_bytes(snap.read_bytes()[:-3])
+    assert pb.VaultIndex.load(snap, tmp_path / "vault", include_hidden=False).dirs == {}
+
+
+def test_refresh_reuses_settled_dirs_and_relists_racy_ones(pb, tmp_path, write):
+    write("vault/a.md")
+    write("vault/sub/b.md")
+    root = tmp_path / "vault"
+    old = time.time_ns() - 60 * 10**9
+    for d in (root, root / "sub"):
+        os.utime(d, ns=(old, old))
+    idx = _index(pb, root)
+    snap = tmp_path / "v.idx"
+    idx.save(snap)
+
+    settled = pb.VaultIndex.load(snap, root, include_hidden=False)
+    assert settled.refresh() is False
+    assert settled.relisted == 0
+
+    # a directory touched within the racy window is listed again even though its mtime is unchanged
+    now = time.time_ns()
+    os.utime(root / "sub", ns=(now, now))
+    idx = _index(pb, root)
+    idx.save(snap)
+    racy = pb.VaultIndex.load(snap, root, include_hidden=False)
+    racy.refresh()
+    assert racy.relisted == 1
+
+
+def test_refresh_sees_new_file(pb, tmp_path, write):
+    write("vault/a.md")
+    root = tmp_path / "vault"
+    idx = _index(pb, root)
+    write("vault/new.md")
+    later = time.time_ns() + 10**9
+    os.utime(root, ns=(later, later))
+    assert idx.refresh() is True
+    assert root / "new.md" in idx.md_files()
+
+
+def test_builds_from_the_snapshot_match_a_walk(pb, make_cfg, tmp_path):
+    walked = pb.build_plan(make_cfg(vault_index=""))
+    snap = tmp_path / "v.idx"
+    cold = pb.build_plan(make_cfg(vault_index=str(snap)))
+    assert snap.is_file()
+    warm = pb.build_plan(make_cfg(vault_index=str(snap)))
+    for plan in (cold, warm):
+        assert plan["ops"] == walked["ops"] and plan["notes"] == walked["notes"]